@@ -0,0 +1,126 @@
+"""Measure gateway cache hit throughput as the number of in-flight requests grows.
+
+Usage (from the repository root)::
+
+    python benchmarks/response_cache_concurrency.py [--requests 4000]
+
+A trivial ``/bench/hit`` route is mounted on the aggregation app and primed,
+then batches of concurrent GETs are replayed through the full middleware stack
+over an in-process ASGI transport. A second pass keeps slow cache misses in
+flight at the same time to check that hits never queue behind them, and a
+last pass measures the overhead on uncacheable (``no-store``) responses.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import main  # noqa: E402
+
+CONCURRENCY_LEVELS = (1, 4, 16, 64, 256)
+
+
+@main.app.get("/bench/hit")
+def _bench_hit():
+    return {"products": [{"id": index, "name": f"Whey {index}"} for index in range(40)]}
+
+
+@main.app.get("/bench/no-store")
+def _bench_no_store():
+    payload = {"products": [{"id": index, "name": f"Whey {index}"} for index in range(40)]}
+    return JSONResponse(payload, headers={"Cache-Control": "no-store"})
+
+
+@main.app.get("/bench/miss")
+async def _bench_miss(n: int = 0):
+    await asyncio.sleep(0.05)
+    return {"n": n}
+
+
+async def _worker(
+    client: httpx.AsyncClient,
+    path: str,
+    count: int,
+    latencies: List[float],
+    expected: Tuple[Optional[str], ...] = ("HIT", "STALE"),
+) -> None:
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        assert response.headers.get("x-cache") in expected, response.headers
+
+
+async def _run_level(
+    client: httpx.AsyncClient,
+    concurrency: int,
+    total: int,
+    *,
+    with_misses: bool = False,
+    path: str = "/bench/hit",
+    expected: Tuple[Optional[str], ...] = ("HIT", "STALE"),
+) -> None:
+    per_worker = max(total // concurrency, 1)
+    latencies: List[float] = []
+    miss_tasks: List[asyncio.Task] = []
+    if with_misses:
+        miss_tasks = [
+            asyncio.create_task(client.get("/bench/miss", params={"n": f"{concurrency}-{index}"}))
+            for index in range(concurrency)
+        ]
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _worker(client, path, per_worker, latencies, expected)
+            for _ in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    if miss_tasks:
+        await asyncio.gather(*miss_tasks)
+
+    latencies.sort()
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    print(
+        f"{concurrency:>6} {len(latencies) / elapsed:>12.0f} "
+        f"{statistics.median(latencies) * 1000:>10.2f} {p99 * 1000:>10.2f}"
+    )
+
+
+async def _main(total: int) -> None:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/bench/hit")
+        for with_misses in (False, True):
+            label = "hits + slow misses in flight" if with_misses else "hits only"
+            print(f"\n{label}")
+            print(f"{'inflight':>6} {'hits/s':>12} {'p50 ms':>10} {'p99 ms':>10}")
+            for concurrency in CONCURRENCY_LEVELS:
+                await _run_level(client, concurrency, total, with_misses=with_misses)
+        print("\nuncacheable pass-through (Cache-Control: no-store)")
+        print(f"{'inflight':>6} {'req/s':>12} {'p50 ms':>10} {'p99 ms':>10}")
+        for concurrency in CONCURRENCY_LEVELS:
+            await _run_level(
+                client, concurrency, total, path="/bench/no-store", expected=("MISS", None)
+            )
+        print("\ncache stats:", main._response_cache.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=4000)
+    args = parser.parse_args()
+    asyncio.run(_main(args.requests))
@@ -0,0 +1,148 @@
+"""Compare raw and projected SerpAPI payloads: stored size, parse time, output.
+
+Usage (from the repository root)::
+
+    python benchmarks/serpapi_projection.py [--cache data/local_cache.sqlite3] [--rounds 50]
+
+Every ``serpapi:*`` entry of the local cache database (or of a legacy
+``local_cache.json`` file, when ``--cache`` points to one) is measured as
+persisted before projection (full SerpAPI response) and after
+``services.serpapi_projection``: JSON size, ``json.loads`` time and the time
+the projection itself takes. The deals built by ``collect_serp_deals`` from
+both versions are compared to check that no consumed field was dropped.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import main  # noqa: E402
+from services.local_cache import CACHE_PATH  # noqa: E402
+from services.serpapi_projection import (  # noqa: E402
+    project_product_payload,
+    project_shopping_payload,
+)
+
+
+def _best_of(rounds: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def _deals_for(query: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def shopping(q: str, hl: str = "fr", gl: str = "fr") -> Dict[str, Any]:
+        return payload
+
+    async def no_offers(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return {}
+
+    main.serpapi_shopping = shopping
+    main.fetch_serpapi_product_offers_bulk = no_offers
+    main.serpapi_product_offers = no_offers
+    return asyncio.run(main.collect_serp_deals(query, limit=100))
+
+
+def _entries(path: Path) -> List[Tuple[str, Dict[str, Any]]]:
+    if path.suffix == ".json":
+        return _legacy_entries(path)
+    if not path.exists():
+        return []
+    # Read-only: the benchmark must not purge expired rows like LocalCache does.
+    db = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = db.execute(
+            "SELECT key, value FROM entries WHERE key LIKE 'serpapi:%' ORDER BY key"
+        ).fetchall()
+    finally:
+        db.close()
+    entries = []
+    for key, raw in rows:
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            entries.append((key, value))
+    return entries
+
+
+def _legacy_entries(path: Path) -> List[Tuple[str, Dict[str, Any]]]:
+    with path.open("r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    entries = []
+    for key, record in data.items():
+        if not key.startswith("serpapi:"):
+            continue
+        value = record.get("value") if isinstance(record, dict) else None
+        if isinstance(value, dict):
+            entries.append((key, value))
+    return entries
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache", type=Path, default=CACHE_PATH)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    entries = _entries(args.cache)
+    if not entries:
+        print(f"No serpapi:* entries in {args.cache}")
+        return
+
+    print(
+        f"{'entry':<58} {'raw KB':>8} {'proj KB':>8} {'ratio':>6} "
+        f"{'parse raw':>10} {'parse proj':>10} {'project':>8} {'deals':>6}"
+    )
+    totals = [0, 0, 0.0, 0.0, 0.0]
+    for key, payload in entries:
+        project = project_product_payload if key.startswith("serpapi:product:") else project_shopping_payload
+        projected = project(payload)
+        raw_text = json.dumps(payload, ensure_ascii=False)
+        projected_text = json.dumps(projected, ensure_ascii=False)
+
+        parse_raw = _best_of(args.rounds, lambda: json.loads(raw_text))
+        parse_projected = _best_of(args.rounds, lambda: json.loads(projected_text))
+        projection = _best_of(args.rounds, lambda: project(payload))
+
+        deals_match = "-"
+        if key.startswith("serpapi:shopping:"):
+            query = key.split(":", 4)[4]
+            deals_match = "same" if _deals_for(query, payload) == _deals_for(query, projected) else "DIFF"
+
+        raw_size = len(raw_text.encode("utf-8"))
+        projected_size = len(projected_text.encode("utf-8"))
+        totals[0] += raw_size
+        totals[1] += projected_size
+        totals[2] += parse_raw
+        totals[3] += parse_projected
+        totals[4] += projection
+        print(
+            f"{key[:58]:<58} {raw_size / 1024:>8.1f} {projected_size / 1024:>8.1f} "
+            f"{projected_size / raw_size:>6.1%} {parse_raw * 1000:>8.2f}ms "
+            f"{parse_projected * 1000:>8.2f}ms {projection * 1000:>6.2f}ms {deals_match:>6}"
+        )
+
+    print(
+        f"{'total':<58} {totals[0] / 1024:>8.1f} {totals[1] / 1024:>8.1f} "
+        f"{totals[1] / totals[0]:>6.1%} {totals[2] * 1000:>8.2f}ms "
+        f"{totals[3] * 1000:>8.2f}ms {totals[4] * 1000:>6.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main_cli()
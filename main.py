@@ -1,40 +1,48 @@
 import asyncio
-import hashlib
-import time
+from copy import deepcopy
 from datetime import datetime, timedelta
 
+import hmac
 import html
+import itertools
 import json
 import os, re
 from math import atan2, cos, radians, sin, sqrt
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, TypedDict, Union
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple, Union
 from urllib.parse import parse_qs, quote, urlparse
 
 import httpx
-import requests
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from starlette.requests import Request
 from starlette.responses import Response
 
 from fallback_catalogue import get_fallback_product, get_fallback_products
+from services.catalogue_snapshot import CatalogueSnapshotStore
+from services.circuit_breaker import CircuitOpenError
+from services.deadlines import DeadlineExceeded, DeadlineMiddleware, no_deadline, within_deadline
 from services.gyms_scraper import get_partner_gyms
-from services.product_compare import compare_product
+from services.http_clients import upstream_clients
+from services.product_compare import SCRAPERAPI_ENDPOINT, SCRAPERAPI_KEY, compare_product
 from services.local_cache import local_cache
+from services.negative_cache import NegativeCache
+from services.search_index import SearchIndex, fold_text, query_terms
+from services.serp_product_cache import SerpProductCache
+from services.serpapi_budget import prefetch_priority, serpapi_budget
+from services.serpapi_projection import project_product_payload, project_shopping_payload
+from services.similarity import ProductFeatures, SimilarityIndex, extract_features, similarity_score, tokenize_keywords
+from services.response_cache import (
+    CachePolicy,
+    ResponseCache,
+    ResponseCacheMiddleware,
+    SharedResponseStore,
+    SingleFlight,
+    mark_degraded,
+    mark_upstream_failure,
+)
 
 app = FastAPI()
-app.add_middleware(GZipMiddleware, minimum_size=500)
-
-# --- CORS (ok pour dev; en prod restreins à ton domaine) ---
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # --- SerpAPI ---
 SERPAPI_KEY = os.getenv(
@@ -44,6 +52,75 @@ SERPAPI_KEY = os.getenv(
 SERPAPI_BASE = "https://serpapi.com/search.json"
 SCRAPER_BASE_URL = os.getenv("SCRAPER_BASE_URL", "http://localhost:8001")
 
+# Pooled keep-alive clients (HTTP/2 when ``h2`` is installed), opened at startup.
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "50"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Time budget (seconds) of each /search source; a late source returns what it has so far.
+SEARCH_PRODUCTS_BUDGET_SECONDS = float(os.getenv("SEARCH_PRODUCTS_BUDGET_SECONDS", "4"))
+SEARCH_GYMS_BUDGET_SECONDS = float(os.getenv("SEARCH_GYMS_BUDGET_SECONDS", "2"))
+SEARCH_PROGRAMMES_BUDGET_SECONDS = float(os.getenv("SEARCH_PROGRAMMES_BUDGET_SECONDS", "1"))
+# Background rebuild period of the /products catalogue snapshot (0 disables it).
+CATALOGUE_SNAPSHOT_REFRESH_SECONDS = float(os.getenv("CATALOGUE_SNAPSHOT_REFRESH_SECONDS", "300"))
+CATALOGUE_SNAPSHOT_CONCURRENCY = max(1, int(os.getenv("CATALOGUE_SNAPSHOT_CONCURRENCY", "8")))
+# SerpAPI product data kept for fallbacks, similar products and lookups.
+SERP_PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv("SERP_PRODUCT_CACHE_MAX_ENTRIES", "2000"))
+SERP_PRODUCT_CACHE_MAX_BYTES = int(os.getenv("SERP_PRODUCT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SERP_PRODUCT_CACHE_TTL_SECONDS = float(os.getenv("SERP_PRODUCT_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+# Neighbours kept per product by the catalogue similarity index (>= the
+# largest ``limit`` accepted by /products/{id}/similar and /related).
+SIMILARITY_TOP_K = max(int(os.getenv("SIMILARITY_TOP_K", "12")), 12)
+# Product ids per POST /products/offers:batch call to the scraper service.
+SCRAPER_BATCH_SIZE = 100
+# Maximum concurrent google_product lookups issued by one bulk prefetch.
+SERPAPI_MAX_CONCURRENCY = max(1, int(os.getenv("SERPAPI_MAX_CONCURRENCY", "8")))
+# Rate, quotas and priorities of SerpAPI calls are configured in
+# services/serpapi_budget.py (SERPAPI_RATE_PER_SECOND, SERPAPI_DAILY_QUOTA...).
+SERPAPI_LEDGER_FLUSH_SECONDS = float(os.getenv("SERPAPI_LEDGER_FLUSH_SECONDS", "60"))
+# Failed SerpAPI lookups are not retried before a backoff window that
+# doubles per consecutive failure, from BASE up to MAX seconds (jittered).
+SERPAPI_FAILURE_BACKOFF_BASE_SECONDS = float(os.getenv("SERPAPI_FAILURE_BACKOFF_BASE_SECONDS", "30"))
+SERPAPI_FAILURE_BACKOFF_MAX_SECONDS = float(os.getenv("SERPAPI_FAILURE_BACKOFF_MAX_SECONDS", str(15 * 60)))
+# Circuit breakers of the upstreams: consecutive failures before opening
+# (0 disables), seconds before a trial request, and health probe period.
+UPSTREAM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_FAILURE_THRESHOLD", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30"))
+UPSTREAM_HEALTH_PROBE_SECONDS = float(os.getenv("UPSTREAM_HEALTH_PROBE_SECONDS", "10"))
+# Time budget of a request, shared by all its upstream calls (seconds).
+# Routes may set their own below; the X-Request-Timeout header overrides
+# both, up to REQUEST_DEADLINE_MAX_SECONDS.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "15"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "60"))
+upstream_clients.register(
+    "scraper",
+    base_url=SCRAPER_BASE_URL.rstrip("/"),
+    timeout=10.0,
+    connect_timeout=3.0,
+    max_connections=UPSTREAM_MAX_CONNECTIONS,
+    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    failure_threshold=UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=UPSTREAM_BREAKER_RESET_SECONDS,
+    probe_url="/health",
+)
+upstream_clients.register(
+    "serpapi",
+    timeout=30.0,
+    max_connections=UPSTREAM_MAX_CONNECTIONS,
+    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    failure_threshold=UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=UPSTREAM_BREAKER_RESET_SECONDS,
+    # The account endpoint is free: it does not count against the quota.
+    probe_url=f"https://serpapi.com/account.json?api_key={SERPAPI_KEY}" if SERPAPI_KEY else None,
+)
+upstream_clients.register(
+    "scraperapi",
+    timeout=30.0,
+    max_connections=UPSTREAM_MAX_CONNECTIONS,
+    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    failure_threshold=UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=UPSTREAM_BREAKER_RESET_SECONDS,
+    probe_url=f"{SCRAPERAPI_ENDPOINT}/account?api_key={SCRAPERAPI_KEY}" if SCRAPERAPI_KEY else None,
+)
+
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 PROGRAMMES_PATH = DATA_DIR / "programmes.json"
@@ -75,127 +152,311 @@ PRICE_HISTORY_PERIODS = {
 }
 
 API_CACHE_TTL_SECONDS = int(os.getenv("API_CACHE_TTL_SECONDS", "120"))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "2048"))
+API_CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+API_CACHE_SWEEP_INTERVAL_SECONDS = int(os.getenv("API_CACHE_SWEEP_INTERVAL_SECONDS", "60"))
+API_CACHE_COALESCE_TIMEOUT_SECONDS = float(os.getenv("API_CACHE_COALESCE_TIMEOUT_SECONDS", "45"))
+API_CACHE_STALE_SECONDS = int(os.getenv("API_CACHE_STALE_SECONDS", "600"))
+API_CACHE_STALE_IF_ERROR_SECONDS = int(os.getenv("API_CACHE_STALE_IF_ERROR_SECONDS", "3600"))
+API_CACHE_COMPRESS_MIN_BYTES = int(os.getenv("API_CACHE_COMPRESS_MIN_BYTES", "500"))
+# Optional Redis tier shared by every worker (responses and SerpAPI payloads).
+API_CACHE_REDIS_URL = os.getenv("API_CACHE_REDIS_URL", "").strip()
+# Shared secret for POST /cache/purge; the endpoint is disabled when empty.
+API_CACHE_PURGE_TOKEN = os.getenv("API_CACHE_PURGE_TOKEN", "").strip()
+
+
+def _route_policy(
+    soft: int,
+    hard: int,
+    *,
+    vary: Tuple[str, ...] = (),
+    fold: Optional[Dict[str, Callable[[str], str]]] = None,
+    multi: Tuple[str, ...] = (),
+    defaults: Optional[Dict[str, str]] = None,
+    tags: Tuple[str, ...] = (),
+    tag_params: Optional[Dict[str, str]] = None,
+    path_tags: Optional[Pattern[str]] = None,
+) -> CachePolicy:
+    return CachePolicy(
+        soft=soft,
+        hard=hard,
+        vary=frozenset(vary),
+        fold=fold or {},
+        multi=frozenset(multi),
+        defaults=defaults or {},
+        tags=frozenset(tags),
+        tag_params=tag_params or {},
+        path_tags=path_tags,
+    )
+
+
+# Tags: ``catalogue`` for anything built from the scraper catalogue,
+# ``product:<id>`` and ``query:<text>`` for the inputs of a response. A
+# scraper refresh purges ``catalogue``; a single product update purges its tag.
+CATALOGUE_CACHE_TAG = "catalogue"
+# Origin of the purges published when the catalogue snapshot changes.
+CATALOGUE_PURGE_ORIGIN = "catalogue-snapshot"
+_PRODUCT_PATH_TAGS = re.compile(r"^/products/(?P<product>[^/]+)/")
+
+
+def _strip_lower(value: str) -> str:
+    """Normalisation de ``_normalize_filter`` et du filtre ``query`` de /gyms."""
+
+    return value.strip().lower()
+
+
+# Soft TTL: served as HIT. Until the hard TTL: served as STALE while a
+# background refresh runs. ``vary`` must list every query parameter the
+# handler reads; anything else (tracking params...) is left out of the key.
+# ``fold`` repeats the normalisation the handler applies to a parameter
+# (never a looser one: ``brands`` is matched unstripped, and /compare and
+# /api/gyms echo their inputs in the response).
+# Ordered, first matching path pattern wins.
+CACHE_ROUTE_POLICIES: List[Tuple[Pattern[str], CachePolicy]] = [
+    (
+        re.compile(r"^/products$"),
+        _route_policy(
+            120,
+            1800,
+            vary=(
+                "search", "page", "per_page", "min_price", "max_price",
+                "brands", "min_rating", "in_stock", "category", "sort",
+            ),
+            fold={"search": str.strip, "brands": str.lower, "category": str.lower},
+            multi=("brands",),
+            defaults={"page": "1", "per_page": "24", "sort": "price_asc"},
+            tags=(CATALOGUE_CACHE_TAG,),
+            tag_params={"search": "query"},
+        ),
+    ),
+    (
+        re.compile(r"^/products/[^/]+/offers$"),
+        _route_policy(
+            300,
+            3600,
+            vary=("limit",),
+            defaults={"limit": "10"},
+            tags=(CATALOGUE_CACHE_TAG,),
+            path_tags=_PRODUCT_PATH_TAGS,
+        ),
+    ),
+    (
+        re.compile(r"^/products/[^/]+/price-history$"),
+        _route_policy(
+            900,
+            6 * 3600,
+            vary=("period",),
+            defaults={"period": "3m"},
+            path_tags=_PRODUCT_PATH_TAGS,
+        ),
+    ),
+    (
+        re.compile(r"^/products/[^/]+/(similar|related)$"),
+        _route_policy(
+            600,
+            6 * 3600,
+            vary=("limit",),
+            defaults={"limit": "4"},
+            tags=(CATALOGUE_CACHE_TAG,),
+            path_tags=_PRODUCT_PATH_TAGS,
+        ),
+    ),
+    (
+        re.compile(r"^/products/[^/]+/reviews$"),
+        _route_policy(600, 6 * 3600, path_tags=_PRODUCT_PATH_TAGS),
+    ),
+    (
+        re.compile(r"^/compare$"),
+        _route_policy(
+            300,
+            3600,
+            vary=(
+                "q", "marque", "categorie", "nom", "limit",
+                "brand", "image", "img", "url", "legacy",
+            ),
+            fold={"q": str.strip},
+            defaults={"q": "whey protein", "limit": "12", "legacy": "false"},
+            tag_params={"q": "query"},
+        ),
+    ),
+    (
+        re.compile(r"^/comparison$"),
+        _route_policy(
+            300,
+            3600,
+            vary=("ids", "limit"),
+            defaults={"limit": "10"},
+            tags=(CATALOGUE_CACHE_TAG,),
+            tag_params={"ids": "product"},
+        ),
+    ),
+    (
+        re.compile(r"^/search$"),
+        _route_policy(
+            120,
+            1800,
+            vary=("q", "limit", "nom", "categorie", "marque"),
+            fold={"q": str.strip, "nom": str.strip, "categorie": _strip_lower, "marque": _strip_lower},
+            defaults={"q": "", "limit": "10"},
+            tags=(CATALOGUE_CACHE_TAG,),
+            tag_params={"q": "query"},
+        ),
+    ),
+    (re.compile(r"^/programmes$"), _route_policy(3600, 12 * 3600)),
+    (
+        re.compile(r"^/gyms$"),
+        _route_policy(
+            3600,
+            12 * 3600,
+            vary=("query", "limit"),
+            fold={"query": _strip_lower},
+            defaults={"query": "", "limit": "20"},
+        ),
+    ),
+    (
+        re.compile(r"^/api/gyms$"),
+        _route_policy(
+            3600,
+            12 * 3600,
+            vary=("city", "max_distance_km", "lat", "lng", "limit"),
+            fold={"city": str.strip},
+            defaults={"limit": "12"},
+        ),
+    ),
+    (re.compile(r"^/cache/"), CachePolicy(soft=0, hard=0, cacheable=False)),
+]
+DEFAULT_CACHE_POLICY = CachePolicy(
+    soft=API_CACHE_TTL_SECONDS,
+    hard=API_CACHE_TTL_SECONDS + API_CACHE_STALE_SECONDS,
+)
 
+_response_cache = ResponseCache(
+    max_entries=API_CACHE_MAX_ENTRIES,
+    max_bytes=API_CACHE_MAX_BYTES,
+)
+_inflight_requests = SingleFlight()
+_shared_response_store = SharedResponseStore.from_url(API_CACHE_REDIS_URL)
+_cache_sweeper_task: Optional["asyncio.Task[None]"] = None
+_cache_purge_listener_task: Optional["asyncio.Task[None]"] = None
+_serp_cache_sweeper_task: Optional["asyncio.Task[None]"] = None
 
-class _CacheEntry(TypedDict):
-    body: bytes
-    etag: str
-    expires_at: float
-    headers: Dict[str, str]
-    media_type: Optional[str]
-    status_code: int
 
+@app.on_event("startup")
+async def _open_upstream_clients() -> None:
+    await upstream_clients.start()
 
-_response_cache: Dict[str, _CacheEntry] = {}
-_cache_lock: Optional[asyncio.Lock] = None
 
+@app.on_event("shutdown")
+async def _close_upstream_clients() -> None:
+    await upstream_clients.aclose()
 
-async def _get_cache_lock() -> asyncio.Lock:
-    global _cache_lock
-    if _cache_lock is None:
-        _cache_lock = asyncio.Lock()
-    return _cache_lock
 
+@app.on_event("startup")
+async def _start_cache_sweeper() -> None:
+    global _cache_sweeper_task, _cache_purge_listener_task, _serp_cache_sweeper_task
+    if _cache_sweeper_task is None and API_CACHE_SWEEP_INTERVAL_SECONDS > 0:
+        _cache_sweeper_task = asyncio.create_task(
+            _response_cache.run_sweeper(API_CACHE_SWEEP_INTERVAL_SECONDS)
+        )
+    if _serp_cache_sweeper_task is None and API_CACHE_SWEEP_INTERVAL_SECONDS > 0:
+        _serp_cache_sweeper_task = asyncio.create_task(
+            SERP_PRODUCT_CACHE.run_sweeper(API_CACHE_SWEEP_INTERVAL_SECONDS)
+        )
+    if _cache_purge_listener_task is None and _shared_response_store is not None:
+        # Purges made by other workers drop the local copies too.
+        _cache_purge_listener_task = asyncio.create_task(
+            _shared_response_store.listen_for_purges(_apply_remote_purge)
+        )
 
-def _cache_key_from_request(request: Request) -> str:
-    if request.query_params:
-        return f"{request.url.path}?{request.query_params}".lower()
-    return request.url.path.lower()
 
+@app.on_event("shutdown")
+async def _stop_cache_sweeper() -> None:
+    global _cache_sweeper_task, _cache_purge_listener_task, _serp_cache_sweeper_task
+    if _cache_sweeper_task is not None:
+        _cache_sweeper_task.cancel()
+        _cache_sweeper_task = None
+    if _serp_cache_sweeper_task is not None:
+        _serp_cache_sweeper_task.cancel()
+        _serp_cache_sweeper_task = None
+    if _cache_purge_listener_task is not None:
+        _cache_purge_listener_task.cancel()
+        _cache_purge_listener_task = None
+    if _shared_response_store is not None:
+        await _shared_response_store.close()
 
-def _filter_cache_headers(headers: Dict[str, str]) -> Dict[str, str]:
-    excluded = {"content-length", "date", "server", "x-cache"}
-    filtered: Dict[str, str] = {}
-    for name, value in headers.items():
-        if name.lower() in excluded:
-            continue
-        filtered[name] = value
-    return filtered
 
+def _apply_remote_purge(tags: List[str], origin: str = "") -> None:
+    _response_cache.purge_tags(tags)
+    # A purge caused by a new snapshot must not rebuild the snapshot again.
+    if origin != CATALOGUE_PURGE_ORIGIN:
+        _refresh_catalogue_for_tags(tags)
 
-def _build_etag(payload: bytes) -> str:
-    digest = hashlib.sha256(payload).hexdigest()
-    return f'W/"{digest}"'
 
+async def purge_cached_responses(tags: List[str], *, origin: str = "") -> Dict[str, int]:
+    """Drop every cached response tagged with one of ``tags`` on all tiers."""
 
-def _is_cacheable_response(response: Response) -> bool:
-    cache_control = response.headers.get("Cache-Control", "")
-    if "no-store" in cache_control.lower():
-        return False
-    return response.status_code == 200
-
-
-@app.middleware("http")
-async def simple_cache_middleware(request: Request, call_next):
-    if request.method not in {"GET", "HEAD"}:
-        return await call_next(request)
-
-    cache_key = _cache_key_from_request(request)
-    lock = await _get_cache_lock()
-    now = time.time()
-
-    async with lock:
-        cached = _response_cache.get(cache_key)
-        if cached and cached["expires_at"] > now:
-            etag = cached["etag"]
-            if etag and request.headers.get("if-none-match") == etag:
-                not_modified = Response(status_code=304)
-                not_modified.headers["ETag"] = etag
-                not_modified.headers["X-Cache"] = "HIT"
-                return not_modified
-
-            hit = Response(
-                content=cached["body"],
-                status_code=cached["status_code"],
-                media_type=cached["media_type"],
-            )
-            for name, value in cached["headers"].items():
-                hit.headers[name] = value
-            hit.headers["X-Cache"] = "HIT"
-            return hit
-        if cached:
-            _response_cache.pop(cache_key, None)
-
-    response = await call_next(request)
-    response_body = b"".join([chunk async for chunk in response.body_iterator])
-    etag = _build_etag(response_body)
-    headers = _filter_cache_headers(dict(response.headers))
-    headers["ETag"] = etag
-    headers.setdefault("Vary", "Accept-Encoding")
-    background = response.background
-
-    entry: _CacheEntry = {
-        "body": response_body,
-        "etag": etag,
-        "expires_at": now + max(API_CACHE_TTL_SECONDS, 0),
-        "headers": headers,
-        "media_type": response.media_type,
-        "status_code": response.status_code,
-    }
+    purged = {"local": _response_cache.purge_tags(tags), "shared": 0}
+    if _shared_response_store is not None:
+        purged["shared"] = await _shared_response_store.purge_tags(tags, origin=origin)
+    return purged
 
-    if _is_cacheable_response(response):
-        async with lock:
-            _response_cache[cache_key] = entry
-
-    if request.headers.get("if-none-match") == etag and response.status_code == 200:
-        not_modified = Response(status_code=304)
-        not_modified.headers["ETag"] = etag
-        not_modified.headers["X-Cache"] = "MISS"
-        if background:
-            not_modified.background = background
-        return not_modified
-
-    rebuilt = Response(
-        content=response_body,
-        status_code=response.status_code,
-        media_type=response.media_type,
-    )
-    for name, value in headers.items():
-        rebuilt.headers[name] = value
-    rebuilt.headers["X-Cache"] = "MISS"
-    if background:
-        rebuilt.background = background
-    return rebuilt
+
+def _route_cache_policy(path: str) -> CachePolicy:
+    for pattern, policy in CACHE_ROUTE_POLICIES:
+        if pattern.match(path):
+            return policy
+    return DEFAULT_CACHE_POLICY
+
+
+REQUEST_DEADLINE_ROUTES: List[Tuple[Pattern[str], Optional[float]]] = [
+    (re.compile(r"^/(cache|upstreams)/"), None),
+    (re.compile(r"^/products/\d+/(similar|related|reviews|price-history)$"), 5.0),
+    (re.compile(r"^/products(/|$)"), 8.0),
+    (re.compile(r"^/search$"), 6.0),
+    (re.compile(r"^/(compare|comparison)$"), 12.0),
+]
+
+
+def _route_deadline(path: str) -> Optional[float]:
+    for pattern, seconds in REQUEST_DEADLINE_ROUTES:
+        if pattern.match(path):
+            return seconds
+    return REQUEST_DEADLINE_SECONDS if REQUEST_DEADLINE_SECONDS > 0 else None
+
+
+# Registered before the cache so it runs inside it: a response flagged
+# partial (no-store) is never stored.
+app.add_middleware(
+    DeadlineMiddleware,
+    deadline_for=_route_deadline,
+    max_seconds=REQUEST_DEADLINE_MAX_SECONDS,
+)
+
+app.add_middleware(
+    ResponseCacheMiddleware,
+    cache=_response_cache,
+    flights=_inflight_requests,
+    shared=_shared_response_store,
+    policy_for=_route_cache_policy,
+    coalesce_timeout=API_CACHE_COALESCE_TIMEOUT_SECONDS,
+    stale_if_error=API_CACHE_STALE_IF_ERROR_SECONDS,
+    compress_min_bytes=API_CACHE_COMPRESS_MIN_BYTES,
+)
+
+
+# Registered after the cache so they wrap it: GZip only compresses responses
+# the cache did not already serve encoded, and CORS headers are added per
+# request instead of being replayed from cached entries.
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# --- CORS (ok pour dev; en prod restreins à ton domaine) ---
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 # --- Gym directory (mock dataset ready for partner integrations) ---
 
@@ -521,7 +782,13 @@ def _estimate_travel_time(distance_km: Optional[float]) -> Optional[str]:
 
 # Cache used to reuse SERP API responses and fallback data when
 # additional requests fail (e.g. API quota exceeded or network error).
-SERP_PRODUCT_CACHE: Dict[str, Dict[str, Any]] = {}
+# Bounded by entry count, size and age (SERP_PRODUCT_CACHE_* settings).
+SERP_PRODUCT_CACHE = SerpProductCache(
+    max_entries=SERP_PRODUCT_CACHE_MAX_ENTRIES,
+    max_bytes=SERP_PRODUCT_CACHE_MAX_BYTES,
+    ttl=SERP_PRODUCT_CACHE_TTL_SECONDS,
+    on_evict=lambda cache_key: _forget_serp_cache_entry(cache_key),
+)
 
 
 def _normalize_serp_cache_key(value: Any) -> Optional[str]:
@@ -546,47 +813,103 @@ def _clone_offers_for_cache(offers: Optional[List[Dict[str, Any]]]) -> List[Dict
     return cloned
 
 
-def find_product_by_id(identifier: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
-    normalized = _normalize_serp_cache_key(identifier)
-    if normalized:
-        direct_entry = SERP_PRODUCT_CACHE.get(normalized)
-        if isinstance(direct_entry, dict) and direct_entry:
-            return normalized, direct_entry
+def _serp_cache_aliases(cache_key: str, entry: Dict[str, Any]) -> List[str]:
+    """Normalized ids and links under which ``entry`` can be looked up."""
 
-    if not normalized:
-        return None
+    candidates: List[Any] = [cache_key]
+    summary = entry.get("summary")
+    if isinstance(summary, dict):
+        candidates.extend(
+            [summary.get("id"), summary.get("product_id"), summary.get("link")]
+        )
 
-    for cache_key, entry in SERP_PRODUCT_CACHE.items():
-        if not isinstance(entry, dict) or not entry:
-            continue
+    deal = entry.get("deal")
+    if isinstance(deal, dict):
+        candidates.extend([deal.get("productId"), deal.get("id"), deal.get("link")])
 
-        candidates: List[Any] = []
-        summary = entry.get("summary")
-        if isinstance(summary, dict):
+    serp_product = entry.get("serp_product")
+    if isinstance(serp_product, dict):
+        product_results = serp_product.get("product_results")
+        if isinstance(product_results, dict):
             candidates.extend(
-                [summary.get("id"), summary.get("product_id"), summary.get("link")]
+                [
+                    product_results.get("product_id"),
+                    product_results.get("link"),
+                    product_results.get("product_link"),
+                ]
             )
 
-        deal = entry.get("deal")
-        if isinstance(deal, dict):
-            candidates.extend([deal.get("productId"), deal.get("id"), deal.get("link")])
+    aliases: List[str] = []
+    for candidate in candidates:
+        normalized = _normalize_serp_cache_key(candidate)
+        if normalized and normalized not in aliases:
+            aliases.append(normalized)
+    return aliases
+
+
+# Alias (normalized product id or link) -> SERP_PRODUCT_CACHE keys claiming
+# it, oldest entry first like the former insertion-order scan; plus the
+# reverse map used to drop an entry's stale aliases when it changes.
+SERP_CACHE_ALIASES: Dict[str, List[str]] = {}
+_SERP_CACHE_KEY_ALIASES: Dict[str, List[str]] = {}
+# Creation order of SERP_PRODUCT_CACHE keys, to rank an alias's owners.
+_SERP_CACHE_RANKS: Dict[str, int] = {}
+# cache key -> (similarity features, summary) of the entry, built on first use.
+_SERP_SIMILARITY_FEATURES: Dict[str, Tuple[ProductFeatures, Dict[str, Any]]] = {}
+_serp_cache_rank_counter = itertools.count()
+
+
+def _index_serp_cache_aliases(cache_key: str, entry: Dict[str, Any]) -> None:
+    aliases = _serp_cache_aliases(cache_key, entry)
+    if _SERP_CACHE_KEY_ALIASES.get(cache_key) == aliases:
+        return
+    _drop_serp_cache_aliases(cache_key)
+    _SERP_CACHE_KEY_ALIASES[cache_key] = aliases
+    for alias in aliases:
+        owners = SERP_CACHE_ALIASES.setdefault(alias, [])
+        if cache_key not in owners:
+            owners.append(cache_key)
+            if len(owners) > 1:
+                owners.sort(key=_serp_cache_insertion_rank)
+
+
+def _serp_cache_insertion_rank(cache_key: str) -> int:
+    return _SERP_CACHE_RANKS.get(cache_key, 0)
 
-        serp_product = entry.get("serp_product")
-        if isinstance(serp_product, dict):
-            product_results = serp_product.get("product_results")
-            if isinstance(product_results, dict):
-                candidates.extend(
-                    [
-                        product_results.get("product_id"),
-                        product_results.get("link"),
-                        product_results.get("product_link"),
-                    ]
-                )
 
-        for candidate in candidates:
-            if _normalize_serp_cache_key(candidate) == normalized:
-                return cache_key, entry
+def _forget_serp_cache_entry(cache_key: str) -> None:
+    """Drop the lookup structures of an evicted SERP_PRODUCT_CACHE entry."""
 
+    _drop_serp_cache_aliases(cache_key)
+    _SERP_CACHE_RANKS.pop(cache_key, None)
+    _SERP_SIMILARITY_FEATURES.pop(cache_key, None)
+    PRODUCT_SEARCH_INDEXES["serp"].remove(cache_key)
+
+
+def _drop_serp_cache_aliases(cache_key: str) -> None:
+    for alias in _SERP_CACHE_KEY_ALIASES.pop(cache_key, ()):
+        owners = SERP_CACHE_ALIASES.get(alias)
+        if not owners:
+            continue
+        if cache_key in owners:
+            owners.remove(cache_key)
+        if not owners:
+            del SERP_CACHE_ALIASES[alias]
+
+
+def find_product_by_id(identifier: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+    normalized = _normalize_serp_cache_key(identifier)
+    if not normalized:
+        return None
+
+    direct_entry = SERP_PRODUCT_CACHE.get(normalized)
+    if isinstance(direct_entry, dict) and direct_entry:
+        return normalized, direct_entry
+
+    for cache_key in SERP_CACHE_ALIASES.get(normalized, ()):
+        entry = SERP_PRODUCT_CACHE.get(cache_key)
+        if isinstance(entry, dict) and entry:
+            return cache_key, entry
     return None
 
 
@@ -604,7 +927,9 @@ def _update_serp_cache_entry(
     if not cache_key:
         return
 
-    entry = SERP_PRODUCT_CACHE.setdefault(cache_key, {})
+    entry = SERP_PRODUCT_CACHE.entry_for_update(cache_key)
+    if cache_key not in _SERP_CACHE_RANKS:
+        _SERP_CACHE_RANKS[cache_key] = next(_serp_cache_rank_counter)
 
     if deal and isinstance(deal, dict):
         entry["deal"] = clone_deal_payload(deal)
@@ -627,6 +952,18 @@ def _update_serp_cache_entry(
             entry["offers"] = cloned_offers
 
     entry["updated_at"] = datetime.utcnow()
+    _index_serp_cache_aliases(cache_key, entry)
+    _SERP_SIMILARITY_FEATURES.pop(cache_key, None)
+
+    indexed = entry.get("summary") or entry.get("deal") or {}
+    PRODUCT_SEARCH_INDEXES["serp"].update(
+        cache_key,
+        {
+            "name": indexed.get("name") or indexed.get("title"),
+            "brand": indexed.get("brand"),
+        },
+    )
+    SERP_PRODUCT_CACHE.commit(cache_key)
 
 
 def _clone_serp_summary(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -647,16 +984,30 @@ def _clone_serp_summary(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     return None
 
 
+def _serp_similarity_features(
+    cache_key: str, entry: Dict[str, Any]
+) -> Optional[Tuple[ProductFeatures, Dict[str, Any]]]:
+    cached = _SERP_SIMILARITY_FEATURES.get(cache_key)
+    if cached is None:
+        summary = _clone_serp_summary(entry)
+        if not summary:
+            return None
+        cached = (extract_features(summary), summary)
+        _SERP_SIMILARITY_FEATURES[cache_key] = cached
+    return cached
+
+
 def _find_serp_similar(identifier: Any, *, limit: int) -> List[Dict[str, Any]]:
     match = find_product_by_id(identifier)
     if not match:
         return []
 
     cache_key, entry = match
-    base_summary = _clone_serp_summary(entry)
-    if not base_summary:
+    base = _serp_similarity_features(cache_key, entry)
+    if not base:
         return []
 
+    base_features = base[0]
     candidates: List[tuple[float, Dict[str, Any]]] = []
     base_query = entry.get("query")
 
@@ -669,12 +1020,12 @@ def _find_serp_similar(identifier: Any, *, limit: int) -> List[Dict[str, Any]]:
             if other_query and other_query != base_query:
                 continue
 
-        summary = _clone_serp_summary(other_entry)
-        if not summary:
+        other = _serp_similarity_features(other_key, other_entry)
+        if not other:
             continue
 
-        score = compute_similarity_score(base_summary, summary)
-        candidates.append((score, dict(summary)))
+        features, summary = other
+        candidates.append((similarity_score(base_features, features), summary))
 
     if not candidates:
         return []
@@ -688,7 +1039,7 @@ def _find_serp_similar(identifier: Any, *, limit: int) -> List[Dict[str, Any]]:
         reverse=True,
     )
 
-    return [item[1] for item in candidates[:limit]]
+    return [dict(item[1]) for item in candidates[:limit]]
 
 
 def _build_fallback_product_summary(product: Dict[str, Any]) -> Dict[str, Any]:
@@ -808,23 +1159,34 @@ def _build_fallback_product_summary(product: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+_FALLBACK_SIMILARITY: Optional[List[Tuple[Any, ProductFeatures, Dict[str, Any]]]] = None
+
+
+def _fallback_similarity_candidates() -> List[Tuple[Any, ProductFeatures, Dict[str, Any]]]:
+    """(id, features, summary) of the static fallback catalogue, built once."""
+
+    global _FALLBACK_SIMILARITY
+    if _FALLBACK_SIMILARITY is None:
+        _FALLBACK_SIMILARITY = [
+            (item.get("id"), extract_features(item), _build_fallback_product_summary(item))
+            for item in get_fallback_products()
+            if isinstance(item, dict)
+        ]
+    return _FALLBACK_SIMILARITY
+
+
 def _find_fallback_similar(product_id: int, *, limit: int) -> List[Dict[str, Any]]:
     base_product = get_fallback_product(product_id)
     if not base_product:
         return []
 
-    candidates = [
-        item
-        for item in get_fallback_products()
-        if isinstance(item, dict) and item.get("id") != product_id
+    base_features = extract_features(base_product)
+    scored: List[tuple[float, Dict[str, Any]]] = [
+        (similarity_score(base_features, features), summary)
+        for identifier, features, summary in _fallback_similarity_candidates()
+        if identifier != product_id
     ]
 
-    scored: List[tuple[float, Dict[str, Any]]] = []
-    for candidate in candidates:
-        score = compute_similarity_score(base_product, candidate)
-        summary = _build_fallback_product_summary(candidate)
-        scored.append((score, summary))
-
     scored.sort(
         key=lambda item: (
             item[0],
@@ -833,7 +1195,7 @@ def _find_fallback_similar(product_id: int, *, limit: int) -> List[Dict[str, Any
         reverse=True,
     )
 
-    return [item[1] for item in scored[:limit]]
+    return [deepcopy(item[1]) for item in scored[:limit]]
 
 
 def _extract_rating_reviews(product: Dict[str, Any]) -> tuple[Optional[float], int]:
@@ -923,8 +1285,42 @@ def _build_review_highlights(average: Optional[float], reviews_count: int) -> Li
     return highlights
 
 
-def _resolve_similar_products(product_id: int, limit: int) -> List[Dict[str, Any]]:
-    products = fetch_scraper_products()
+async def _catalogue_similar_products(
+    product_id: int, limit: int, products: List[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """Voisins précalculés du produit dans le snapshot du catalogue.
+
+    Seul le classement est précalculé : les fiches des voisins sont
+    construites comme par :func:`find_related_products`. ``None`` lorsque le
+    produit n'est pas dans l'index courant ou qu'un voisin a quitté le
+    catalogue du scraper (le calcul à la demande prend alors le relais).
+    """
+
+    index = _catalogue_similarity
+    snapshot = _catalogue_snapshot.current
+    if index is None or snapshot is None or index.version != snapshot.version:
+        return None
+    if product_id not in index:
+        return None
+
+    neighbours = index.neighbours(product_id, limit)
+    if neighbours:
+        keys = [key for _, key in neighbours]
+    else:
+        # Aucun voisin pertinent : premiers produits du catalogue, comme avant.
+        keys = [key for key in index.keys if key != str(product_id)][:limit]
+    by_id = {str(product.get("id")): product for product in products}
+    if any(key not in by_id for key in keys):
+        return None
+    return await _summarize_related_products([by_id[key] for key in keys])
+
+
+async def _resolve_similar_products(product_id: int, limit: int) -> List[Dict[str, Any]]:
+    products = await fetch_scraper_products()
+    precomputed = await _catalogue_similar_products(product_id, limit, products)
+    if precomputed is not None:
+        return precomputed
+
     base_product: Optional[Dict[str, Any]] = None
 
     for product in products:
@@ -936,7 +1332,7 @@ def _resolve_similar_products(product_id: int, limit: int) -> List[Dict[str, Any
             continue
 
     if base_product is not None:
-        return find_related_products(products, base_product, limit=limit)
+        return await find_related_products(products, base_product, limit=limit)
 
     serp_similar = _find_serp_similar(product_id, limit=limit)
     if not serp_similar:
@@ -947,12 +1343,12 @@ def _resolve_similar_products(product_id: int, limit: int) -> List[Dict[str, Any
     return _find_fallback_similar(product_id, limit=limit)
 
 
-def _resolve_product_for_reviews(product_id: int) -> Optional[Dict[str, Any]]:
-    products = fetch_scraper_products()
+async def _resolve_product_for_reviews(product_id: int) -> Optional[Dict[str, Any]]:
+    products = await fetch_scraper_products()
     for product in products:
         try:
             if int(product.get("id")) == product_id:
-                return build_product_summary(product)
+                return await build_product_summary(product)
         except (TypeError, ValueError):
             continue
 
@@ -1203,9 +1599,70 @@ def format_numeric_price(amount: Optional[float], currency: Optional[str]) -> Op
 def matches_query(name: str, query: Optional[str]) -> bool:
     if not query:
         return True
-    normalized = name.lower()
-    terms = [token for token in query.lower().split() if token]
-    return all(term in normalized for term in terms)
+    normalized = fold_text(name)
+    return all(term in normalized for term in query_terms(query))
+
+
+# Name/brand indexes of the scraper catalogue and of the SERP product cache,
+# kept in sync as those sources change. The static fallback catalogue is never
+# searched by text, so it has no index.
+PRODUCT_SEARCH_INDEXES: Dict[str, SearchIndex] = {
+    "scraper": SearchIndex(),
+    "serp": SearchIndex(),
+}
+
+
+def _index_products(index_name: str, products: Iterable[Dict[str, Any]]) -> int:
+    documents = {
+        str(product["id"]): product
+        for product in products
+        if isinstance(product, dict) and product.get("id") is not None
+    }
+    return PRODUCT_SEARCH_INDEXES[index_name].sync(documents)
+
+
+def _scraper_index_key(product: Dict[str, Any]) -> Optional[str]:
+    identifier = product.get("id")
+    return str(identifier) if identifier is not None else None
+
+
+def _serp_index_key(summary: Dict[str, Any]) -> Optional[str]:
+    return _normalize_serp_cache_key(summary.get("product_id") or summary.get("id")) or None
+
+
+def _query_matcher(
+    query: Optional[str],
+    *,
+    fields: Tuple[str, ...] = ("name", "brand"),
+    index_name: str = "scraper",
+    index_key: Callable[[Dict[str, Any]], Optional[str]] = _scraper_index_key,
+) -> Callable[[Dict[str, Any]], bool]:
+    """Prédicat « nom ou marque contient tous les termes de ``query`` ».
+
+    La requête est évaluée une fois sur l'index ; les produits absents de
+    l'index (sans identifiant, pas encore indexés) sont vérifiés directement.
+    ``index_key`` donne la clé d'un produit dans l'index.
+    """
+
+    if not query_terms(query):
+        return lambda product: True
+
+    index = PRODUCT_SEARCH_INDEXES[index_name]
+    matches = index.search(query, fields=fields)
+
+    def matcher(product: Dict[str, Any]) -> bool:
+        key = index_key(product)
+        if key is not None and key in index:
+            return key in matches
+        return any(matches_query(str(product.get(field) or ""), query) for field in fields)
+
+    return matcher
+
+
+def catalogue_match_counts(query: Optional[str]) -> Dict[str, int]:
+    """Nombre de produits correspondant à ``query`` dans chaque source indexée."""
+
+    return {name: index.count(query) for name, index in PRODUCT_SEARCH_INDEXES.items()}
 
 
 def _normalize_filter(value: Optional[str]) -> Optional[str]:
@@ -1249,53 +1706,104 @@ def _categories_match(payload: Dict[str, Any], category_filter: Optional[str]) -
     return any(category_filter in category.lower() for category in categories)
 
 
-def tokenize_keywords(value: Optional[str]) -> set[str]:
-    if not value:
-        return set()
-    tokens = re.split(r"[^a-z0-9]+", value.lower())
-    return {token for token in tokens if len(token) >= 3}
-
-
-def fetch_scraper_products(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+async def fetch_scraper_products(limit: Optional[int] = None) -> List[Dict[str, Any]]:
     if not SCRAPER_BASE_URL:
         return []
 
     try:
-        response = requests.get(
-            f"{SCRAPER_BASE_URL.rstrip('/')}/products", timeout=10
-        )
+        response = await within_deadline(upstream_clients.get("scraper").get("/products"))
         response.raise_for_status()
         data = response.json()
         if isinstance(data, list):
+            _index_products("scraper", data)
             if limit:
                 return data[:limit]
             return data
-    except Exception:
+    except Exception as exc:
+        mark_upstream_failure(exc)
         return []
 
     return []
 
 
-def fetch_scraper_product_with_offers(product_id: int) -> Optional[Dict[str, Any]]:
+async def fetch_scraper_product_with_offers(product_id: int) -> Optional[Dict[str, Any]]:
     if not SCRAPER_BASE_URL:
         return None
 
     try:
-        response = requests.get(
-            f"{SCRAPER_BASE_URL.rstrip('/')}/products/{product_id}/offers",
-            timeout=10,
+        response = await within_deadline(
+            upstream_clients.get("scraper").get(f"/products/{product_id}/offers")
         )
         response.raise_for_status()
         data = response.json()
         if isinstance(data, dict) and data:
             return data
-    except Exception:
+    except Exception as exc:
+        mark_upstream_failure(exc)
         return None
 
     return None
 
 
-def fetch_scraper_price_history(
+async def fetch_scraper_products_with_offers(
+    product_ids: Iterable[Any],
+) -> Dict[int, Dict[str, Any]]:
+    """Produits + offres du scraper pour plusieurs identifiants.
+
+    Interroge ``POST /products/offers:batch`` par lots de
+    ``SCRAPER_BATCH_SIZE`` identifiants au lieu d'un appel par produit. Un
+    scraper qui ne connaît pas encore cette route (404/405) est interrogé
+    produit par produit, en parallèle.
+    """
+
+    ids: List[int] = []
+    for value in product_ids:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    ids = list(dict.fromkeys(ids))
+    if not ids or not SCRAPER_BASE_URL:
+        return {}
+
+    client = upstream_clients.get("scraper")
+    details: Dict[int, Dict[str, Any]] = {}
+    for start in range(0, len(ids), SCRAPER_BATCH_SIZE):
+        chunk = ids[start : start + SCRAPER_BATCH_SIZE]
+        try:
+            response = await within_deadline(
+                client.post("/products/offers:batch", json={"ids": chunk})
+            )
+            if response.status_code in (404, 405):
+                fetched = await asyncio.gather(
+                    *(fetch_scraper_product_with_offers(product_id) for product_id in chunk)
+                )
+                details.update(
+                    (product_id, detail)
+                    for product_id, detail in zip(chunk, fetched)
+                    if detail
+                )
+                continue
+            response.raise_for_status()
+            data = response.json()
+        except Exception as exc:
+            mark_upstream_failure(exc)
+            continue
+
+        if not isinstance(data, list):
+            continue
+        for item in data:
+            if not isinstance(item, dict) or not item:
+                continue
+            try:
+                details[int(item.get("id"))] = item
+            except (TypeError, ValueError):
+                continue
+
+    return details
+
+
+async def fetch_scraper_price_history(
     product_id: int,
     *,
     start_date: Optional[str] = None,
@@ -1311,16 +1819,17 @@ def fetch_scraper_price_history(
         return []
 
     try:
-        response = requests.get(
-            f"{SCRAPER_BASE_URL.rstrip('/')}/products/{product_id}/history",
-            params=params,
-            timeout=10,
+        response = await within_deadline(
+            upstream_clients.get("scraper").get(
+                f"/products/{product_id}/history", params=params
+            )
         )
         response.raise_for_status()
         data = response.json()
         if isinstance(data, list):
             return data
-    except Exception:
+    except Exception as exc:
+        mark_upstream_failure(exc)
         return []
 
     return []
@@ -1563,14 +2072,14 @@ def build_serp_product_summary(
     }
 
 
-def build_serp_catalogue(
+async def build_serp_catalogue(
     q: str,
     *,
     limit: int,
     marque: Optional[str] = None,
     categorie: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
-    deals = collect_serp_deals(q, marque=marque, categorie=categorie, limit=limit)
+    deals = await collect_serp_deals(q, marque=marque, categorie=categorie, limit=limit)
     catalogue: List[Dict[str, Any]] = []
     seen: set[str] = set()
 
@@ -1599,13 +2108,13 @@ def build_serp_catalogue(
     return catalogue
 
 
-def collect_serp_deals(
+async def collect_serp_deals(
     q: str,
     marque: Optional[str] = None,
     categorie: Optional[str] = None,
     limit: int = 12,
 ) -> List[Dict[str, Any]]:
-    shop = serpapi_shopping(q)
+    shop = await serpapi_shopping(q)
     if "error" in shop:
         return []
 
@@ -1637,12 +2146,7 @@ def collect_serp_deals(
 
     offers_map: Dict[str, Dict[str, Any]] = {}
     if prefetch_ids:
-        try:
-            offers_map = asyncio.run(fetch_serpapi_product_offers_bulk(prefetch_ids))
-        except RuntimeError:
-            offers_map = {}
-            for pid in prefetch_ids:
-                offers_map[pid] = serpapi_product_offers(pid)
+        offers_map = await fetch_serpapi_product_offers_bulk(prefetch_ids)
 
     deals: List[Dict[str, Any]] = []
     for index, item in enumerate(shopping_results):
@@ -1692,7 +2196,7 @@ def collect_serp_deals(
 
         prod: Optional[Dict[str, Any]] = offers_map.get(product_id) if product_id else None
         if product_id and not prod:
-            prod = serpapi_product_offers(product_id)
+            prod = await serpapi_product_offers(product_id)
 
         if isinstance(prod, dict) and prod:
             sellers_results = prod.get("sellers_results") or {}
@@ -1872,8 +2376,8 @@ def convert_scraper_offer_to_deal(
     )
 
 
-def aggregate_offers_for_product(
-    product: Dict[str, Any], *, limit: int = 10
+async def aggregate_offers_for_product(
+    product: Dict[str, Any], *, limit: int = 10, include_serp: bool = True
 ) -> List[Dict[str, Any]]:
     offers = product.get("offers")
     scraper_deals = (
@@ -1885,13 +2389,15 @@ def aggregate_offers_for_product(
         else []
     )
 
-    name = product.get("name") or ""
-    brand = product.get("brand")
-    serp_deals = collect_serp_deals(
-        name,
-        marque=brand,
-        limit=limit,
-    )
+    serp_deals: List[Dict[str, Any]] = []
+    if include_serp:
+        name = product.get("name") or ""
+        brand = product.get("brand")
+        serp_deals = await collect_serp_deals(
+            name,
+            marque=brand,
+            limit=limit,
+        )
 
     combined = scraper_deals + serp_deals
     combined.sort(
@@ -1906,16 +2412,36 @@ def aggregate_offers_for_product(
     return combined[:limit]
 
 
-def build_product_summary(
-    product: Dict[str, Any], *, offer_limit: int = 10
+async def build_product_summary(
+    product: Dict[str, Any],
+    *,
+    offer_limit: int = 10,
+    details: Optional[Dict[int, Dict[str, Any]]] = None,
+    include_serp: bool = True,
 ) -> Dict[str, Any]:
+    """Fiche produit enrichie de ses meilleures offres.
+
+    ``details`` contient les fiches déjà chargées par
+    :func:`fetch_scraper_products_with_offers` ; sans lui, la fiche est
+    demandée au scraper pour ce seul produit. ``include_serp=False`` se
+    limite aux offres du scraper (aperçu sans appel SerpAPI).
+    """
+
     base_payload = serialize_product(product)
     product_id = base_payload.get("id")
-    detail = fetch_scraper_product_with_offers(product_id) if product_id else None
+    if details is not None:
+        try:
+            detail = details.get(int(product_id)) if product_id else None
+        except (TypeError, ValueError):
+            detail = None
+    else:
+        detail = await fetch_scraper_product_with_offers(product_id) if product_id else None
 
     aggregated: List[Dict[str, Any]] = []
     if detail:
-        aggregated = aggregate_offers_for_product(detail, limit=offer_limit)
+        aggregated = await aggregate_offers_for_product(
+            detail, limit=offer_limit, include_serp=include_serp
+        )
 
     best_offer: Optional[Dict[str, Any]] = None
     for deal in aggregated:
@@ -2100,48 +2626,10 @@ def serialize_product(product: Dict[str, Any]) -> Dict[str, Any]:
 def compute_similarity_score(
     base: Dict[str, Any], candidate: Dict[str, Any]
 ) -> float:
-    score = 0.0
-
-    base_brand = (base.get("brand") or "").strip().lower()
-    candidate_brand = (candidate.get("brand") or "").strip().lower()
-    if base_brand and candidate_brand:
-        if base_brand == candidate_brand:
-            score += 3.0
-        elif base_brand in candidate_brand or candidate_brand in base_brand:
-            score += 1.5
-
-    base_category = (base.get("category") or "").strip().lower()
-    candidate_category = (candidate.get("category") or "").strip().lower()
-    if base_category and candidate_category and base_category == candidate_category:
-        score += 1.5
-
-    base_tokens = tokenize_keywords(base.get("name"))
-    candidate_tokens = tokenize_keywords(candidate.get("name"))
-    if base_tokens and candidate_tokens:
-        overlap = base_tokens & candidate_tokens
-        if overlap:
-            score += 2.0 * len(overlap) / max(len(base_tokens), 1)
-
-    base_flavour = tokenize_keywords(base.get("flavour"))
-    candidate_flavour = tokenize_keywords(candidate.get("flavour"))
-    if base_flavour and candidate_flavour:
-        flavour_overlap = base_flavour & candidate_flavour
-        if flavour_overlap:
-            score += 1.0
-
-    base_protein = parse_float(base.get("protein_per_serving_g"))
-    candidate_protein = parse_float(candidate.get("protein_per_serving_g"))
-    if (
-        base_protein is not None
-        and candidate_protein is not None
-        and abs(base_protein - candidate_protein) <= 2
-    ):
-        score += 0.5
-
-    return score
+    return similarity_score(extract_features(base), extract_features(candidate))
 
 
-def find_related_products(
+async def find_related_products(
     products: List[Dict[str, Any]],
     base_product: Dict[str, Any],
     *,
@@ -2151,6 +2639,7 @@ def find_related_products(
     if base_id is None:
         return []
 
+    base_features = extract_features(base_product)
     scored_candidates: List[tuple[float, Dict[str, Any]]] = []
     for candidate in products:
         if candidate is base_product:
@@ -2158,7 +2647,7 @@ def find_related_products(
         candidate_id = candidate.get("id")
         if candidate_id is None or candidate_id == base_id:
             continue
-        score = compute_similarity_score(base_product, candidate)
+        score = similarity_score(base_features, extract_features(candidate))
         if score <= 0:
             continue
         scored_candidates.append((score, candidate))
@@ -2173,17 +2662,33 @@ def find_related_products(
     else:
         scored_candidates.sort(key=lambda item: item[0], reverse=True)
 
-    related_summaries: List[Dict[str, Any]] = []
-    for _, candidate in scored_candidates:
-        summary = build_product_summary(candidate, offer_limit=6)
-        related_summaries.append(summary)
-        if len(related_summaries) >= limit:
-            break
+    selected = [candidate for _, candidate in scored_candidates[:limit]]
+    return await _summarize_related_products(selected)
+
+
+# Offres par fiche de produit similaire (plus court que la fiche complète).
+RELATED_PRODUCT_OFFER_LIMIT = 6
 
-    return related_summaries
+
+async def _summarize_related_products(selected: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fiches des produits similaires retenus, quel que soit le classement utilisé."""
+
+    details = await fetch_scraper_products_with_offers(
+        candidate.get("id") for candidate in selected
+    )
+    return list(
+        await asyncio.gather(
+            *(
+                build_product_summary(
+                    candidate, offer_limit=RELATED_PRODUCT_OFFER_LIMIT, details=details
+                )
+                for candidate in selected
+            )
+        )
+    )
 
 
-def collect_scraper_deals(
+async def collect_scraper_deals(
     q: str,
     *,
     limit: int = 12,
@@ -2192,7 +2697,7 @@ def collect_scraper_deals(
     name: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     deals: List[Dict[str, Any]] = []
-    products = fetch_scraper_products()
+    products = await fetch_scraper_products()
     if not products:
         return deals
 
@@ -2201,16 +2706,15 @@ def collect_scraper_deals(
     normalized_query = (q or "").strip()
     normalized_name = (name or "").strip()
 
+    query_match = _query_matcher(normalized_query)
+    name_match = _query_matcher(normalized_name, fields=("name",))
+
     filtered_products = []
     for product in products:
-        name_value = product.get("name", "")
         brand_value = product.get("brand")
-        if normalized_query and not (
-            matches_query(name_value, normalized_query)
-            or matches_query(str(brand_value or ""), normalized_query)
-        ):
+        if not query_match(product):
             continue
-        if normalized_name and not matches_query(name_value, normalized_name):
+        if not name_match(product):
             continue
         if not _value_matches_filter(brand_value, brand_filter):
             continue
@@ -2223,19 +2727,27 @@ def collect_scraper_deals(
         filtered_products = products
         fallback_to_all = True
 
+    candidates = []
     for product in filtered_products:
         if fallback_to_all:
-            if normalized_name and not matches_query(product.get("name", ""), normalized_name):
+            if not name_match(product):
                 continue
             if not _value_matches_filter(product.get("brand"), brand_filter):
                 continue
             if not _categories_match(product, category_filter):
                 continue
-        product_id = product.get("id")
-        if product_id is None:
+        if product.get("id") is None:
             continue
+        candidates.append(product)
 
-        detail = fetch_scraper_product_with_offers(int(product_id))
+    details = await fetch_scraper_products_with_offers(
+        product.get("id") for product in candidates
+    )
+    for product in candidates:
+        try:
+            detail = details.get(int(product.get("id")))
+        except (TypeError, ValueError):
+            continue
         if not detail:
             continue
 
@@ -2253,49 +2765,125 @@ def collect_scraper_deals(
 
     return deals
 
-def serpapi_shopping(q: str, hl: str = "fr", gl: str = "fr") -> Dict[str, Any]:
+SERPAPI_FAILURES = NegativeCache(
+    base=SERPAPI_FAILURE_BACKOFF_BASE_SECONDS,
+    max_backoff=SERPAPI_FAILURE_BACKOFF_MAX_SECONDS,
+)
+
+
+def _serpapi_outage(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Échec dû à l'indisponibilité de SerpAPI : la réponse en cours est dégradée."""
+
+    mark_degraded("serpapi")
+    return {**payload, "unavailable": True}
+
+
+def _serpapi_budget_refusal(endpoint: str) -> Dict[str, Any]:
+    """Appel refusé par le budget SerpAPI : la réponse en cours est partielle."""
+
+    mark_degraded("serpapi-budget")
+    return {"error": f"Budget SerpAPI atteint ({endpoint})"}
+
+
+def _serpapi_backoff(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Échec SerpAPI encore en période d'attente pour ``cache_key``."""
+
+    failed = SERPAPI_FAILURES.get(cache_key)
+    if isinstance(failed, dict) and failed.get("unavailable"):
+        mark_degraded("serpapi")
+    return failed
+
+
+def _record_serpapi_result(cache_key: str, payload: Any) -> None:
+    """Mémorise un échec SerpAPI (clé ``local_cache``) ou l'efface en cas de succès."""
+
+    if isinstance(payload, dict) and "error" not in payload:
+        SERPAPI_FAILURES.record_success(cache_key)
+        return
+    if isinstance(payload, dict) and (payload.get("deadlineExceeded") or payload.get("circuitOpen")):
+        # Cut short by the request's deadline or refused by the open circuit:
+        # SerpAPI itself did not fail.
+        return
+    failure = payload if isinstance(payload, dict) else {"error": "Réponse SerpAPI inattendue"}
+    SERPAPI_FAILURES.record_failure(
+        cache_key,
+        {key: value for key, value in failure.items() if key != "text"},
+    )
+
+
+async def serpapi_shopping(q: str, hl: str = "fr", gl: str = "fr") -> Dict[str, Any]:
     cache_key = f"serpapi:shopping:{hl}:{gl}:{q.strip().lower()}"
-    cached = local_cache.get(cache_key)
+    cached = await local_cache.aget(cache_key)
     if isinstance(cached, dict):
+        serpapi_budget.record_cache_hit("google_shopping")
         return cached
 
+    failed = _serpapi_backoff(cache_key)
+    if failed is not None:
+        return failed
+
+    if not upstream_clients.available("serpapi"):
+        return _serpapi_outage({"error": "SerpAPI indisponible (circuit ouvert)", "circuitOpen": True})
+
+    if not await serpapi_budget.acquire("google_shopping"):
+        return _serpapi_budget_refusal("google_shopping")
+
     params = {"engine": "google_shopping", "q": q, "hl": hl, "gl": gl, "api_key": SERPAPI_KEY}
     try:
-        r = requests.get(SERPAPI_BASE, params=params, timeout=30)
+        r = await within_deadline(upstream_clients.get("serpapi").get(SERPAPI_BASE, params=params))
         try:
-            payload = r.json()
+            payload = project_shopping_payload(r.json())
         except Exception:
-            payload = {"error": "Réponse non JSON de SerpAPI", "text": r.text, "status": r.status_code}
-    except requests.exceptions.Timeout:
-        payload = {"error": "Timeout SerpAPI (google_shopping)"}
-    except requests.exceptions.RequestException as exc:
-        payload = {"error": f"Erreur SerpAPI (google_shopping): {exc}"}
+            payload = _serpapi_outage(
+                {"error": "Réponse non JSON de SerpAPI", "text": r.text, "status": r.status_code}
+            )
+        else:
+            if r.status_code >= 500 or r.status_code == 429:
+                payload = _serpapi_outage(
+                    {"error": f"Erreur SerpAPI (google_shopping): HTTP {r.status_code}", "status": r.status_code}
+                )
+    except DeadlineExceeded:
+        # Not an upstream failure: nothing to cache or back off.
+        return {"error": "Délai de la requête dépassé (google_shopping)", "deadlineExceeded": True}
+    except CircuitOpenError:
+        # Opened while waiting for the budget: the call never left.
+        serpapi_budget.refund("google_shopping")
+        return _serpapi_outage({"error": "SerpAPI indisponible (circuit ouvert)", "circuitOpen": True})
+    except httpx.TimeoutException:
+        payload = _serpapi_outage({"error": "Timeout SerpAPI (google_shopping)"})
+    except httpx.HTTPError as exc:
+        payload = _serpapi_outage({"error": f"Erreur SerpAPI (google_shopping): {exc}"})
 
     if isinstance(payload, dict) and "error" not in payload:
-        local_cache.set(cache_key, payload, ttl=60 * 60)
+        await local_cache.aset(cache_key, payload, ttl=60 * 60)
+    _record_serpapi_result(cache_key, payload)
 
     return payload
 
-def serpapi_product_offers(product_id: str, hl: str = "fr", gl: str = "fr") -> Dict[str, Any]:
+async def serpapi_product_offers(product_id: str, hl: str = "fr", gl: str = "fr") -> Dict[str, Any]:
     cache_key = f"serpapi:product:{hl}:{gl}:{product_id}"
-    cached = local_cache.get(cache_key)
+    cached = await local_cache.aget(cache_key)
     if isinstance(cached, dict):
+        serpapi_budget.record_cache_hit("google_product")
         return cached
 
-    params = {"engine": "google_product", "product_id": product_id, "offers": "1", "hl": hl, "gl": gl, "api_key": SERPAPI_KEY}
-    try:
-        r = requests.get(SERPAPI_BASE, params=params, timeout=30)
-        try:
-            payload = r.json()
-        except Exception:
-            payload = {"error": "Réponse non JSON (google_product)", "text": r.text, "status": r.status_code}
-    except requests.exceptions.Timeout:
-        payload = {"error": "Timeout SerpAPI (google_product)"}
-    except requests.exceptions.RequestException as exc:
-        payload = {"error": f"Erreur SerpAPI (google_product): {exc}"}
+    failed = _serpapi_backoff(cache_key)
+    if failed is not None:
+        return failed
+
+    if not upstream_clients.available("serpapi"):
+        return _serpapi_outage({"error": "SerpAPI indisponible (circuit ouvert)", "circuitOpen": True})
+
+    if not await serpapi_budget.acquire("google_product"):
+        return _serpapi_budget_refusal("google_product")
+
+    payload = await _fetch_serpapi_product_offer(
+        upstream_clients.get("serpapi"), product_id, hl=hl, gl=gl
+    )
 
     if isinstance(payload, dict) and "error" not in payload:
-        local_cache.set(cache_key, payload, ttl=3 * 60 * 60)
+        await local_cache.aset(cache_key, payload, ttl=3 * 60 * 60)
+    _record_serpapi_result(cache_key, payload)
 
     return payload
 
@@ -2315,39 +2903,59 @@ async def fetch_serpapi_product_offers_bulk(
     results: Dict[str, Dict[str, Any]] = {}
     ids_to_fetch: List[str] = []
 
-    for product_id in unique:
+    # Local misses go to Redis concurrently, not one round trip after the other.
+    cached_payloads = await asyncio.gather(
+        *(local_cache.aget(f"serpapi:product:{hl}:{gl}:{product_id}") for product_id in unique)
+    )
+    for product_id, cached in zip(unique, cached_payloads):
         cache_key = f"serpapi:product:{hl}:{gl}:{product_id}"
-        cached = local_cache.get(cache_key)
         if isinstance(cached, dict):
+            serpapi_budget.record_cache_hit("google_product")
             results[product_id] = cached
+            continue
+        failed = _serpapi_backoff(cache_key)
+        if failed is not None:
+            results[product_id] = failed
         else:
             ids_to_fetch.append(product_id)
 
     if not ids_to_fetch:
         return results
 
-    timeout = httpx.Timeout(30.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        tasks = {
-            product_id: asyncio.create_task(
-                _fetch_serpapi_product_offer(client, product_id, hl=hl, gl=gl)
-            )
-            for product_id in ids_to_fetch
-        }
-
-        for product_id, task in tasks.items():
-            try:
-                payload = await task
-            except Exception as exc:  # pragma: no cover - defensive
-                payload = {"error": f"Erreur SerpAPI (google_product): {exc}"}
-
-            if isinstance(payload, dict) and "error" not in payload:
-                local_cache.set(
-                    f"serpapi:product:{hl}:{gl}:{product_id}",
-                    payload,
-                    ttl=3 * 60 * 60,
+    client = upstream_clients.get("serpapi")
+    semaphore = asyncio.Semaphore(SERPAPI_MAX_CONCURRENCY)
+    # Refused by the circuit breaker or the budget: not an upstream failure,
+    # nothing to back off.
+    refused: set[str] = set()
+
+    async def fetch_one(product_id: str) -> Dict[str, Any]:
+        # Checked once a slot is free: the circuit may have opened meanwhile.
+        async with semaphore:
+            if not upstream_clients.available("serpapi"):
+                refused.add(product_id)
+                return _serpapi_outage(
+                    {"error": "SerpAPI indisponible (circuit ouvert)", "circuitOpen": True}
                 )
-            results[product_id] = payload if isinstance(payload, dict) else {}
+            if not await serpapi_budget.acquire("google_product"):
+                refused.add(product_id)
+                return _serpapi_budget_refusal("google_product")
+            return await _fetch_serpapi_product_offer(client, product_id, hl=hl, gl=gl)
+
+    payloads = await asyncio.gather(
+        *(fetch_one(product_id) for product_id in ids_to_fetch),
+        return_exceptions=True,
+    )
+
+    for product_id, payload in zip(ids_to_fetch, payloads):
+        if isinstance(payload, Exception):  # pragma: no cover - defensive
+            payload = {"error": f"Erreur SerpAPI (google_product): {payload}"}
+
+        cache_key = f"serpapi:product:{hl}:{gl}:{product_id}"
+        if isinstance(payload, dict) and "error" not in payload:
+            await local_cache.aset(cache_key, payload, ttl=3 * 60 * 60)
+        if product_id not in refused:
+            _record_serpapi_result(cache_key, payload)
+        results[product_id] = payload if isinstance(payload, dict) else {}
 
     return results
 
@@ -2365,19 +2973,33 @@ async def _fetch_serpapi_product_offer(
     }
 
     try:
-        response = await client.get(SERPAPI_BASE, params=params)
+        response = await within_deadline(client.get(SERPAPI_BASE, params=params))
         try:
-            payload = response.json()
+            payload = project_product_payload(response.json())
         except json.JSONDecodeError:
-            payload = {
-                "error": "Réponse non JSON (google_product)",
-                "text": response.text,
-                "status": response.status_code,
-            }
+            payload = _serpapi_outage(
+                {
+                    "error": "Réponse non JSON (google_product)",
+                    "text": response.text,
+                    "status": response.status_code,
+                }
+            )
+        else:
+            if response.status_code >= 500 or response.status_code == 429:
+                payload = _serpapi_outage(
+                    {"error": f"Erreur SerpAPI (google_product): HTTP {response.status_code}", "status": response.status_code}
+                )
+    except DeadlineExceeded:
+        payload = {"error": "Délai de la requête dépassé (google_product)", "deadlineExceeded": True}
+    except CircuitOpenError:
+        # Rejected before reaching SerpAPI: the budget is handed back and
+        # there is nothing to back off.
+        serpapi_budget.refund("google_product")
+        payload = _serpapi_outage({"error": "SerpAPI indisponible (circuit ouvert)", "circuitOpen": True})
     except httpx.TimeoutException:
-        payload = {"error": "Timeout SerpAPI (google_product)"}
+        payload = _serpapi_outage({"error": "Timeout SerpAPI (google_product)"})
     except httpx.HTTPError as exc:
-        payload = {"error": f"Erreur SerpAPI (google_product): {exc}"}
+        payload = _serpapi_outage({"error": f"Erreur SerpAPI (google_product): {exc}"})
 
     return payload if isinstance(payload, dict) else {}
 
@@ -2551,58 +3173,76 @@ def _format_price_payload(price: Optional[Dict[str, Any]]) -> Optional[Dict[str,
     }
 
 
-def search_products(
+async def search_products(
     q: str,
     *,
     limit: int = 10,
     name: Optional[str] = None,
     brand: Optional[str] = None,
     category: Optional[str] = None,
+    collected: Optional[List[Dict[str, Any]]] = None,
 ) -> List[Dict[str, Any]]:
+    """Produits correspondant à la recherche.
+
+    ``collected`` reçoit les résultats au fil de l'eau, ce qui permet à
+    l'appelant de récupérer les premiers produits si la recherche est
+    interrompue (budget de temps dépassé).
+    """
     normalized_query = (q or "").strip()
     normalized_name = (name or "").strip()
     brand_filter = _normalize_filter(brand)
     category_filter = _normalize_filter(category)
 
-    products = fetch_scraper_products()
-    collected: List[Dict[str, Any]] = []
+    products = await fetch_scraper_products()
+    if collected is None:
+        collected = []
 
     if products:
+        query_match = _query_matcher(normalized_query)
+        name_match = _query_matcher(normalized_name, fields=("name",))
+        matches: List[Dict[str, Any]] = []
         for product in products:
-            name_value = product.get("name") or ""
             brand_value = product.get("brand") or ""
-            if normalized_query and not (
-                matches_query(name_value, normalized_query)
-                or matches_query(brand_value, normalized_query)
-            ):
+            if not query_match(product):
                 continue
-            if normalized_name and not matches_query(name_value, normalized_name):
+            if not name_match(product):
                 continue
             if not _value_matches_filter(brand_value, brand_filter):
                 continue
             if not _categories_match(product, category_filter):
                 continue
 
-            collected.append(build_product_summary(product))
-            if len(collected) >= limit:
+            matches.append(product)
+            if len(matches) >= limit:
                 break
 
+        details = await fetch_scraper_products_with_offers(
+            product.get("id") for product in matches
+        )
+        for product in matches:
+            collected.append(await build_product_summary(product, details=details))
+
     if len(collected) < limit:
+        # Filtres normalisés, comme la clé du cache de réponses.
         fallback_query = (
             normalized_name
             or normalized_query
-            or brand
-            or category
+            or brand_filter
+            or category_filter
             or "whey protein"
         )
-        fallback_catalogue = build_serp_catalogue(
+        fallback_catalogue = await build_serp_catalogue(
             fallback_query,
             limit=max(limit, 12),
-            marque=brand if brand_filter else None,
-            categorie=category if category_filter else None,
+            marque=brand_filter,
+            categorie=category_filter,
+        )
+        # Les fiches renvoyées viennent d'être indexées dans le cache SERP.
+        serp_name_match = _query_matcher(
+            normalized_name, fields=("name",), index_name="serp", index_key=_serp_index_key
         )
         for summary in fallback_catalogue:
-            if normalized_name and not matches_query(summary.get("name") or "", normalized_name):
+            if not serp_name_match(summary):
                 continue
             if not _value_matches_filter(summary.get("brand"), brand_filter):
                 continue
@@ -2807,36 +3447,94 @@ async def search_all(
     nom: Optional[str] = Query(None),
     categorie: Optional[str] = Query(None),
     marque: Optional[str] = Query(None),
+    response: Response = None,
 ):
     normalized_query = (q or "").strip()
     normalized_name = (nom or "").strip()
     effective_limit = max(1, min(int(limit or 0), 50))
-
-    products = search_products(
-        normalized_query,
-        limit=effective_limit,
-        name=normalized_name,
-        brand=marque,
-        category=categorie,
+    secondary_query = normalized_query or normalized_name
+
+    # Les trois sources partent en parallèle, chacune avec son budget ; les
+    # recherches salles/programmes (E/S bloquantes) tournent hors de la boucle.
+    products: List[Dict[str, Any]] = []
+    sources = {
+        "products": (
+            search_products(
+                normalized_query,
+                limit=effective_limit,
+                name=normalized_name,
+                brand=marque,
+                category=categorie,
+                collected=products,
+            ),
+            SEARCH_PRODUCTS_BUDGET_SECONDS,
+        ),
+        "gyms": (
+            asyncio.to_thread(
+                search_gyms,
+                secondary_query,
+                limit=effective_limit,
+                name=normalized_name,
+                brand=marque,
+                category=categorie,
+            ),
+            SEARCH_GYMS_BUDGET_SECONDS,
+        ),
+        "programmes": (
+            asyncio.to_thread(
+                search_programs,
+                secondary_query,
+                limit=effective_limit,
+                name=normalized_name,
+                brand=marque,
+                category=categorie,
+            ),
+            SEARCH_PROGRAMMES_BUDGET_SECONDS,
+        ),
+    }
+    outcomes = await asyncio.gather(
+        *(_run_search_source(coro, budget) for coro, budget in sources.values())
     )
 
-    gyms = search_gyms(
-        normalized_query or normalized_name,
-        limit=effective_limit,
-        name=normalized_name,
-        brand=marque,
-        category=categorie,
-    )
+    payload: Dict[str, Any] = {}
+    statuses: Dict[str, Dict[str, Any]] = {}
+    for name, (results, status, elapsed_ms) in zip(sources, outcomes):
+        if results is None:
+            results = products[:effective_limit] if name == "products" else []
+        payload[name] = results
+        statuses[name] = {"status": status, "elapsedMs": elapsed_ms, "count": len(results)}
+
+    partial = any(entry["status"] != "ok" for entry in statuses.values())
+    payload["meta"] = {
+        "partial": partial,
+        "sources": statuses,
+        "matches": catalogue_match_counts(normalized_query or normalized_name),
+    }
+    if partial and response is not None:
+        # Résultat incomplet : ne pas le figer dans le cache de réponses.
+        response.headers["Cache-Control"] = "no-store"
+    return payload
 
-    programmes = search_programs(
-        normalized_query or normalized_name,
-        limit=effective_limit,
-        name=normalized_name,
-        brand=marque,
-        category=categorie,
-    )
 
-    return {"products": products, "gyms": gyms, "programmes": programmes}
+async def _run_search_source(
+    coro: Awaitable[List[Dict[str, Any]]], budget: float
+) -> Tuple[Optional[List[Dict[str, Any]]], str, int]:
+    """Exécute une source de ``/search`` dans son budget de temps.
+
+    Renvoie ``(résultats, statut, durée en ms)`` ; les résultats valent
+    ``None`` quand la source a expiré ou échoué.
+    """
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        results = await asyncio.wait_for(coro, timeout=budget)
+        status = "ok"
+    except asyncio.TimeoutError:
+        results, status = None, "timeout"
+    except Exception:
+        results, status = None, "error"
+    return results, status, int((loop.time() - started) * 1000)
 
 # --- Routes ---
 
@@ -2845,6 +3543,62 @@ def home():
     return {"message": "API OK ✅ — utilise /compare?q=whey protein"}
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    stats = {**_response_cache.stats(), **_inflight_requests.stats()}
+    if _shared_response_store is not None:
+        stats.update(_shared_response_store.stats())
+    stats.update(_catalogue_snapshot.stats())
+    stats.update(SERP_PRODUCT_CACHE.stats())
+    stats["serpapiBudget"] = serpapi_budget.stats()
+    stats.update(SERPAPI_FAILURES.stats())
+    stats["searchIndex"] = {
+        name: index.stats() for name, index in PRODUCT_SEARCH_INDEXES.items()
+    }
+    if _catalogue_similarity is not None:
+        stats["similarityIndex"] = _catalogue_similarity.stats()
+    return Response(
+        content=json.dumps(stats),
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.get("/upstreams/status")
+def upstreams_status():
+    """État des disjoncteurs (scraper, SerpAPI, ScraperAPI)."""
+
+    upstreams = {
+        name: {**stats, "available": upstream_clients.available(name)}
+        for name, stats in upstream_clients.breaker_stats().items()
+    }
+    return Response(
+        content=json.dumps({"upstreams": upstreams}),
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.post("/cache/purge")
+async def cache_purge(
+    tags: List[str] = Query(..., description="Tags à purger (catalogue, product:42, query:whey...)"),
+    x_cache_purge_token: Optional[str] = Header(None),
+):
+    if not API_CACHE_PURGE_TOKEN:
+        raise HTTPException(status_code=403, detail="Purge du cache désactivée")
+    if not x_cache_purge_token or not hmac.compare_digest(
+        x_cache_purge_token, API_CACHE_PURGE_TOKEN
+    ):
+        raise HTTPException(status_code=401, detail="Jeton de purge invalide")
+
+    normalized = sorted({tag.strip() for tag in tags if tag and tag.strip()})
+    if not normalized:
+        raise HTTPException(status_code=400, detail="Aucun tag fourni")
+    purged = await purge_cached_responses(normalized)
+    _refresh_catalogue_for_tags(normalized)
+    return {"tags": normalized, "purged": purged}
+
+
 @app.get("/programmes")
 def get_programmes():
     with PROGRAMMES_PATH.open("r", encoding="utf-8") as handle:
@@ -2852,7 +3606,7 @@ def get_programmes():
 
 
 @app.get("/compare")
-def compare(
+async def compare(
     q: str = Query("whey protein"),
     marque: Optional[str] = Query(None),
     categorie: Optional[str] = Query(None),
@@ -2869,13 +3623,13 @@ def compare(
 
     if legacy:
         legacy_term = search_term or "whey protein"
-        serp_deals = collect_serp_deals(
+        serp_deals = await collect_serp_deals(
             legacy_term,
             marque=brand_filter,
             categorie=categorie,
             limit=limit,
         )
-        scraper_deals = collect_scraper_deals(
+        scraper_deals = await collect_scraper_deals(
             legacy_term,
             limit=limit,
             marque=brand_filter,
@@ -2903,20 +3657,180 @@ def compare(
         )
 
     try:
-        return asyncio.run(
-            compare_product(
-                normalized_query,
-                product_brand=brand_filter,
-                product_image=image or image_alias,
-                product_url=product_url,
-            )
+        return await compare_product(
+            normalized_query,
+            product_brand=brand_filter,
+            product_image=image or image_alias,
+            product_url=product_url,
         )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
+CATALOGUE_SORT_KEYS = ("price_asc", "price_desc", "rating", "protein_ratio")
+
+
+def _best_price_amount(item: Dict[str, Any]) -> Optional[float]:
+    amount = (item.get("bestPrice") or {}).get("amount")
+    if amount is None:
+        return None
+    try:
+        return float(amount)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sort_catalogue(items: List[Dict[str, Any]], sort: Optional[str]) -> List[Dict[str, Any]]:
+    sort_key = (sort or "price_asc").lower()
+    if sort_key == "price_desc":
+        return sorted(
+            items,
+            key=lambda item: (
+                _best_price_amount(item)
+                if _best_price_amount(item) is not None
+                else -float("inf")
+            ),
+            reverse=True,
+        )
+    if sort_key == "rating":
+        return sorted(items, key=lambda item: (item.get("rating") or 0.0), reverse=True)
+    if sort_key == "protein_ratio":
+        return sorted(items, key=lambda item: (item.get("proteinPerEuro") or 0.0), reverse=True)
+    # default price ascending
+    return sorted(
+        items,
+        key=lambda item: (
+            _best_price_amount(item)
+            if _best_price_amount(item) is not None
+            else float("inf")
+        ),
+    )
+
+
+async def _build_catalogue_snapshot() -> List[Dict[str, Any]]:
+    # Background enrichment must not eat the SerpAPI budget of live requests,
+    # nor inherit the deadline of the request that triggered the refresh.
+    with prefetch_priority(), no_deadline():
+        products = await fetch_scraper_products()
+        if not products:
+            return []
+
+        details = await fetch_scraper_products_with_offers(
+            product.get("id") for product in products
+        )
+        semaphore = asyncio.Semaphore(CATALOGUE_SNAPSHOT_CONCURRENCY)
+
+        async def summarize(product: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await build_product_summary(product, details=details)
+
+        return list(await asyncio.gather(*(summarize(product) for product in products)))
+
+
+async def _on_catalogue_change(snapshot: Any, previous: Any) -> None:
+    global _catalogue_similarity
+    if previous is not None:
+        # Pages showing a modified product are outdated; every listing page is
+        # only when products appeared or disappeared. Other pages keep their
+        # route TTL, even if a price change moved products between them.
+        membership_changed, changed_ids = snapshot.changes_since(previous)
+        tags = (
+            [CATALOGUE_CACHE_TAG]
+            if membership_changed
+            else [f"product:{product_id}" for product_id in changed_ids]
+        )
+        if tags:
+            await purge_cached_responses(tags, origin=CATALOGUE_PURGE_ORIGIN)
+    # Pairwise scoring is quadratic: keep it off the event loop.
+    _catalogue_similarity = await asyncio.to_thread(
+        SimilarityIndex,
+        snapshot.products,
+        top_k=SIMILARITY_TOP_K,
+        version=snapshot.version,
+    )
+
+
+_catalogue_similarity: Optional[SimilarityIndex] = None
+
+
+_catalogue_snapshot = CatalogueSnapshotStore(
+    builder=_build_catalogue_snapshot,
+    sorter=_sort_catalogue,
+    sort_keys=CATALOGUE_SORT_KEYS,
+    on_change=_on_catalogue_change,
+)
+_catalogue_snapshot_task: Optional[asyncio.Task] = None
+
+
+def _refresh_catalogue_for_tags(tags: List[str]) -> None:
+    """Rebuild the snapshot early when the catalogue or a product was purged."""
+
+    if CATALOGUE_SNAPSHOT_REFRESH_SECONDS <= 0:
+        return
+    if any(tag == CATALOGUE_CACHE_TAG or tag.startswith("product:") for tag in tags):
+        _catalogue_snapshot.request_refresh()
+
+
+@app.on_event("startup")
+async def _start_catalogue_snapshot() -> None:
+    global _catalogue_snapshot_task
+    if _catalogue_snapshot_task is None and CATALOGUE_SNAPSHOT_REFRESH_SECONDS > 0:
+        _catalogue_snapshot_task = asyncio.create_task(
+            _catalogue_snapshot.run(CATALOGUE_SNAPSHOT_REFRESH_SECONDS)
+        )
+
+
+@app.on_event("shutdown")
+async def _stop_catalogue_snapshot() -> None:
+    global _catalogue_snapshot_task
+    if _catalogue_snapshot_task is not None:
+        _catalogue_snapshot_task.cancel()
+        _catalogue_snapshot_task = None
+
+
+_upstream_probe_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def _start_upstream_probes() -> None:
+    global _upstream_probe_task
+    if _upstream_probe_task is None and UPSTREAM_HEALTH_PROBE_SECONDS > 0:
+        _upstream_probe_task = asyncio.create_task(
+            upstream_clients.run_health_probes(UPSTREAM_HEALTH_PROBE_SECONDS)
+        )
+
+
+@app.on_event("shutdown")
+async def _stop_upstream_probes() -> None:
+    global _upstream_probe_task
+    if _upstream_probe_task is not None:
+        _upstream_probe_task.cancel()
+        _upstream_probe_task = None
+
+
+_serpapi_ledger_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def _start_serpapi_ledger() -> None:
+    global _serpapi_ledger_task
+    if _serpapi_ledger_task is None and SERPAPI_LEDGER_FLUSH_SECONDS > 0:
+        _serpapi_ledger_task = asyncio.create_task(
+            serpapi_budget.run_flusher(SERPAPI_LEDGER_FLUSH_SECONDS)
+        )
+
+
+@app.on_event("shutdown")
+async def _stop_serpapi_ledger() -> None:
+    global _serpapi_ledger_task
+    if _serpapi_ledger_task is not None:
+        _serpapi_ledger_task.cancel()
+        _serpapi_ledger_task = None
+    serpapi_budget.flush()
+
+
 @app.get("/products")
-def list_products(
+async def list_products(
     search: Optional[str] = Query(None, description="Recherche nom ou marque"),
     page: int = Query(1, ge=1),
     per_page: int = Query(24, ge=1, le=60),
@@ -2927,45 +3841,62 @@ def list_products(
     in_stock: Optional[bool] = Query(None),
     category: Optional[str] = Query(None),
     sort: Optional[str] = Query("price_asc"),
+    response: Response = None,
 ):
-    products = fetch_scraper_products()
-    serp_catalogue: List[Dict[str, Any]] = []
-    using_serp_catalogue = False
-
-    if not products:
-        using_serp_catalogue = True
-        normalized_query = (search or "whey protein").strip() or "whey protein"
-        serp_brand = brands[0] if brands and len(brands) == 1 else None
-        serp_limit = min(60, max(per_page * max(page, 1), per_page * 2))
-        serp_catalogue = build_serp_catalogue(
-            normalized_query,
-            limit=serp_limit,
-            marque=serp_brand,
-            categorie=category,
-        )
-    else:
+    sort_key = (sort or "price_asc").lower()
+    snapshot = _catalogue_snapshot.current if CATALOGUE_SNAPSHOT_REFRESH_SECONDS > 0 else None
+    # Ensemble des marques, comme la clé du cache (``brands=a&brands=A`` = ``brands=a``).
+    brand_values = sorted({value.lower() for value in brands or () if value})
+
+    enriched_products: Sequence[Dict[str, Any]]
+    presorted = False
+    # Aperçu -> produit brut, pour les aperçus à enrichir avant de répondre.
+    page_products: Dict[int, Dict[str, Any]] = {}
+    if snapshot is not None:
+        # Already enriched and ordered in the background: only filter and slice.
+        enriched_products = snapshot.ordered(sort_key, "price_asc")
+        presorted = True
         if search:
-            products = [
-                product
-                for product in products
-                if matches_query(product.get("name") or "", search)
-                or matches_query(product.get("brand") or "", search)
-            ]
+            search_match = _query_matcher(search)
+            enriched_products = [item for item in enriched_products if search_match(item)]
+    else:
+        products = await fetch_scraper_products()
+        if not products:
+            normalized_query = (search or "whey protein").strip() or "whey protein"
+            serp_brand = brand_values[0] if len(brand_values) == 1 else None
+            serp_limit = min(60, max(per_page * max(page, 1), per_page * 2))
+            enriched_products = await build_serp_catalogue(
+                normalized_query,
+                limit=serp_limit,
+                marque=serp_brand,
+                categorie=category,
+            )
+        else:
+            if search:
+                search_match = _query_matcher(search)
+                products = [product for product in products if search_match(product)]
+            # Phase 1 : aperçus construits sur les seules offres du scraper
+            # (un appel par lot, aucun appel SerpAPI) pour filtrer et trier ;
+            # la page retenue est enrichie complètement plus bas.
+            details = await fetch_scraper_products_with_offers(
+                product.get("id") for product in products
+            )
+            enriched_products = list(
+                await asyncio.gather(
+                    *(
+                        build_product_summary(product, details=details, include_serp=False)
+                        for product in products
+                    )
+                )
+            )
+            page_products = {
+                id(preview): product for preview, product in zip(enriched_products, products)
+            }
 
-    brand_filter: Optional[set[str]] = None
-    if brands:
-        brand_filter = {value.lower() for value in brands if value}
+    brand_filter: Optional[set[str]] = set(brand_values) or None
 
     category_filter = category.lower() if category else None
 
-    enriched_products: List[Dict[str, Any]]
-    if using_serp_catalogue:
-        enriched_products = serp_catalogue
-    else:
-        enriched_products = [
-            build_product_summary(product) for product in products
-        ]
-
     def price_in_range(item: Dict[str, Any]) -> bool:
         best_price = item.get("bestPrice") or {}
         amount = best_price.get("amount")
@@ -2981,66 +3912,32 @@ def list_products(
             return False
         return True
 
-    filtered = []
-    for item in enriched_products:
+    def matches_filters(item: Dict[str, Any]) -> bool:
         if brand_filter and (item.get("brand") or "").lower() not in brand_filter:
-            continue
+            return False
         if category_filter:
             product_category = (item.get("category") or "").lower()
             if category_filter not in product_category:
-                continue
+                return False
         if not price_in_range(item):
-            continue
+            return False
         if min_rating is not None:
             rating = item.get("rating")
             if rating is None or rating < min_rating:
-                continue
+                return False
         if in_stock is not None:
             available = item.get("inStock")
             if available is None:
                 if in_stock:
-                    continue
+                    return False
             elif available != in_stock:
-                continue
-        filtered.append(item)
+                return False
+        return True
 
-    def best_price_amount(value: Dict[str, Any]) -> Optional[float]:
-        amount = value.get("bestPrice", {}).get("amount")
-        if amount is None:
-            return None
-        try:
-            return float(amount)
-        except (TypeError, ValueError):
-            return None
+    filtered = [item for item in enriched_products if matches_filters(item)]
 
-    sort_key = (sort or "price_asc").lower()
-    if sort_key == "price_desc":
-        filtered.sort(
-            key=lambda item: (
-                best_price_amount(item)
-                if best_price_amount(item) is not None
-                else -float("inf")
-            ),
-            reverse=True,
-        )
-    elif sort_key == "rating":
-        filtered.sort(
-            key=lambda item: (item.get("rating") or 0.0),
-            reverse=True,
-        )
-    elif sort_key == "protein_ratio":
-        filtered.sort(
-            key=lambda item: (item.get("proteinPerEuro") or 0.0),
-            reverse=True,
-        )
-    else:  # default price ascending
-        filtered.sort(
-            key=lambda item: (
-                best_price_amount(item)
-                if best_price_amount(item) is not None
-                else float("inf")
-            )
-        )
+    if not presorted:
+        filtered = _sort_catalogue(filtered, sort_key)
 
     total = len(filtered)
     total_pages = max(1, (total + per_page - 1) // per_page)
@@ -3049,6 +3946,29 @@ def list_products(
     end = start + per_page
     paginated = filtered[start:end]
 
+    if page_products:
+        # Phase 2 : enrichissement complet (offres SerpAPI) de la seule page.
+        semaphore = asyncio.Semaphore(CATALOGUE_SNAPSHOT_CONCURRENCY)
+
+        async def enrich(preview: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await build_product_summary(page_products[id(preview)], details=details)
+
+        paginated = list(await asyncio.gather(*(enrich(item) for item in paginated)))
+        # Les offres SerpAPI peuvent changer prix et disponibilité : la page
+        # respecte les filtres et le tri demandés, quitte à être plus courte.
+        paginated = _sort_catalogue(
+            [item for item in paginated if matches_filters(item)], sort_key
+        )
+
+    if response is not None:
+        # Lets a purge of one product drop the listing pages showing it.
+        product_tags = [f"product:{item['id']}" for item in paginated if item.get("id")]
+        if product_tags:
+            response.headers["Cache-Tag"] = ",".join(product_tags)
+        if snapshot is not None:
+            response.headers["X-Catalogue-Version"] = str(snapshot.version)
+
     return {
         "products": paginated,
         "pagination": {
@@ -3172,7 +4092,7 @@ def build_cached_serp_product_detail(
     }
 
 
-def build_serp_product_detail(
+async def build_serp_product_detail(
     product_identifier: str, *, limit: int = 10
 ) -> Optional[Dict[str, Any]]:
     lookup = find_product_by_id(product_identifier)
@@ -3189,7 +4109,7 @@ def build_serp_product_detail(
             serp_product = cached_candidate
 
     if serp_product is None:
-        serp_product = serpapi_product_offers(product_identifier)
+        serp_product = await serpapi_product_offers(product_identifier)
         if not isinstance(serp_product, dict) or not serp_product or serp_product.get("error"):
             fallback = build_cached_serp_product_detail(product_identifier, limit=limit)
             if fallback:
@@ -3339,7 +4259,7 @@ def build_serp_product_detail(
                 )
             )
 
-    extra_deals = collect_serp_deals(title, marque=brand, limit=limit)
+    extra_deals = await collect_serp_deals(title, marque=brand, limit=limit)
     if extra_deals:
         offers.extend(extra_deals)
 
@@ -3422,7 +4342,7 @@ def build_serp_product_detail(
 
 
 @app.get("/products/{product_id}/offers")
-def product_offers_endpoint(
+async def product_offers_endpoint(
     product_id: str,
     limit: int = Query(10, ge=1, le=24),
 ):
@@ -3432,11 +4352,11 @@ def product_offers_endpoint(
     except (TypeError, ValueError):
         numeric_id = None
 
-    detail = fetch_scraper_product_with_offers(numeric_id) if numeric_id is not None else None
+    detail = await fetch_scraper_product_with_offers(numeric_id) if numeric_id is not None else None
 
     if detail:
         product_payload = serialize_product(detail)
-        aggregated = aggregate_offers_for_product(detail, limit=limit)
+        aggregated = await aggregate_offers_for_product(detail, limit=limit)
         scraper_offers = detail.get("offers")
         if not isinstance(scraper_offers, list):
             scraper_offers = []
@@ -3449,7 +4369,7 @@ def product_offers_endpoint(
             },
         }
 
-    serp_detail = build_serp_product_detail(str(product_id), limit=limit)
+    serp_detail = await build_serp_product_detail(str(product_id), limit=limit)
     if serp_detail:
         return serp_detail
 
@@ -3457,11 +4377,11 @@ def product_offers_endpoint(
 
 
 @app.get("/products/{product_id}/similar")
-def similar_products_endpoint(
+async def similar_products_endpoint(
     product_id: int,
     limit: int = Query(4, ge=1, le=12),
 ):
-    similar = _resolve_similar_products(product_id, limit)
+    similar = await _resolve_similar_products(product_id, limit)
     return {
         "productId": product_id,
         "similar": similar,
@@ -3469,11 +4389,11 @@ def similar_products_endpoint(
 
 
 @app.get("/products/{product_id}/related")
-def related_products_endpoint(
+async def related_products_endpoint(
     product_id: int,
     limit: int = Query(4, ge=1, le=12),
 ):
-    related = _resolve_similar_products(product_id, limit)
+    related = await _resolve_similar_products(product_id, limit)
     if not related:
         raise HTTPException(status_code=404, detail="Produit introuvable")
 
@@ -3481,7 +4401,7 @@ def related_products_endpoint(
 
 
 @app.get("/products/{product_id}/price-history")
-def product_price_history_endpoint(
+async def product_price_history_endpoint(
     product_id: int,
     period: Optional[str] = Query("3m", description="Période 7d/1m/3m/6m/1y/all"),
 ):
@@ -3496,7 +4416,7 @@ def product_price_history_endpoint(
         start_dt = end_dt - delta
         start_iso = isoformat_utc(start_dt)
 
-    history_entries = fetch_scraper_price_history(
+    history_entries = await fetch_scraper_price_history(
         product_id,
         start_date=start_iso,
     )
@@ -3547,8 +4467,8 @@ def product_price_history_endpoint(
 
 
 @app.get("/products/{product_id}/reviews")
-def product_reviews_endpoint(product_id: int):
-    product = _resolve_product_for_reviews(product_id)
+async def product_reviews_endpoint(product_id: int):
+    product = await _resolve_product_for_reviews(product_id)
     average_rating: Optional[float]
     reviews_count: int
 
@@ -3571,7 +4491,7 @@ def product_reviews_endpoint(product_id: int):
 
 
 @app.get("/comparison")
-def comparison_endpoint(
+async def comparison_endpoint(
     ids: str = Query(..., description="Identifiants produit séparés par des virgules"),
     limit: int = Query(10, ge=1, le=24),
 ):
@@ -3591,13 +4511,14 @@ def comparison_endpoint(
     products_payload: List[Dict[str, Any]] = []
     summary: List[Dict[str, Any]] = []
 
+    details = await fetch_scraper_products_with_offers(id_values)
     for product_id in id_values:
-        detail = fetch_scraper_product_with_offers(product_id)
+        detail = details.get(product_id)
         if not detail:
             continue
 
         product_payload = serialize_product(detail)
-        aggregated = aggregate_offers_for_product(detail, limit=limit)
+        aggregated = await aggregate_offers_for_product(detail, limit=limit)
 
         products_payload.append({
             "product": product_payload,
@@ -0,0 +1,198 @@
+"""Versioned in-memory snapshot of the enriched product catalogue.
+
+Building the ``/products`` listing means fetching the scraper catalogue and
+enriching every product with its offers and SerpAPI deals. The snapshot does
+that work in the background and keeps the result, already ordered for every
+supported sort, so requests only filter and slice an in-memory list.
+
+A refresh builds a complete new :class:`CatalogueSnapshot` and swaps the
+reference in one assignment: readers either see the previous version or the
+new one, never a half-built catalogue. The version only changes when the
+content does, and :meth:`CatalogueSnapshot.changes_since` tells which
+products did.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+Product = Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class CatalogueSnapshot:
+    version: int
+    fingerprint: str
+    built_at: float
+    products: Tuple[Product, ...]
+    orderings: Mapping[str, Tuple[Product, ...]] = field(default_factory=dict)
+    # Digest of each product, in ``products`` order.
+    digests: Tuple[str, ...] = ()
+
+    def ordered(self, sort_key: str, default: str) -> Tuple[Product, ...]:
+        """Products in ``sort_key`` order (``default`` order for unknown keys)."""
+
+        ordering = self.orderings.get(sort_key)
+        if ordering is None:
+            ordering = self.orderings.get(default, self.products)
+        return ordering
+
+    def changes_since(self, previous: "CatalogueSnapshot") -> Tuple[bool, List[Any]]:
+        """Compare with ``previous``: (product set changed, ids of modified products)."""
+
+        before = _digests_by_id(previous)
+        after = _digests_by_id(self)
+        if before is None or after is None or before.keys() != after.keys():
+            return True, []
+        return False, sorted(
+            (key for key, digest in after.items() if before[key] != digest), key=str
+        )
+
+
+class CatalogueSnapshotStore:
+    """Holds the current :class:`CatalogueSnapshot` and refreshes it.
+
+    ``builder`` returns the enriched product list; an empty list or an
+    exception keeps the previous snapshot (an unreachable scraper must not
+    wipe the catalogue). ``sorter(products, sort_key)`` returns the products
+    in the order served for ``sort_key``; each key in ``sort_keys`` is
+    precomputed at build time. ``on_change(snapshot, previous)`` is awaited
+    after a new version is published (``previous`` is ``None`` for the first).
+    """
+
+    def __init__(
+        self,
+        *,
+        builder: Callable[[], Awaitable[List[Product]]],
+        sorter: Callable[[List[Product], str], List[Product]],
+        sort_keys: Sequence[str],
+        on_change: Optional[
+            Callable[["CatalogueSnapshot", Optional["CatalogueSnapshot"]], Awaitable[Any]]
+        ] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.builder = builder
+        self.sorter = sorter
+        self.sort_keys = tuple(sort_keys)
+        self.on_change = on_change
+        self.clock = clock
+        self._current: Optional[CatalogueSnapshot] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.swaps = 0
+        self.failures = 0
+        self.last_refresh_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+
+    @property
+    def current(self) -> Optional[CatalogueSnapshot]:
+        return self._current
+
+    async def refresh(self) -> bool:
+        """Rebuild the catalogue, publishing it if it changed.
+
+        Concurrent callers share the refresh already in progress.
+        """
+
+        task = self._refreshing
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._refresh())
+            self._refreshing = task
+        return await asyncio.shield(task)
+
+    def request_refresh(self) -> None:
+        """Schedule a refresh without waiting for it (no-op if one is running)."""
+
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+
+    async def run(self, interval: float) -> None:
+        """Refresh now, then every ``interval`` seconds until cancelled."""
+
+        delay = max(float(interval), 1.0)
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - counted in _refresh
+                pass
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._current
+        return {
+            "catalogueVersion": snapshot.version if snapshot else None,
+            "catalogueProducts": len(snapshot.products) if snapshot else 0,
+            "catalogueBuiltAt": snapshot.built_at if snapshot else None,
+            "catalogueRefreshes": self.refreshes,
+            "catalogueSwaps": self.swaps,
+            "catalogueRefreshFailures": self.failures,
+            "catalogueLastRefreshSeconds": self.last_duration,
+        }
+
+    async def _refresh(self) -> bool:
+        started = time.perf_counter()
+        self.refreshes += 1
+        try:
+            products = await self.builder()
+        except Exception:
+            self.failures += 1
+            return False
+        finally:
+            self.last_refresh_at = self.clock()
+            self.last_duration = round(time.perf_counter() - started, 3)
+
+        if not products:
+            self.failures += 1
+            return False
+
+        digests = tuple(_digest(product) for product in products)
+        fingerprint = hashlib.sha1("".join(digests).encode("ascii")).hexdigest()
+        previous = self._current
+        if previous is not None and previous.fingerprint == fingerprint:
+            return False
+
+        products = list(products)
+        snapshot = CatalogueSnapshot(
+            version=(previous.version + 1) if previous else 1,
+            fingerprint=fingerprint,
+            built_at=self.clock(),
+            products=tuple(products),
+            orderings={key: tuple(self.sorter(products, key)) for key in self.sort_keys},
+            digests=digests,
+        )
+        self._current = snapshot
+        self.swaps += 1
+        if self.on_change is not None:
+            try:
+                await self.on_change(snapshot, previous)
+            except Exception:
+                pass
+        return True
+
+
+def _digest(product: Product) -> str:
+    payload = json.dumps(product, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _digests_by_id(snapshot: CatalogueSnapshot) -> Optional[Dict[Any, str]]:
+    """``id -> digest``, or ``None`` when products cannot be told apart by id."""
+
+    digests: Dict[Any, str] = {}
+    for product, digest in zip(snapshot.products, snapshot.digests):
+        key = product.get("id")
+        if key is None or key in digests:
+            return None
+        digests[key] = digest
+    if len(digests) != len(snapshot.products):
+        return None
+    return digests
+
+
+__all__ = ["CatalogueSnapshot", "CatalogueSnapshotStore"]
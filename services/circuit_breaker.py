@@ -0,0 +1,173 @@
+"""Circuit breakers for the upstream HTTP clients.
+
+A :class:`CircuitBreaker` counts consecutive failures of one upstream
+(transport errors, 5xx and 429 responses). Past ``failure_threshold`` it
+*opens*: requests fail immediately with :class:`CircuitOpenError` instead of
+waiting for a timeout, so callers go straight to their fallback. After
+``reset_timeout`` seconds it turns *half-open* and lets a single trial
+request through (a health probe or a regular call): success closes the
+circuit, failure opens it again.
+
+:class:`CircuitBreakerTransport` applies a breaker to every request of an
+``httpx.AsyncClient``. :class:`CircuitOpenError` is an
+``httpx.TransportError``, so the existing ``except httpx.HTTPError`` (or
+broader) handlers already treat an open circuit as an unreachable upstream.
+"""
+from __future__ import annotations
+
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = max(float(reset_timeout), 0.0)
+        self._clock = clock
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+        self.last_failure: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def available(self) -> bool:
+        """``False`` while requests would be rejected."""
+
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and not self._trial_in_flight)
+
+    def before_request(self) -> None:
+        """Admit a request or raise :class:`CircuitOpenError`."""
+
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._state = HALF_OPEN
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"Circuit {self.name} ouvert")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.last_failure = reason
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self.opened += 1
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Free the half-open trial slot of a request that got no outcome."""
+
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == OPEN and self._opened_at is not None:
+                retry_in = round(max(self._opened_at + self.reset_timeout - self._clock(), 0.0), 1)
+            return {
+                "state": state,
+                "consecutiveFailures": self._failures,
+                "failureThreshold": self.failure_threshold,
+                "resetTimeoutSeconds": self.reset_timeout,
+                "retryInSeconds": retry_in,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "lastFailure": self.last_failure,
+            }
+
+    def _current_state(self) -> str:
+        if (
+            self._state == OPEN
+            and self._opened_at is not None
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            return HALF_OPEN
+        return self._state
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """``httpx`` transport sending requests through a :class:`CircuitBreaker`."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker) -> None:
+        self.transport = transport
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError as exc:
+            exc.request = request
+            raise
+
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError as exc:
+            self.breaker.record_failure(type(exc).__name__)
+            raise
+        except BaseException:
+            # Cancelled (e.g. by a request deadline): no verdict on the upstream.
+            self.breaker.release()
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+__all__ = [
+    "CLOSED",
+    "HALF_OPEN",
+    "OPEN",
+    "CircuitBreaker",
+    "CircuitBreakerTransport",
+    "CircuitOpenError",
+]
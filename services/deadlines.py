@@ -0,0 +1,194 @@
+"""Per-request deadlines shared by every upstream call of a request.
+
+:class:`DeadlineMiddleware` gives each request a time budget (per route,
+overridable with a request header) and stores it in a context variable, so
+the helpers called by the handler, and the tasks they spawn, see the same
+deadline without passing it around. Upstream calls go through
+:func:`within_deadline`, which bounds them by the *remaining* budget instead
+of their own fixed timeout and raises :class:`DeadlineExceeded` once the
+budget is spent.
+
+A request that lost data to its deadline is flagged partial: the response
+gets ``X-Partial-Response: deadline`` and ``Cache-Control: no-store``, so an
+incomplete answer is never stored by the response cache.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+PARTIAL_HEADER = b"x-partial-response"
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget was spent before the call could complete."""
+
+
+@dataclass
+class RequestDeadline:
+    expires_at: float
+    partial: bool = False
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+_current: ContextVar[Optional[RequestDeadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[RequestDeadline]:
+    return _current.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left for the current request (``None`` without a deadline)."""
+
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def mark_partial() -> None:
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.partial = True
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[Optional[RequestDeadline]]:
+    """Run the block under a deadline ``seconds`` from now (``None``: no deadline).
+
+    A deadline already in force is never extended.
+    """
+
+    if seconds is None:
+        yield _current.get()
+        return
+    expires_at = time.monotonic() + max(float(seconds), 0.0)
+    outer = _current.get()
+    if outer is not None and outer.expires_at <= expires_at:
+        yield outer
+        return
+    deadline = RequestDeadline(expires_at)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+        if outer is not None and deadline.partial:
+            outer.partial = True
+
+
+@contextmanager
+def no_deadline() -> Iterator[None]:
+    """Detach the block (e.g. background work started by a request) from its deadline."""
+
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable`` for at most the remaining budget of the request.
+
+    Raises :class:`DeadlineExceeded` (and flags the request partial) when
+    the budget is spent before or while waiting.
+    """
+
+    remaining = remaining_seconds()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        mark_partial()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        mark_partial()
+        raise DeadlineExceeded() from None
+
+
+class DeadlineMiddleware:
+    """ASGI middleware setting the deadline of each HTTP request.
+
+    ``deadline_for(path)`` returns the route's budget in seconds (``None``:
+    no deadline). A valid ``header`` value (seconds) overrides it, capped at
+    ``max_seconds``.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        *,
+        deadline_for: Callable[[str], Optional[float]],
+        header: str = "x-request-timeout",
+        max_seconds: float = 60.0,
+    ) -> None:
+        self.app = app
+        self.deadline_for = deadline_for
+        self.header = header.lower().encode("latin-1")
+        self.max_seconds = max(float(max_seconds), 0.0)
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+
+        seconds = self._override(scope)
+        if seconds is None:
+            seconds = self.deadline_for(scope.get("path", ""))
+
+        with request_deadline(seconds) as deadline:
+
+            async def send_flagged(message: Any) -> None:
+                if (
+                    message.get("type") == "http.response.start"
+                    and deadline is not None
+                    and deadline.partial
+                ):
+                    headers = [
+                        (name, value)
+                        for name, value in message.get("headers", [])
+                        if name.lower() != b"cache-control"
+                    ]
+                    headers.append((b"cache-control", b"no-store"))
+                    headers.append((PARTIAL_HEADER, b"deadline"))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_flagged)
+
+    def _override(self, scope: Any) -> Optional[float]:
+        for name, value in scope.get("headers", []):
+            if name.lower() != self.header:
+                continue
+            try:
+                seconds = float(value.decode("latin-1").strip())
+            except (UnicodeDecodeError, ValueError):
+                return None
+            if seconds <= 0:
+                return None
+            return min(seconds, self.max_seconds)
+        return None
+
+
+__all__ = [
+    "DeadlineExceeded",
+    "DeadlineMiddleware",
+    "RequestDeadline",
+    "current_deadline",
+    "mark_partial",
+    "no_deadline",
+    "remaining_seconds",
+    "request_deadline",
+    "within_deadline",
+]
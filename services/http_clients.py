@@ -0,0 +1,193 @@
+"""Application-wide pooled HTTP clients, one per upstream service.
+
+An upstream registered with ``failure_threshold > 0`` gets a
+:class:`~services.circuit_breaker.CircuitBreaker` applied to every request
+of its client; :meth:`UpstreamClients.run_health_probes` sends its
+``probe_url`` as the half-open trial request so a recovered upstream is
+detected without waiting for user traffic.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from services.circuit_breaker import HALF_OPEN, CircuitBreaker, CircuitBreakerTransport
+
+# HTTP/2 needs the optional ``h2`` package (``pip install httpx[http2]``).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    base_url: str = ""
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Consecutive failures opening the circuit (0 = no circuit breaker).
+    failure_threshold: int = 0
+    reset_timeout: float = 30.0
+    # Cheap GET (path or absolute URL) used as health probe while half-open.
+    probe_url: Optional[str] = None
+
+
+class UpstreamClients:
+    """Registry of keep-alive ``httpx.AsyncClient`` instances.
+
+    Clients are opened on application startup (:meth:`start`) and closed on
+    shutdown (:meth:`aclose`). :meth:`get` also opens them lazily, and opens
+    a fresh one when called from another event loop than the one the client
+    was created on (test clients, scripts using ``asyncio.run``), since
+    pooled connections cannot cross loops. The client it replaces is closed
+    on its own loop while that loop runs, otherwise from the calling loop, or
+    by :meth:`aclose` when :meth:`get` is called outside any loop.
+    """
+
+    def __init__(self) -> None:
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, Optional[asyncio.AbstractEventLoop]]] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Replaced clients awaiting :meth:`aclose`, and closings in flight.
+        self._retired: List[httpx.AsyncClient] = []
+        self._closing: Set["asyncio.Task[None]"] = set()
+
+    def register(self, name: str, **options: Any) -> None:
+        config = UpstreamConfig(**options)
+        self._configs[name] = config
+        if config.failure_threshold > 0:
+            self._breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=config.failure_threshold,
+                reset_timeout=config.reset_timeout,
+            )
+        else:
+            self._breakers.pop(name, None)
+
+    def breaker(self, name: str) -> Optional[CircuitBreaker]:
+        return self._breakers.get(name)
+
+    def available(self, name: str) -> bool:
+        """``False`` while the circuit of ``name`` rejects requests."""
+
+        breaker = self._breakers.get(name)
+        return breaker is None or breaker.available()
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        try:
+            loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        current = self._clients.get(name)
+        if current is not None and not current[0].is_closed and current[1] is loop:
+            return current[0]
+        client = self._build(self._configs[name], self._breakers.get(name))
+        self._clients[name] = (client, loop)
+        if current is not None:
+            self._retire(current[0], current[1], loop)
+        return client
+
+    def _retire(
+        self,
+        client: httpx.AsyncClient,
+        owner: Optional[asyncio.AbstractEventLoop],
+        loop: Optional[asyncio.AbstractEventLoop],
+    ) -> None:
+        """Close ``client``, replaced by a client bound to ``loop``."""
+
+        if client.is_closed:
+            return
+        if owner is not None and owner.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_quietly(client), owner)
+        elif loop is not None:
+            closing = loop.create_task(self._close_quietly(client))
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+        else:
+            self._retired.append(client)
+
+    @staticmethod
+    async def _close_quietly(client: httpx.AsyncClient) -> None:
+        try:
+            await client.aclose()
+        except Exception:
+            # Connections opened on a closed loop cannot be shut down cleanly;
+            # marking the client closed is all that is left to do.
+            pass
+
+    async def start(self) -> None:
+        for name in self._configs:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        retired, self._retired = self._retired, []
+        for client, _ in clients.values():
+            await client.aclose()
+        for client in retired:
+            await self._close_quietly(client)
+
+    async def probe(self, name: str) -> None:
+        """Send the health probe of ``name`` if its circuit awaits a trial."""
+
+        config = self._configs.get(name)
+        breaker = self._breakers.get(name)
+        if config is None or breaker is None or not config.probe_url:
+            return
+        if breaker.state != HALF_OPEN or not breaker.available():
+            return
+        try:
+            await self.get(name).get(config.probe_url)
+        except httpx.HTTPError:
+            # The breaker recorded the failure and stays open.
+            pass
+
+    async def run_health_probes(self, interval: float) -> None:
+        """Probe the half-open upstreams every ``interval`` seconds until cancelled."""
+
+        delay = max(float(interval), 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            await asyncio.gather(*(self.probe(name) for name in list(self._breakers)))
+
+    def breaker_stats(self) -> Dict[str, Any]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "open": sorted(name for name, (client, _) in self._clients.items() if not client.is_closed),
+        }
+
+    @staticmethod
+    def _build(config: UpstreamConfig, breaker: Optional[CircuitBreaker] = None) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        transport: Optional[httpx.AsyncBaseTransport] = None
+        if breaker is not None:
+            # A custom transport takes over the pool limits and HTTP/2 setting.
+            transport = CircuitBreakerTransport(
+                httpx.AsyncHTTPTransport(limits=limits, http2=HTTP2_AVAILABLE),
+                breaker,
+            )
+        return httpx.AsyncClient(
+            base_url=config.base_url,
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=limits,
+            headers=config.headers,
+            http2=HTTP2_AVAILABLE,
+            transport=transport,
+        )
+
+
+upstream_clients = UpstreamClients()
+
+__all__ = ["HTTP2_AVAILABLE", "UpstreamClients", "UpstreamConfig", "upstream_clients"]
@@ -1,14 +1,30 @@
-"""Simple JSON-backed cache to avoid repeated external requests."""
+"""Simple SQLite-backed cache to avoid repeated external requests."""
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+import sqlite3
+import time
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from collections import OrderedDict
 from threading import Lock
 from typing import Any, Dict, Optional
 
+try:  # Optional: entries are only shared between workers when redis-py is installed.
+    import redis
+    from redis import asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - depends on the environment
+    redis = None
+    redis_asyncio = None
+
 BASE_DIR = Path(__file__).resolve().parents[1]
-CACHE_PATH = BASE_DIR / "data" / "local_cache.json"
+CACHE_PATH = BASE_DIR / "data" / "local_cache.sqlite3"
+# Former whole-file JSON store, imported once into a new database.
+LEGACY_CACHE_PATH = BASE_DIR / "data" / "local_cache.json"
+
+_SCHEMA_VERSION = 1
 
 
 def _ensure_parent(path: Path) -> None:
@@ -17,84 +33,268 @@ def _ensure_parent(path: Path) -> None:
 
 
 class LocalCache:
-    """Very small helper used to persist API responses locally."""
+    """Very small helper used to persist API responses locally.
+
+    Entries live in a SQLite database in WAL mode, one row per key: a write
+    touches only its own row and opening the cache reads nothing but the
+    schema. Values read or written by this process are also kept decoded in
+    memory, up to ``memory_entries`` least recently used ones. A
+    ``legacy_path`` JSON file (the previous storage format) is imported when
+    the database is created.
+
+    When a Redis client is given, entries are also written there with the
+    same TTL and read back on local misses, so every worker reuses the
+    upstream calls made by the others. :meth:`get`/:meth:`set` use the
+    blocking ``redis_client`` and are meant for synchronous code (threads);
+    coroutines use :meth:`aget`/:meth:`aset`, which run the SQLite work in a
+    thread and await ``async_redis_client`` for at most ``redis_timeout``
+    seconds, so they never block the event loop.
+    """
 
-    def __init__(self, path: Path, *, default_ttl: int = 3600) -> None:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        default_ttl: int = 3600,
+        redis_client: Any = None,
+        async_redis_client: Any = None,
+        redis_prefix: str = "fitidion:local:",
+        redis_timeout: float = 0.5,
+        memory_entries: int = 1024,
+        legacy_path: Optional[Path] = None,
+    ) -> None:
         self.path = path
         self.default_ttl = max(int(default_ttl), 0)
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.redis_prefix = redis_prefix
+        self.redis_timeout = max(float(redis_timeout), 0.0)
+        self.memory_entries = max(int(memory_entries), 0)
         self._lock = Lock()
-        self._data: Dict[str, Dict[str, Any]] = {}
-        self._load()
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._open(legacy_path)
 
-    def _load(self) -> None:
-        if not self.path.exists():
-            self._data = {}
+    def _open(self, legacy_path: Optional[Path]) -> None:
+        _ensure_parent(self.path)
+        db: Optional[sqlite3.Connection] = None
+        try:
+            db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version < _SCHEMA_VERSION:
+                if legacy_path is not None:
+                    self._import_legacy(db, legacy_path)
+                db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error:
+            # Unusable database file: keep the cache in memory only.
+            if db is not None:
+                db.close()
+            self._db = None
             return
+        self._db = db
 
+    @staticmethod
+    def _import_legacy(db: sqlite3.Connection, legacy_path: Path) -> None:
+        if not legacy_path.exists():
+            return
         try:
-            raw = json.loads(self.path.read_text(encoding="utf-8"))
+            raw = json.loads(legacy_path.read_text(encoding="utf-8"))
         except (OSError, json.JSONDecodeError):
-            self._data = {}
+            return
+        if not isinstance(raw, dict):
             return
 
-        now = datetime.now(timezone.utc)
-        data: Dict[str, Dict[str, Any]] = {}
+        rows = []
         for key, payload in raw.items():
             if not isinstance(payload, dict):
                 continue
             expires_at = payload.get("expires_at")
-            value = payload.get("value")
-            if expires_at is None:
-                data[key] = {"value": value, "expires_at": None}
-                continue
-            try:
-                expiry = datetime.fromisoformat(expires_at)
-            except (TypeError, ValueError):
-                continue
-            if expiry <= now:
-                continue
-            data[key] = {"value": value, "expires_at": expiry}
-        self._data = data
+            if expires_at is not None:
+                try:
+                    expires_at = datetime.fromisoformat(expires_at).timestamp()
+                except (TypeError, ValueError):
+                    continue
+            rows.append((key, json.dumps(payload.get("value"), ensure_ascii=False), expires_at))
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT OR IGNORE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                rows,
+            )
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            db.execute("ROLLBACK")
+            raise
 
-    def _serialize(self) -> Dict[str, Dict[str, Any]]:
-        serializable: Dict[str, Dict[str, Any]] = {}
-        for key, payload in self._data.items():
-            if not isinstance(payload, dict):
-                continue
-            expires_at = payload.get("expires_at")
-            value = payload.get("value")
-            if isinstance(expires_at, datetime):
-                expires_at = expires_at.isoformat()
-            serializable[key] = {"value": value, "expires_at": expires_at}
-        return serializable
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
 
-    def _persist(self) -> None:
-        _ensure_parent(self.path)
+    def _remember(self, key: str, payload: Dict[str, Any]) -> None:
+        self._data[key] = payload
+        self._data.move_to_end(key)
+        while len(self._data) > self.memory_entries:
+            self._data.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        payload = self._data.get(key)
+        if payload is not None:
+            self._data.move_to_end(key)
+            return payload
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
         try:
-            self.path.write_text(
-                json.dumps(self._serialize(), ensure_ascii=False, indent=2),
-                encoding="utf-8",
+            value = json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+        expires_at = (
+            datetime.fromtimestamp(row[1], tz=timezone.utc) if row[1] is not None else None
+        )
+        payload = {"value": value, "expires_at": expires_at}
+        self._remember(key, payload)
+        return payload
+
+    def _write(self, key: str, value: Any, expires_at: Optional[datetime]) -> None:
+        self._remember(key, {"value": value, "expires_at": expires_at})
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (
+                    key,
+                    json.dumps(value, ensure_ascii=False),
+                    expires_at.timestamp() if expires_at is not None else None,
+                ),
             )
-        except OSError:
+        except (sqlite3.Error, TypeError, ValueError):
             # Ignore IO errors silently; cache misses will simply trigger new fetches.
             pass
 
-    def _now(self) -> datetime:
-        return datetime.now(timezone.utc)
+    def _delete(self, key: str) -> None:
+        self._data.pop(key, None)
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
 
     def get(self, key: str) -> Optional[Any]:
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        return self._get_shared(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """:meth:`get` for coroutines: SQLite runs in a thread, Redis is awaited."""
+
+        value = await asyncio.to_thread(self._get_local, key)
+        if value is not None:
+            return value
+        if self.async_redis_client is None:
+            return None
+        try:
+            pipeline = self.async_redis_client.pipeline()
+            pipeline.get(self.redis_prefix + key)
+            pipeline.pttl(self.redis_prefix + key)
+            raw, ttl_ms = await asyncio.wait_for(pipeline.execute(), self.redis_timeout)
+        except Exception:
+            # Redis is an optimisation: treat any failure (or a slow reply) as a miss.
+            return None
+        if raw is None:
+            return None
+        return await asyncio.to_thread(self._promote, key, raw, ttl_ms)
+
+    def _get_local(self, key: str) -> Optional[Any]:
         with self._lock:
-            payload = self._data.get(key)
-            if not payload:
-                return None
-            expires_at = payload.get("expires_at")
-            if isinstance(expires_at, datetime) and expires_at <= self._now():
-                self._data.pop(key, None)
-                self._persist()
-                return None
-            return payload.get("value")
+            payload = self._read(key)
+            if payload:
+                expires_at = payload.get("expires_at")
+                if not (isinstance(expires_at, datetime) and expires_at <= self._now()):
+                    return payload.get("value")
+                self._delete(key)
+        return None
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        if self.redis_client is None:
+            return None
+        try:
+            pipeline = self.redis_client.pipeline()
+            pipeline.get(self.redis_prefix + key)
+            pipeline.pttl(self.redis_prefix + key)
+            raw, ttl_ms = pipeline.execute()
+        except Exception:
+            # Redis is an optimisation: treat any failure as a miss.
+            return None
+        return self._promote(key, raw, ttl_ms)
+
+    def _promote(self, key: str, raw: Any, ttl_ms: Any) -> Optional[Any]:
+        """Keep a value read from Redis locally, with its remaining TTL."""
+
+        if raw is None:
+            return None
+        try:
+            value = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+
+        # Keep the remaining TTL so both tiers expire together.
+        expires_at: Optional[datetime] = None
+        if isinstance(ttl_ms, int) and ttl_ms > 0:
+            expires_at = self._now() + timedelta(milliseconds=ttl_ms)
+        with self._lock:
+            self._write(key, value, expires_at)
+        return value
 
     def set(self, key: str, value: Any, *, ttl: Optional[int] = None) -> None:
+        ttl_seconds = self._set_local(key, value, ttl)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(
+                self.redis_prefix + key,
+                json.dumps(value, ensure_ascii=False),
+                px=ttl_seconds * 1000 if ttl_seconds > 0 else None,
+            )
+        except Exception:
+            pass
+
+    async def aset(self, key: str, value: Any, *, ttl: Optional[int] = None) -> None:
+        """:meth:`set` for coroutines: SQLite runs in a thread, Redis is awaited."""
+
+        ttl_seconds = await asyncio.to_thread(self._set_local, key, value, ttl)
+        if self.async_redis_client is None:
+            return
+        try:
+            await asyncio.wait_for(
+                self.async_redis_client.set(
+                    self.redis_prefix + key,
+                    json.dumps(value, ensure_ascii=False),
+                    px=ttl_seconds * 1000 if ttl_seconds > 0 else None,
+                ),
+                self.redis_timeout,
+            )
+        except Exception:
+            pass
+
+    def _set_local(self, key: str, value: Any, ttl: Optional[int]) -> int:
+        """Store ``value`` in the local tier; returns the TTL in seconds (0: none)."""
+
         ttl_seconds = self.default_ttl if ttl is None else max(int(ttl), 0)
         expires_at: Optional[datetime]
         if ttl_seconds <= 0:
@@ -103,8 +303,8 @@ class LocalCache:
             expires_at = self._now() + timedelta(seconds=ttl_seconds)
 
         with self._lock:
-            self._data[key] = {"value": value, "expires_at": expires_at}
-            self._persist()
+            self._write(key, value, expires_at)
+        return ttl_seconds
 
     def get_or_set(self, key: str, factory, *, ttl: Optional[int] = None) -> Any:
         cached = self.get(key)
@@ -115,6 +315,19 @@ class LocalCache:
         return value
 
 
-local_cache = LocalCache(CACHE_PATH, default_ttl=60 * 60)
+def _redis_client_from_env(module: Any) -> Any:
+    url = os.getenv("API_CACHE_REDIS_URL", "").strip()
+    if module is None or not url:
+        return None
+    return module.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+local_cache = LocalCache(
+    CACHE_PATH,
+    default_ttl=60 * 60,
+    redis_client=_redis_client_from_env(redis),
+    async_redis_client=_redis_client_from_env(redis_asyncio),
+    legacy_path=LEGACY_CACHE_PATH,
+)
 
 __all__ = ["LocalCache", "local_cache"]
@@ -0,0 +1,101 @@
+"""Short-lived memory of failed upstream lookups, with exponential backoff.
+
+Only successful upstream payloads go to ``local_cache``, so a lookup that
+keeps failing (timeout, quota error, non-JSON reply) used to be retried on
+every request. :class:`NegativeCache` remembers the failure under the same
+key as the ``local_cache`` entry it stands in for: until the key's retry
+time, :meth:`get` returns the last error payload and callers skip the
+upstream call.
+
+The backoff window doubles with each consecutive failure of a key, from
+``base`` up to ``max_backoff`` seconds, and is jittered to between half and
+all of that window so keys that failed together are not all retried
+together. A success clears the key. A key that has not failed for
+``2 * max_backoff`` seconds starts again from ``base``.
+"""
+from __future__ import annotations
+
+import math
+import random
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# key -> (consecutive failures, retry at, failed at, error payload)
+Record = Tuple[int, float, float, Dict[str, Any]]
+
+
+class NegativeCache:
+    def __init__(
+        self,
+        *,
+        base: float = 30.0,
+        max_backoff: float = 15 * 60,
+        max_entries: int = 5000,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.base = max(float(base), 0.0)
+        self.max_backoff = max(float(max_backoff), self.base)
+        self.max_entries = max(int(max_entries), 1)
+        # Failures past this count all get ``max_backoff``; counting stops
+        # there so the exponent stays bounded however long a key keeps failing.
+        self._max_failures = 1
+        if self.base > 0:
+            self._max_failures += math.ceil(math.log2(self.max_backoff / self.base))
+        self._clock = clock
+        self._random = rng or random.Random()
+        self._lock = Lock()
+        self._records: "OrderedDict[str, Record]" = OrderedDict()
+        self._hits = 0
+        self._failures = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The error payload of ``key`` while its backoff window is open."""
+
+        record = self._records.get(key)
+        if record is None or self._clock() >= record[1]:
+            return None
+        self._hits += 1
+        return dict(record[3])
+
+    def record_failure(self, key: str, payload: Dict[str, Any]) -> float:
+        """Remember a failed lookup; returns the backoff delay in seconds."""
+
+        now = self._clock()
+        with self._lock:
+            previous = self._records.pop(key, None)
+            failures = 1
+            if previous is not None and now - previous[2] < 2 * self.max_backoff:
+                failures = min(previous[0] + 1, self._max_failures)
+            window = min(self.base * 2 ** (failures - 1), self.max_backoff)
+            delay = window * self._random.uniform(0.5, 1.0)
+            self._records[key] = (failures, now + delay, now, dict(payload))
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+            self._failures += 1
+        return delay
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = self._clock()
+        return {
+            "negativeEntries": len(self._records),
+            "negativeBlocked": sum(1 for record in list(self._records.values()) if now < record[1]),
+            "negativeHits": self._hits,
+            "negativeFailures": self._failures,
+        }
+
+
+__all__ = ["NegativeCache"]
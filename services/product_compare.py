@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import math
 import os
 import re
@@ -13,6 +14,12 @@ from urllib.parse import urlparse, quote
 import httpx
 from pydantic import BaseModel, Field
 
+from services.circuit_breaker import CircuitOpenError
+from services.deadlines import DeadlineExceeded, current_deadline, within_deadline
+from services.http_clients import upstream_clients
+from services.response_cache import mark_degraded, mark_upstream_failure, track_degradation
+from services.serpapi_budget import serpapi_budget
+
 SERPAPI_BASE_URL = "https://serpapi.com/search.json"
 SERPAPI_KEY = (os.getenv("SERPAPI_KEY") or "").strip() or None
 SCRAPERAPI_KEY = (os.getenv("SCRAPERAPI_KEY") or "").strip() or None
@@ -235,6 +242,10 @@ async def fetch_serpapi_offers(query: str) -> List[OfferOut]:
     trimmed = _normalize_text(query)
     if not trimmed or not SERPAPI_KEY:
         return []
+    if not await serpapi_budget.acquire("google_shopping"):
+        # Cache-only mode: the comparison lacks its SerpAPI offers.
+        mark_degraded("serpapi-budget")
+        return []
 
     params = {
         "engine": "google_shopping",
@@ -246,10 +257,17 @@ async def fetch_serpapi_offers(query: str) -> List[OfferOut]:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(20.0)) as client:
-            response = await client.get(SERPAPI_BASE_URL, params=params)
-            response.raise_for_status()
-    except (httpx.HTTPError, httpx.TimeoutException):
+        response = await within_deadline(
+            upstream_clients.get("serpapi").get(
+                SERPAPI_BASE_URL, params=params, timeout=httpx.Timeout(20.0)
+            )
+        )
+        response.raise_for_status()
+    except (httpx.HTTPError, httpx.TimeoutException, DeadlineExceeded) as exc:
+        if isinstance(exc, CircuitOpenError):
+            # Short-circuited: SerpAPI was never called.
+            serpapi_budget.refund("google_shopping")
+        mark_upstream_failure(exc)
         return []
 
     try:
@@ -320,46 +338,49 @@ async def fetch_scraperapi_offers(
                 }
             )
 
-    offers: List[OfferOut] = []
+    client = upstream_clients.get("scraperapi")
+    results = await asyncio.gather(
+        *(_fetch_scraperapi_target(client, target, trimmed) for target in targets)
+    )
+    return [offer for offer in results if offer is not None]
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-        for target in targets:
-            api_params = {
-                "api_key": SCRAPERAPI_KEY,
-                "url": target["url"],
-                "render": "true",
-            }
-            try:
-                response = await client.get(SCRAPERAPI_ENDPOINT, params=api_params)
-                response.raise_for_status()
-                html = response.text
-            except (httpx.HTTPError, httpx.TimeoutException):
-                continue
 
-            match = PRICE_RE.search(html)
-            if not match:
-                continue
-            try:
-                price = float(match.group(1).replace(".", "").replace(",", "."))
-            except ValueError:
-                continue
+async def _fetch_scraperapi_target(
+    client: httpx.AsyncClient, target: Dict[str, str], query: str
+) -> Optional[OfferOut]:
+    api_params = {
+        "api_key": SCRAPERAPI_KEY,
+        "url": target["url"],
+        "render": "true",
+    }
+    try:
+        response = await within_deadline(client.get(SCRAPERAPI_ENDPOINT, params=api_params))
+        response.raise_for_status()
+        html = response.text
+    except (httpx.HTTPError, httpx.TimeoutException, DeadlineExceeded) as exc:
+        mark_upstream_failure(exc)
+        return None
 
-            offers.append(
-                OfferOut(
-                    seller=target["label"],
-                    title=f"{target['label']} · {trimmed}",
-                    price=price,
-                    currency="EUR",
-                    price_text=_format_price(price),
-                    url=target["url"],
-                    image=f"https://logo.clearbit.com/{target['hostname']}",
-                    rating=None,
-                    reviews=None,
-                    source=target["label"],
-                )
-            )
+    match = PRICE_RE.search(html)
+    if not match:
+        return None
+    try:
+        price = float(match.group(1).replace(".", "").replace(",", "."))
+    except ValueError:
+        return None
 
-    return offers
+    return OfferOut(
+        seller=target["label"],
+        title=f"{target['label']} · {query}",
+        price=price,
+        currency="EUR",
+        price_text=_format_price(price),
+        url=target["url"],
+        image=f"https://logo.clearbit.com/{target['hostname']}",
+        rating=None,
+        reviews=None,
+        source=target["label"],
+    )
 
 
 def merge_offers(*lists: Iterable[OfferOut]) -> List[OfferOut]:
@@ -407,13 +428,18 @@ async def _load_or_fetch(query: str) -> tuple[List[OfferOut], Optional[PriceStat
     cache_key = query.lower().strip()
     cached = _get_cache(cache_key)
     if cached:
+        if SERPAPI_KEY:
+            serpapi_budget.record_cache_hit("google_shopping")
         offers = [_model_validate(OfferOut, data) for data in cached.offers]
         stats = _model_validate(PriceStatsOut, cached.price_stats) if cached.price_stats else None
         history = [_model_validate(PriceHistoryPoint, data) for data in cached.history]
         return offers, stats, history, cached.reference_image
 
-    serp_offers = await fetch_serpapi_offers(query)
-    scraper_offers = await fetch_scraperapi_offers(query)
+    with track_degradation() as degraded:
+        serp_offers, scraper_offers = await asyncio.gather(
+            fetch_serpapi_offers(query),
+            fetch_scraperapi_offers(query),
+        )
     offers = merge_offers(serp_offers, scraper_offers)
     stats = build_price_stats(offers)
     history = build_price_history(stats.avg if stats else None)
@@ -425,7 +451,11 @@ async def _load_or_fetch(query: str) -> tuple[List[OfferOut], Optional[PriceStat
         history=_serialize_history(history),
         reference_image=fallback_image,
     )
-    _set_cache(cache_key, payload)
+    deadline = current_deadline()
+    if not degraded and (deadline is None or not deadline.partial):
+        # Offers missing because of a failed upstream or the request deadline
+        # are not kept for 6 hours.
+        _set_cache(cache_key, payload)
     return offers, stats, history, fallback_image
 
 
@@ -0,0 +1,1190 @@
+"""Bounded in-memory response cache, its shared Redis tier and the ASGI middleware."""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+)
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.deadlines import PARTIAL_HEADER
+
+try:  # Optional: brotli is only used when installed.
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+try:  # Optional: the shared tier is only available with redis-py installed.
+    from redis import asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - depends on the environment
+    redis_asyncio = None
+
+_degradation: ContextVar[Optional[List[str]]] = ContextVar("response_degradation", default=None)
+
+
+def mark_degraded(reason: str) -> None:
+    """Flag the response being computed as missing data from a failed upstream.
+
+    The gateway helpers swallow upstream failures and return empty results;
+    a flagged response is treated like an error by
+    :class:`ResponseCacheMiddleware`: never stored, the stale entry served
+    instead when there is one.
+    """
+
+    reasons = _degradation.get()
+    if reasons is not None:
+        reasons.append(reason)
+
+
+def mark_upstream_failure(exc: BaseException) -> None:
+    """:func:`mark_degraded` for a failed upstream call, client errors (4xx but 429) aside."""
+
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return
+    mark_degraded(type(exc).__name__)
+
+
+@contextmanager
+def track_degradation() -> Iterator[List[str]]:
+    """Collect the :func:`mark_degraded` reasons of the block.
+
+    Reasons are also passed on to an enclosing tracker.
+    """
+
+    outer = _degradation.get()
+    reasons: List[str] = []
+    token = _degradation.set(reasons)
+    try:
+        yield reasons
+    finally:
+        _degradation.reset(token)
+        if outer is not None:
+            outer.extend(reasons)
+
+
+# Rough per-entry bookkeeping cost (dict slot, dataclass, header strings).
+ENTRY_OVERHEAD_BYTES = 256
+
+# Preferred order when a client accepts several encodings equally.
+ENCODING_PREFERENCE = ("br", "gzip")
+COMPRESSIBLE_MEDIA_PREFIXES = ("application/json", "text/", "application/javascript", "image/svg")
+
+
+def compress_body(
+    body: bytes,
+    media_type: Optional[str],
+    *,
+    minimum_size: int = 500,
+    gzip_level: int = 6,
+    brotli_quality: int = 5,
+) -> Dict[str, bytes]:
+    """Return the encoded variants of ``body`` worth storing next to it."""
+
+    if len(body) < minimum_size:
+        return {}
+    normalized_type = (media_type or "").split(";")[0].strip().lower()
+    if not normalized_type.startswith(COMPRESSIBLE_MEDIA_PREFIXES):
+        return {}
+
+    encodings: Dict[str, bytes] = {}
+    gzipped = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    if len(gzipped) < len(body):
+        encodings["gzip"] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(body, quality=brotli_quality)
+        if len(compressed) < len(body):
+            encodings["br"] = compressed
+    return encodings
+
+
+def select_encoding(accept_encoding: Optional[str], available: Mapping[str, bytes]) -> Optional[str]:
+    """Pick the best stored encoding allowed by an ``Accept-Encoding`` header."""
+
+    if not accept_encoding or not available:
+        return None
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[token] = weight
+
+    best: Optional[str] = None
+    best_weight = 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """Immutable cached response.
+
+    ``body`` is the identity payload; ``encodings`` holds pre-compressed
+    variants keyed by content-coding and ``headers`` the raw ASGI header pairs
+    replayed on every hit. ``fresh_until`` ends the soft TTL, ``stale_until``
+    the window where the stale body is served while a refresh runs, and
+    ``expires_at`` the extra window where it is only served when recomputing
+    fails. ``tags`` name the data the body depends on (``product:42``,
+    ``catalogue``...) so it can be purged before its TTL.
+    """
+
+    body: bytes
+    etag: str
+    headers: Tuple[Tuple[bytes, bytes], ...]
+    status_code: int
+    stored_at: float
+    fresh_until: float
+    stale_until: float
+    expires_at: float
+    encodings: Mapping[str, bytes] = field(default_factory=dict)
+    tags: FrozenSet[str] = frozenset()
+    size: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        header_bytes = sum(len(name) + len(value) for name, value in self.headers)
+        encoded_bytes = sum(len(payload) for payload in self.encodings.values())
+        tag_bytes = sum(len(tag) for tag in self.tags)
+        object.__setattr__(
+            self,
+            "size",
+            len(self.body)
+            + encoded_bytes
+            + len(self.etag)
+            + header_bytes
+            + tag_bytes
+            + ENTRY_OVERHEAD_BYTES,
+        )
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.fresh_until
+
+    def is_revalidatable(self, now: float) -> bool:
+        return now < self.stale_until
+
+    def age(self, now: float) -> int:
+        return max(int(now - self.stored_at), 0)
+
+
+class ResponseCache:
+    """LRU cache bounded both by entry count and by total body size.
+
+    Reads are lock-free: entries are immutable and a lookup is a plain dict
+    read, recency being refreshed best-effort. Only structural changes
+    (insert, removal, eviction) take the internal lock; concurrent writers of
+    the same key are expected to be serialized upstream (see ``SingleFlight``).
+    A tag index maps each tag to the keys carrying it for :meth:`purge_tags`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max(int(max_entries), 1)
+        self.max_bytes = max(int(max_bytes), 1)
+        self._clock = clock
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._tag_index: Dict[str, Set[str]] = {}
+        # Last purge time per tag, to refuse bodies computed before it.
+        self._purged_at: Dict[str, float] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale_hits = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
+        self._purged = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry until its hard expiry; callers check freshness."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        now = self._clock()
+        if entry.expires_at <= now:
+            self._discard(key, entry)
+            self._expirations += 1
+            self._misses += 1
+            return None
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            # Evicted concurrently; the entry we hold is still valid to serve.
+            pass
+        self._hits += 1
+        if not entry.is_fresh(now):
+            self._stale_hits += 1
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return the stored entry without touching recency or counters."""
+
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: CacheEntry, *, computed_since: Optional[float] = None) -> bool:
+        """Store ``entry``; ``computed_since`` is when its body started being built.
+
+        Bodies computed before a purge of one of their tags are refused, so a
+        request in flight during a purge cannot bring the old data back.
+        """
+
+        size = entry.size
+        with self._lock:
+            if computed_since is not None and any(
+                self._purged_at.get(tag, float("-inf")) >= computed_since for tag in entry.tags
+            ):
+                self._remove(key)
+                return False
+            self._remove(key)
+            if size > self.max_bytes:
+                # A single oversized body would flush the whole cache.
+                self._rejections += 1
+                return False
+            self._entries[key] = entry
+            self._bytes += size
+            for tag in entry.tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            self._evict_overflow()
+            return True
+
+    def purge_tags(self, tags: Iterable[str]) -> int:
+        """Drop every entry carrying one of ``tags``; return how many were removed."""
+
+        now = self._clock()
+        removed = 0
+        with self._lock:
+            for tag in set(tags):
+                self._purged_at[tag] = now
+                for key in list(self._tag_index.get(tag, ())):
+                    if self._remove(key) is not None:
+                        removed += 1
+            self._purged += removed
+        return removed
+
+    def pop(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tag_index.clear()
+            self._bytes = 0
+
+    def sweep_expired(self) -> int:
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self._expirations += len(expired)
+            # Purge marks only matter while a request started before them runs.
+            horizon = now - 3600
+            for tag in [tag for tag, purged_at in self._purged_at.items() if purged_at < horizon]:
+                del self._purged_at[tag]
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "staleHits": self._stale_hits,
+            "hitRatio": round(self._hits / lookups, 4) if lookups else None,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "rejections": self._rejections,
+            "purged": self._purged,
+            "tags": len(self._tag_index),
+        }
+
+    async def run_sweeper(self, interval: float) -> None:
+        """Periodically drop expired entries until the task is cancelled."""
+
+        delay = max(float(interval), 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            self.sweep_expired()
+
+    def _discard(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._remove(key)
+
+    def _remove(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            self._unindex(key, entry)
+        return entry
+
+    def _unindex(self, key: str, entry: CacheEntry) -> None:
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._tag_index[tag]
+
+    def _evict_overflow(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._unindex(key, evicted)
+            self._evictions += 1
+
+
+class SingleFlight:
+    """Let the first caller per key compute a result that concurrent callers await."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, "asyncio.Future[Optional[CacheEntry]]"] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def join(self, key: str) -> Tuple[bool, "asyncio.Future[Optional[CacheEntry]]"]:
+        """Return ``(is_leader, future)`` for ``key``.
+
+        The leader must call :meth:`release` once done, even on failure.
+        """
+
+        flight = self._calls.get(key)
+        if flight is not None and not flight.done():
+            self._followers += 1
+            return False, flight
+        flight = asyncio.get_running_loop().create_future()
+        self._calls[key] = flight
+        self._leaders += 1
+        return True, flight
+
+    def release(
+        self,
+        key: str,
+        flight: "asyncio.Future[Optional[CacheEntry]]",
+        entry: Optional[CacheEntry],
+    ) -> None:
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        if not flight.done():
+            flight.set_result(entry)
+
+    async def wait(
+        self, flight: "asyncio.Future[Optional[CacheEntry]]", timeout: float
+    ) -> Optional[CacheEntry]:
+        """Await the leader result, giving up (``None``) after ``timeout`` seconds."""
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight), timeout=max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inFlight": len(self._calls),
+            "leaders": self._leaders,
+            "coalesced": self._followers,
+        }
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Declarative caching rules for one route.
+
+    ``soft``/``hard`` are the fresh and stale-while-revalidate horizons in
+    seconds. ``vary`` lists the query parameters that change the response
+    (``None`` keeps every parameter); the others never reach the key.
+    ``fold`` maps a parameter to the normalisation its handler applies
+    (``str.strip``, ``str.lower``...), used on its values in the key: it
+    must not merge values the handler tells apart, or one of them gets the
+    other's body. Other values are kept verbatim. ``multi`` parameters are
+    treated as unordered sets and parameters equal to their ``defaults``
+    value are dropped, so equivalent URLs share one entry.
+
+    ``s_maxage`` overrides the shared-cache lifetime advertised to a CDN
+    through ``Cache-Control``.
+
+    Entries are tagged with ``tags``, with ``<group>:<value>`` for each named
+    group of ``path_tags`` matching the path and with ``<prefix>:<value>``
+    for each comma-separated value of the ``tag_params`` parameters.
+    """
+
+    soft: int
+    hard: int
+    cacheable: bool = True
+    vary: Optional[FrozenSet[str]] = None
+    fold: Mapping[str, Callable[[str], str]] = field(default_factory=dict)
+    multi: FrozenSet[str] = frozenset()
+    defaults: Mapping[str, str] = field(default_factory=dict)
+    s_maxage: Optional[int] = None
+    tags: FrozenSet[str] = frozenset()
+    path_tags: Optional[Pattern[str]] = None
+    tag_params: Mapping[str, str] = field(default_factory=dict)
+
+    def cache_key(self, path: str, query_string: bytes) -> str:
+        values = self._normalized_params(query_string)
+        pairs: List[Tuple[str, str]] = []
+        for name in sorted(values):
+            params = values[name]
+            if name in self.multi:
+                params = sorted({value for value in params if value})
+            if len(params) == 1 and self.defaults.get(name) == params[0]:
+                continue
+            pairs.extend((name, value) for value in params)
+        # The path keeps its case: SerpAPI product ids are case-sensitive.
+        return f"{path}?{urlencode(pairs)}" if pairs else path
+
+    def tags_for(self, path: str, query_string: bytes) -> FrozenSet[str]:
+        tags = set(self.tags)
+        if self.path_tags is not None:
+            match = self.path_tags.match(path)
+            if match:
+                tags.update(
+                    f"{group}:{value}" for group, value in match.groupdict().items() if value
+                )
+        if self.tag_params:
+            values = self._params(query_string)
+            for name, prefix in self.tag_params.items():
+                for value in values.get(name, ()):
+                    if name in self.fold:
+                        # Purge groups may be wider than keys: one tag per spelling.
+                        value = " ".join(value.casefold().split())
+                    tags.update(
+                        f"{prefix}:{item.strip()}" for item in value.split(",") if item.strip()
+                    )
+        return frozenset(tags)
+
+    def _params(self, query_string: bytes) -> Dict[str, List[str]]:
+        values: Dict[str, List[str]] = {}
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+            if self.vary is not None and name not in self.vary:
+                continue
+            values.setdefault(name, []).append(value)
+        return values
+
+    def _normalized_params(self, query_string: bytes) -> Dict[str, List[str]]:
+        values = self._params(query_string)
+        for name, fold in self.fold.items():
+            if name in values:
+                values[name] = [fold(value) for value in values[name]]
+        return values
+
+    def cache_control(self, stale_if_error: int = 0) -> str:
+        soft = max(int(self.soft), 0)
+        directives = [
+            "public",
+            f"max-age={soft}",
+            f"s-maxage={soft if self.s_maxage is None else max(int(self.s_maxage), 0)}",
+        ]
+        if self.hard > soft:
+            directives.append(f"stale-while-revalidate={int(self.hard) - soft}")
+        if stale_if_error > 0:
+            directives.append(f"stale-if-error={int(stale_if_error)}")
+        return ", ".join(directives)
+
+
+# Adds ARGV[1] to every tag set in KEYS and extends each set's expiry to
+# ARGV[2] (ms timestamp) unless it already lives longer, so a set lives as
+# long as its longest-lived member. ``PEXPIREAT ... NX/GT`` would do the same
+# but needs Redis 7; this runs on any server with Lua scripting (2.6+).
+# ARGV[3] is the client's clock, to compare against the remaining PTTL.
+_INDEX_TAGS_SCRIPT = """
+local remaining = tonumber(ARGV[2]) - tonumber(ARGV[3])
+for _, tag_key in ipairs(KEYS) do
+    redis.call('SADD', tag_key, ARGV[1])
+    local ttl = redis.call('PTTL', tag_key)
+    if ttl < 0 or ttl < remaining then
+        redis.call('PEXPIREAT', tag_key, ARGV[2])
+    end
+end
+return #KEYS
+"""
+
+
+class SharedResponseStore:
+    """Second cache tier shared by every worker through Redis.
+
+    Entries are stored gzip-compressed next to a small JSON header holding
+    the absolute freshness timestamps, and the Redis key expires with the
+    entry, so a body promoted back to a worker's in-process cache keeps the
+    TTL windows it was stored with. Redis errors count as misses.
+
+    Each tag is a Redis set of the keys carrying it; :meth:`purge_tags`
+    deletes those keys and announces the tags on a pub/sub channel so every
+    worker drops its in-process copies too (see :meth:`listen_for_purges`).
+    Only commands available since Redis 2.6 are used.
+    """
+
+    def __init__(self, client: Any, *, prefix: str = "fitidion:response:") -> None:
+        self._client = client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.purge_channel = f"{prefix}purge"
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> Optional["SharedResponseStore"]:
+        if redis_asyncio is None or not url:
+            return None
+        client = redis_asyncio.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return cls(client, **kwargs)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            raw = await self._client.get(self.prefix + key)
+        except Exception:
+            self.errors += 1
+            return None
+        entry = self._decode(raw) if raw else None
+        if entry is None or entry.expires_at <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        expires_at_ms = int(entry.expires_at * 1000)
+        now_ms = int(time.time() * 1000)
+        if expires_at_ms <= now_ms:
+            return
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            # Relative PX rather than PXAT (Redis 6.2+).
+            pipeline.set(self.prefix + key, self._encode(entry), px=expires_at_ms - now_ms)
+            if entry.tags:
+                tag_keys = [self._tag_key(tag) for tag in sorted(entry.tags)]
+                pipeline.eval(
+                    _INDEX_TAGS_SCRIPT,
+                    len(tag_keys),
+                    *tag_keys,
+                    key,
+                    expires_at_ms,
+                    now_ms,
+                )
+            await pipeline.execute()
+        except Exception:
+            self.errors += 1
+            return
+        self.writes += 1
+
+    async def purge_tags(self, tags: Iterable[str], *, origin: str = "") -> int:
+        """Delete the shared entries carrying ``tags`` and notify the other workers.
+
+        ``origin`` is passed on to the listeners, so a worker can tell the
+        purges it reacts to from the ones it caused.
+        """
+
+        tags = sorted(set(tags))
+        if not tags:
+            return 0
+        try:
+            keys: Set[bytes] = set()
+            for tag in tags:
+                keys.update(await self._client.smembers(self._tag_key(tag)))
+            removed = 0
+            if keys:
+                removed = await self._client.delete(
+                    *(self.prefix + (key.decode() if isinstance(key, bytes) else key) for key in keys)
+                )
+            await self._client.delete(*(self._tag_key(tag) for tag in tags))
+            await self._client.publish(
+                self.purge_channel, json.dumps({"tags": tags, "origin": origin})
+            )
+        except Exception:
+            self.errors += 1
+            return 0
+        return int(removed)
+
+    async def listen_for_purges(self, on_purge: Callable[[List[str], str], Any]) -> None:
+        """Call ``on_purge(tags, origin)`` for the purges of any worker until cancelled."""
+
+        while True:
+            try:
+                pubsub = self._client.pubsub()
+                await pubsub.subscribe(self.purge_channel)
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        try:
+                            payload = json.loads(message["data"])
+                        except (TypeError, ValueError):
+                            continue
+                        origin = ""
+                        if isinstance(payload, dict):
+                            tags, origin = payload.get("tags"), str(payload.get("origin") or "")
+                        else:
+                            # Bare list published by workers predating ``origin``.
+                            tags = payload
+                        if isinstance(tags, list):
+                            on_purge([str(tag) for tag in tags], origin)
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Redis unavailable: retry later, local purges still work.
+                self.errors += 1
+                await asyncio.sleep(5)
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def close(self) -> None:
+        try:
+            await self._client.aclose()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sharedHits": self.hits,
+            "sharedMisses": self.misses,
+            "sharedWrites": self.writes,
+            "sharedErrors": self.errors,
+        }
+
+    @staticmethod
+    def _encode(entry: CacheEntry) -> bytes:
+        stored = entry.encodings.get("gzip")
+        meta = {
+            "etag": entry.etag,
+            "headers": [
+                [name.decode("latin-1"), value.decode("latin-1")] for name, value in entry.headers
+            ],
+            "status": entry.status_code,
+            "storedAt": entry.stored_at,
+            "freshUntil": entry.fresh_until,
+            "staleUntil": entry.stale_until,
+            "expiresAt": entry.expires_at,
+            "tags": sorted(entry.tags),
+            "encoding": "gzip" if stored is not None else "identity",
+        }
+        header = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        return header + b"\n" + (stored if stored is not None else entry.body)
+
+    @staticmethod
+    def _decode(raw: bytes) -> Optional[CacheEntry]:
+        try:
+            header, _, payload = raw.partition(b"\n")
+            meta = json.loads(header)
+            encodings: Dict[str, bytes] = {}
+            if meta["encoding"] == "gzip":
+                body = gzip.decompress(payload)
+                encodings["gzip"] = payload
+                if brotli is not None:
+                    compressed = brotli.compress(body, quality=5)
+                    if len(compressed) < len(body):
+                        encodings["br"] = compressed
+            else:
+                body = payload
+            return CacheEntry(
+                body=body,
+                etag=meta["etag"],
+                headers=tuple(
+                    (name.encode("latin-1"), value.encode("latin-1"))
+                    for name, value in meta["headers"]
+                ),
+                status_code=int(meta["status"]),
+                stored_at=float(meta["storedAt"]),
+                fresh_until=float(meta["freshUntil"]),
+                stale_until=float(meta["staleUntil"]),
+                expires_at=float(meta["expiresAt"]),
+                encodings=encodings,
+                tags=frozenset(meta.get("tags", ())),
+            )
+        except (KeyError, TypeError, ValueError, OSError, EOFError):
+            return None
+
+
+# Headers recomputed on every response rather than replayed from the entry.
+_UNSTORED_HEADERS = frozenset(
+    {b"content-length", b"date", b"server", b"x-cache", b"age", b"etag"}
+)
+_CONDITIONAL_HEADERS = frozenset({b"if-none-match", b"if-modified-since"})
+
+
+def build_etag(payload: bytes) -> str:
+    digest = hashlib.sha256(payload).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _header_value(headers: Tuple[Tuple[bytes, bytes], ...], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _vary_accept_encoding(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """``headers`` with ``Accept-Encoding`` listed in ``Vary`` exactly once.
+
+    Cached responses can be served encoded or not depending on the request,
+    so every variant says so, identity ones included.
+    """
+
+    merged: List[Tuple[bytes, bytes]] = []
+    found = False
+    for name, value in headers:
+        if name.lower() == b"vary" and not found:
+            found = True
+            listed = {item.strip().lower() for item in value.split(b",")}
+            if b"accept-encoding" not in listed and b"*" not in listed:
+                value = value + b", Accept-Encoding"
+        merged.append((name, value))
+    if not found:
+        merged.append((b"vary", b"Accept-Encoding"))
+    return merged
+
+
+def _degraded_headers(headers: Tuple[Tuple[bytes, bytes], ...]) -> List[Tuple[bytes, bytes]]:
+    """``headers`` of a degraded response: ``no-store`` and flagged partial."""
+
+    kept = [(name, value) for name, value in headers if name.lower() != b"cache-control"]
+    kept.append((b"cache-control", b"no-store"))
+    if _header_value(headers, PARTIAL_HEADER) is None:
+        kept.append((PARTIAL_HEADER, b"upstream"))
+    return kept
+
+
+class ResponseCacheMiddleware:
+    """Pure ASGI middleware caching successful GET responses.
+
+    Non-GET/HEAD requests, requests or responses marked ``no-store`` and paths
+    without a cacheable policy are passed through untouched. Degraded
+    responses (:func:`mark_degraded`, or flagged partial by the deadline
+    middleware) are handled like errors: the stale entry is served when there
+    is one, and they are never stored. Entries are
+    tagged from the route policy and from a ``Cache-Tag`` response header. Single-message
+    bodies (the FastAPI JSON case) are turned into an entry and served in the
+    negotiated encoding; streamed bodies are forwarded chunk by chunk while
+    the chunks are kept for the cache.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        cache: ResponseCache,
+        flights: SingleFlight,
+        shared: Optional[SharedResponseStore] = None,
+        policy_for: Callable[[str], Optional[CachePolicy]],
+        coalesce_timeout: float = 45.0,
+        stale_if_error: int = 3600,
+        compress_min_bytes: int = 500,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.app = app
+        self.cache = cache
+        self.flights = flights
+        self.shared = shared
+        self.policy_for = policy_for
+        self.coalesce_timeout = coalesce_timeout
+        self.stale_if_error = max(int(stale_if_error), 0)
+        self.compress_min_bytes = compress_min_bytes
+        self._clock = clock
+        self._revalidations: Set["asyncio.Task[None]"] = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        if "no-store" in request_headers.get("cache-control", "").lower():
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policy_for(scope["path"])
+        if policy is None or not policy.cacheable:
+            await self.app(scope, receive, send)
+            return
+        cache_key = policy.cache_key(scope["path"], scope.get("query_string", b""))
+
+        cached = self.cache.get(cache_key)
+        if cached is not None and await self._serve_cached(scope, send, cache_key, cached):
+            return
+
+        # Only the first miss per key runs the app; concurrent misses wait for
+        # its entry and fall back to their own call when it is late or
+        # uncacheable.
+        is_leader, flight = self.flights.join(cache_key)
+        if not is_leader:
+            coalesced = await self.flights.wait(flight, self.coalesce_timeout)
+            if coalesced is not None:
+                await self._send_entry(scope, send, coalesced, "COALESCED")
+                return
+
+        if is_leader and self.shared is not None:
+            # Another worker may already hold a newer copy.
+            promoted = await self.shared.get(cache_key)
+            if promoted is not None and (cached is None or promoted.stored_at > cached.stored_at):
+                self.cache.set(cache_key, promoted)
+                self.flights.release(cache_key, flight, promoted)
+                if await self._serve_cached(scope, send, cache_key, promoted):
+                    return
+                is_leader, flight = self.flights.join(cache_key)
+                cached = promoted
+
+        entry: Optional[CacheEntry] = None
+        try:
+            entry = await self._forward(scope, receive, send, cache_key, stale=cached)
+        finally:
+            if is_leader:
+                self.flights.release(cache_key, flight, entry)
+        if entry is not None and self.shared is not None:
+            await self.shared.set(cache_key, entry)
+
+    async def _serve_cached(
+        self, scope: Scope, send: Send, cache_key: str, cached: CacheEntry
+    ) -> bool:
+        now = self._clock()
+        if cached.is_fresh(now):
+            await self._send_entry(scope, send, cached, "HIT")
+            return True
+        if cached.is_revalidatable(now):
+            self._schedule_revalidation(cache_key, scope)
+            await self._send_entry(scope, send, cached, "STALE")
+            return True
+        return False
+
+    async def _forward(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        cache_key: str,
+        *,
+        stale: Optional[CacheEntry],
+    ) -> Optional[CacheEntry]:
+        storable = scope["method"] == "GET"
+        computed_since = self._clock()
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        mode = "pending"
+        started = False
+        entry: Optional[CacheEntry] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, mode, started, entry
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                start = message
+                headers = tuple(message.get("headers", ()))
+                is_degraded = bool(degraded) or _header_value(headers, PARTIAL_HEADER) is not None
+                if (message["status"] >= 500 or is_degraded) and stale is not None:
+                    mode = "stale"
+                elif is_degraded:
+                    # Neither stored here nor by a CDN.
+                    mode = "pass"
+                    message["headers"] = [*_degraded_headers(headers), (b"x-cache", b"MISS")]
+                    started = True
+                    await send(message)
+                elif storable and message["status"] == 200 and self._is_storable(headers):
+                    # Hold the start message until the body tells us whether
+                    # it can be served straight from a cache entry.
+                    mode = "tee"
+                else:
+                    mode = "pass"
+                    message["headers"] = [*headers, (b"x-cache", b"MISS")]
+                    started = True
+                    await send(message)
+                return
+
+            if mode == "stale":
+                return
+            if mode != "tee" or message_type != "http.response.body":
+                started = True
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not chunks and not more_body:
+                built = self._build_entry(scope, start, body)
+                if not degraded:
+                    entry = self._store(cache_key, built, computed_since)
+                started = True
+                await self._send_entry(scope, send, built, "MISS")
+                mode = "done"
+                return
+
+            if not started:
+                # Outer middlewares edit the header list in place, so the
+                # entry keeps the headers as the app produced them.
+                stored_start = {**start, "headers": self._with_cache_control(scope, start)}
+                start["headers"] = [
+                    *_vary_accept_encoding(stored_start["headers"]),
+                    (b"x-cache", b"MISS"),
+                ]
+                started = True
+                await send(start)
+                start = stored_start
+            chunks.append(body)
+            await send(message)
+            if not more_body and not degraded:
+                built = self._build_entry(scope, start, b"".join(chunks))
+                entry = self._store(cache_key, built, computed_since)
+
+        try:
+            with track_degradation() as degraded:
+                await self.app(scope, receive, send_wrapper)
+        except Exception:
+            # Stale-if-error: only possible while nothing reached the client.
+            if stale is None or started:
+                raise
+            await self._send_entry(scope, send, stale, "STALE")
+            return None
+
+        if mode == "stale" and stale is not None:
+            await self._send_entry(scope, send, stale, "STALE")
+        return entry
+
+    def _schedule_revalidation(self, cache_key: str, scope: Scope) -> None:
+        is_leader, flight = self.flights.join(cache_key)
+        if not is_leader:
+            return
+        task = asyncio.create_task(self._revalidate(cache_key, scope, flight))
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidations.discard)
+
+    async def _revalidate(
+        self,
+        cache_key: str,
+        scope: Scope,
+        flight: "asyncio.Future[Optional[CacheEntry]]",
+    ) -> None:
+        """Re-run the request in the background to refresh a stale entry."""
+
+        refresh_scope = dict(scope)
+        refresh_scope["method"] = "GET"
+        refresh_scope["headers"] = [
+            (name, value)
+            for name, value in scope.get("headers", [])
+            if name.lower() not in _CONDITIONAL_HEADERS
+        ]
+        request_sent = False
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+
+        async def receive() -> Message:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        entry: Optional[CacheEntry] = None
+        try:
+            if self.shared is not None:
+                # Skip the upstream calls when another worker already refreshed it.
+                promoted = await self.shared.get(cache_key)
+                if promoted is not None and promoted.is_fresh(self._clock()):
+                    self.cache.set(cache_key, promoted)
+                    entry = promoted
+                    return
+            computed_since = self._clock()
+            with track_degradation() as degraded:
+                await self.app(refresh_scope, receive, send)
+            if (
+                start is not None
+                and start["status"] == 200
+                and not degraded
+                and _header_value(tuple(start.get("headers", ())), PARTIAL_HEADER) is None
+                and self._is_storable(tuple(start.get("headers", ())))
+            ):
+                built = self._build_entry(refresh_scope, start, b"".join(chunks))
+                entry = self._store(cache_key, built, computed_since)
+                if entry is not None and self.shared is not None:
+                    await self.shared.set(cache_key, entry)
+        except Exception:
+            # Stale-if-error: the previous entry stays in place (so it does
+            # when the refreshed response is degraded).
+            entry = None
+        finally:
+            self.flights.release(cache_key, flight, entry)
+
+    def _store(
+        self, cache_key: str, entry: CacheEntry, computed_since: float
+    ) -> Optional[CacheEntry]:
+        """Insert ``entry`` and return it, or ``None`` when the cache refused it."""
+
+        if self.cache.set(cache_key, entry, computed_since=computed_since):
+            return entry
+        return None
+
+    def _is_storable(self, headers: Tuple[Tuple[bytes, bytes], ...]) -> bool:
+        cache_control = (_header_value(headers, b"cache-control") or "").lower()
+        return "no-store" not in cache_control and "private" not in cache_control
+
+    def _with_cache_control(self, scope: Scope, start: Message) -> List[Tuple[bytes, bytes]]:
+        """Headers of ``start`` plus the route's ``Cache-Control`` unless the app set one."""
+
+        headers = list(start.get("headers", ()))
+        policy = self.policy_for(scope["path"])
+        if policy is not None and _header_value(tuple(headers), b"cache-control") is None:
+            value = policy.cache_control(self.stale_if_error)
+            headers.append((b"cache-control", value.encode("latin-1")))
+        return headers
+
+    def _build_entry(self, scope: Scope, start: Message, body: bytes) -> CacheEntry:
+        headers = tuple(
+            (name, value)
+            for name, value in self._with_cache_control(scope, start)
+            if name.lower() not in _UNSTORED_HEADERS
+        )
+        policy = self.policy_for(scope["path"])
+        soft = max(int(policy.soft), 0) if policy is not None else 0
+        hard = max(int(policy.hard), soft) if policy is not None else soft
+        tags: Set[str] = set()
+        if policy is not None:
+            tags.update(policy.tags_for(scope["path"], scope.get("query_string", b"")))
+        # Handlers add content-derived tags (e.g. the products of a listing).
+        header_tags = _header_value(headers, b"cache-tag")
+        if header_tags:
+            tags.update(tag.strip() for tag in header_tags.split(",") if tag.strip())
+        now = self._clock()
+        encodings: Dict[str, bytes] = {}
+        if _header_value(headers, b"content-encoding") is None:
+            encodings = compress_body(
+                body,
+                _header_value(headers, b"content-type"),
+                minimum_size=self.compress_min_bytes,
+            )
+        return CacheEntry(
+            body=body,
+            etag=build_etag(body),
+            headers=headers,
+            status_code=start["status"],
+            stored_at=now,
+            fresh_until=now + soft,
+            stale_until=now + hard,
+            expires_at=now + hard + self.stale_if_error,
+            encodings=encodings,
+            tags=frozenset(tags),
+        )
+
+    async def _send_entry(self, scope: Scope, send: Send, entry: CacheEntry, marker: str) -> None:
+        request_headers = Headers(scope=scope)
+        age = str(entry.age(self._clock())).encode("latin-1")
+        etag = entry.etag.encode("latin-1")
+        if entry.etag and request_headers.get("if-none-match") == entry.etag:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": _vary_accept_encoding(
+                        [(b"etag", etag), (b"x-cache", marker.encode()), (b"age", age)]
+                    ),
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        encoding = select_encoding(request_headers.get("accept-encoding"), entry.encodings)
+        body = entry.encodings[encoding] if encoding else entry.body
+        headers = _vary_accept_encoding(list(entry.headers))
+        if encoding:
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+        headers.extend(
+            [
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"etag", etag),
+                (b"x-cache", marker.encode("latin-1")),
+                (b"age", age),
+            ]
+        )
+        await send({"type": "http.response.start", "status": entry.status_code, "headers": headers})
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else body,
+            }
+        )
+
+
+__all__ = [
+    "CacheEntry",
+    "CachePolicy",
+    "ResponseCache",
+    "ResponseCacheMiddleware",
+    "SharedResponseStore",
+    "SingleFlight",
+    "build_etag",
+    "compress_body",
+    "mark_degraded",
+    "mark_upstream_failure",
+    "select_encoding",
+    "track_degradation",
+]
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 from fastapi import Depends, FastAPI, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from .cache import cache
 from .database import PriceHistory, Product, get_session, init_models
@@ -12,6 +13,7 @@ from .scheduler import scheduler
 from .schemas import (
     PriceHistoryEntrySchema,
     PriceHistoryResponseSchema,
+    ProductOffersBatchRequestSchema,
     ProductSchema,
     ProductWithOffersSchema,
     PriceHistoryStatisticsSchema,
@@ -51,6 +53,27 @@ async def list_products(session: AsyncSession = Depends(get_db_session)) -> list
     return result
 
 
+@app.post("/products/offers:batch", response_model=list[ProductWithOffersSchema])
+async def product_offers_batch(
+    payload: ProductOffersBatchRequestSchema,
+    session: AsyncSession = Depends(get_db_session),
+) -> list[ProductWithOffersSchema]:
+    """Produits et offres pour plusieurs identifiants, dans l'ordre demandé.
+
+    Les identifiants inconnus sont ignorés ; les offres sont chargées par une
+    seule requête ``selectinload`` pour tout le lot.
+    """
+
+    ids = list(dict.fromkeys(payload.ids))
+    stmt = select(Product).where(Product.id.in_(ids)).options(selectinload(Product.offers))
+    products = {product.id: product for product in (await session.scalars(stmt)).all()}
+    return [
+        ProductWithOffersSchema.model_validate(products[product_id])
+        for product_id in ids
+        if product_id in products
+    ]
+
+
 @app.get("/products/{product_id}/offers", response_model=ProductWithOffersSchema)
 async def product_offers(
     product_id: int, session: AsyncSession = Depends(get_db_session)
@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 from datetime import datetime, timezone
 
+import httpx
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy import select
@@ -38,15 +39,35 @@ class RefreshScheduler:
         tasks = [collector.collect() for collector in self._collectors]
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
+        product_ids: set[int] = set()
         async with get_session() as session:
             for result in results:
                 if isinstance(result, Exception):
                     continue
                 for product in result:
-                    await upsert_product_with_offers(session, product)
+                    stored = await upsert_product_with_offers(session, product)
+                    product_ids.add(stored.id)
             await session.commit()
 
         print(f"[{datetime.utcnow().isoformat()}] rafraîchissement terminé")
+        await self.purge_gateway_cache(product_ids)
+
+    async def purge_gateway_cache(self, product_ids: set[int]) -> None:
+        """Ask the gateway to drop the cached responses built from stale data."""
+
+        if not settings.gateway_url or not settings.gateway_purge_token:
+            return
+        tags = ["catalogue", *(f"product:{product_id}" for product_id in sorted(product_ids))]
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(
+                    f"{settings.gateway_url.rstrip('/')}/cache/purge",
+                    params=[("tags", tag) for tag in tags],
+                    headers={"X-Cache-Purge-Token": settings.gateway_purge_token},
+                )
+                response.raise_for_status()
+        except httpx.HTTPError as exc:
+            print(f"[{datetime.utcnow().isoformat()}] purge du cache passerelle échouée : {exc}")
 
     async def record_daily_price_history(self) -> None:
         async with get_session() as session:
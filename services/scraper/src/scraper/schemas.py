@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OfferSchema(BaseModel):
@@ -41,6 +41,10 @@ class ProductWithOffersSchema(ProductSchema):
     offers: list[OfferSchema]
 
 
+class ProductOffersBatchRequestSchema(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=200)
+
+
 class PriceHistoryEntrySchema(BaseModel):
     date: datetime
     price: float
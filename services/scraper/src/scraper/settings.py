@@ -12,6 +12,9 @@ class Settings(BaseSettings):
     scheduler_timezone: str = "Europe/Paris"
     refresh_cron: str = "0 * * * *"  # toutes les heures
     log_level: str = "INFO"
+    # Passerelle (main.py) à notifier après un rafraîchissement ; vide = désactivé.
+    gateway_url: str = ""
+    gateway_purge_token: str = ""
 
 
 @lru_cache
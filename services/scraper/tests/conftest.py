@@ -0,0 +1,39 @@
+import asyncio
+from collections.abc import AsyncIterator, Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from scraper.database import Base
+from scraper.main import app, get_db_session
+
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=StaticPool)
+TestingSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def _reset_tables() -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture()
+def db_session() -> Generator[async_sessionmaker[AsyncSession], None, None]:
+    asyncio.run(_reset_tables())
+    yield TestingSessionLocal
+
+
+@pytest.fixture()
+def client(db_session) -> Generator[TestClient, None, None]:
+    async def override_get_db_session() -> AsyncIterator[AsyncSession]:
+        async with db_session() as session:
+            yield session
+
+    app.dependency_overrides[get_db_session] = override_get_db_session
+    # Sans ``with`` : les événements de démarrage (Postgres, planificateur) ne tournent pas.
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+
+from scraper import scheduler as scheduler_module
+from scraper.scheduler import RefreshScheduler
+from scraper.settings import settings
+
+
+def install_transport(monkeypatch, handler):
+    requests = []
+    original = httpx.AsyncClient
+
+    def recording(request):
+        requests.append(request)
+        return handler(request)
+
+    def client_factory(*args, **kwargs):
+        return original(*args, transport=httpx.MockTransport(recording), **kwargs)
+
+    monkeypatch.setattr(scheduler_module.httpx, "AsyncClient", client_factory)
+    return requests
+
+
+def configure_gateway(monkeypatch, url="http://gateway:8000/", token="secret"):
+    monkeypatch.setattr(settings, "gateway_url", url)
+    monkeypatch.setattr(settings, "gateway_purge_token", token)
+
+
+def test_purge_sends_the_catalogue_and_product_tags(monkeypatch):
+    configure_gateway(monkeypatch)
+    requests = install_transport(monkeypatch, lambda request: httpx.Response(200, json={}))
+
+    asyncio.run(RefreshScheduler().purge_gateway_cache({12, 3}))
+
+    assert len(requests) == 1
+    request = requests[0]
+    assert request.method == "POST"
+    assert request.url.path == "/cache/purge"
+    assert request.url.params.get_list("tags") == ["catalogue", "product:3", "product:12"]
+    assert request.headers["X-Cache-Purge-Token"] == "secret"
+
+
+def test_purge_is_skipped_without_gateway_settings(monkeypatch):
+    requests = install_transport(monkeypatch, lambda request: httpx.Response(200))
+
+    configure_gateway(monkeypatch, url="")
+    asyncio.run(RefreshScheduler().purge_gateway_cache({1}))
+    configure_gateway(monkeypatch, token="")
+    asyncio.run(RefreshScheduler().purge_gateway_cache({1}))
+
+    assert requests == []
+
+
+def test_purge_failures_do_not_raise(monkeypatch):
+    configure_gateway(monkeypatch)
+
+    def refuse(request):
+        return httpx.Response(403, json={"detail": "forbidden"})
+
+    requests = install_transport(monkeypatch, refuse)
+    asyncio.run(RefreshScheduler().purge_gateway_cache(set()))
+
+    def unreachable(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    install_transport(monkeypatch, unreachable)
+    asyncio.run(RefreshScheduler().purge_gateway_cache(set()))
+
+    assert [request.url.params.get_list("tags") for request in requests] == [["catalogue"]]
@@ -0,0 +1,53 @@
+import asyncio
+
+from scraper.database import Offer, Product
+
+
+def seed_products(db_session, count):
+    async def seed():
+        async with db_session() as session:
+            products = [
+                Product(
+                    name=f"Whey {index}",
+                    brand="Brand",
+                    offers=[
+                        Offer(source="shop", url=f"https://example.com/{index}", price=20.0 + index)
+                    ],
+                )
+                for index in range(count)
+            ]
+            session.add_all(products)
+            await session.commit()
+            return [product.id for product in products]
+
+    return asyncio.run(seed())
+
+
+def test_batch_keeps_the_requested_order_and_skips_unknown_ids(client, db_session):
+    first, second = seed_products(db_session, 2)
+
+    response = client.post(
+        "/products/offers:batch", json={"ids": [second, 999, first, second]}
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [item["id"] for item in payload] == [second, first]
+    assert [offer["price"] for offer in payload[0]["offers"]] == [21.0]
+
+
+def test_batch_only_returns_unknown_ids_as_an_empty_list(client, db_session):
+    response = client.post("/products/offers:batch", json={"ids": [404]})
+
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_batch_rejects_empty_and_oversized_requests(client, db_session):
+    assert client.post("/products/offers:batch", json={"ids": []}).status_code == 422
+    assert client.post(
+        "/products/offers:batch", json={"ids": list(range(1, 202))}
+    ).status_code == 422
+    assert client.post(
+        "/products/offers:batch", json={"ids": list(range(1, 201))}
+    ).status_code == 200
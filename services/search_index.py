@@ -0,0 +1,163 @@
+"""Accent-folded inverted index for product name/brand search.
+
+Search keeps the historical :func:`matches_query` semantics: a document
+matches when *every* whitespace-separated query term is a substring of one
+field (all terms in the name, or all terms in the brand). Matching is
+case-insensitive and accent-insensitive (``protéine`` finds ``Proteine``).
+
+Each field keeps a postings map from token *suffixes* to document keys, plus
+a lazily sorted list of those suffixes. A query term's alphanumeric pieces
+are looked up as prefixes of that list (any substring of a token is a prefix
+of one of its suffixes), the per-term candidate sets are intersected, and
+only the surviving candidates are checked against the full text.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def fold_text(value: Any) -> str:
+    """Lowercase ``value`` and strip its accents."""
+
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def query_terms(query: Optional[str]) -> List[str]:
+    return [term for term in fold_text(query).split() if term]
+
+
+class SearchIndex:
+    """Incrementally maintained index over a set of keyed documents."""
+
+    def __init__(self, fields: Sequence[str] = ("name", "brand")) -> None:
+        self.fields = tuple(fields)
+        self._documents: Dict[Hashable, Tuple[str, ...]] = {}
+        self._postings: Dict[str, Dict[str, Set[Hashable]]] = {field: {} for field in self.fields}
+        self._sorted: Dict[str, Optional[List[str]]] = {field: [] for field in self.fields}
+        self.updates = 0
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._documents
+
+    def update(self, key: Hashable, values: Mapping[str, Any]) -> bool:
+        """Index (or re-index) ``key``; returns ``False`` if nothing changed."""
+
+        texts = tuple(fold_text(values.get(field)) for field in self.fields)
+        if self._documents.get(key) == texts:
+            return False
+        self.remove(key)
+        self._documents[key] = texts
+        for field, text in zip(self.fields, texts):
+            postings = self._postings[field]
+            for suffix in _suffixes(text):
+                keys = postings.get(suffix)
+                if keys is None:
+                    postings[suffix] = {key}
+                    self._sorted[field] = None
+                else:
+                    keys.add(key)
+        self.updates += 1
+        return True
+
+    def remove(self, key: Hashable) -> bool:
+        texts = self._documents.pop(key, None)
+        if texts is None:
+            return False
+        for field, text in zip(self.fields, texts):
+            postings = self._postings[field]
+            for suffix in _suffixes(text):
+                keys = postings.get(suffix)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if not keys:
+                    del postings[suffix]
+                    self._sorted[field] = None
+        return True
+
+    def sync(self, documents: Mapping[Hashable, Mapping[str, Any]]) -> int:
+        """Make the index hold exactly ``documents``, touching only changes.
+
+        Returns the number of documents added, updated or removed.
+        """
+
+        changes = 0
+        for key in [key for key in self._documents if key not in documents]:
+            self.remove(key)
+            changes += 1
+        for key, values in documents.items():
+            if self.update(key, values):
+                changes += 1
+        return changes
+
+    def search(self, query: Optional[str], *, fields: Optional[Iterable[str]] = None) -> Set[Hashable]:
+        """Keys of the documents where one field contains every query term."""
+
+        self.queries += 1
+        terms = query_terms(query)
+        if not terms:
+            return set(self._documents)
+
+        matches: Set[Hashable] = set()
+        for field in fields or self.fields:
+            position = self.fields.index(field)
+            for key in self._candidates(field, terms):
+                text = self._documents[key][position]
+                if all(term in text for term in terms):
+                    matches.add(key)
+        return matches
+
+    def count(self, query: Optional[str], *, fields: Optional[Iterable[str]] = None) -> int:
+        return len(self.search(query, fields=fields))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._documents),
+            "suffixes": {field: len(postings) for field, postings in self._postings.items()},
+            "updates": self.updates,
+            "queries": self.queries,
+        }
+
+    def _candidates(self, field: str, terms: Sequence[str]) -> Set[Hashable]:
+        candidates: Optional[Set[Hashable]] = None
+        for term in terms:
+            for piece in _TOKEN_RE.findall(term):
+                keys = self._keys_with_prefix(field, piece)
+                candidates = keys if candidates is None else candidates & keys
+                if not candidates:
+                    return set()
+        if candidates is None:
+            # Only punctuation in the query: every document is a candidate.
+            return set(self._documents)
+        return candidates
+
+    def _keys_with_prefix(self, field: str, prefix: str) -> Set[Hashable]:
+        ordered = self._sorted[field]
+        postings = self._postings[field]
+        if ordered is None:
+            ordered = self._sorted[field] = sorted(postings)
+        keys: Set[Hashable] = set()
+        index = bisect_left(ordered, prefix)
+        while index < len(ordered) and ordered[index].startswith(prefix):
+            keys |= postings[ordered[index]]
+            index += 1
+        return keys
+
+
+def _suffixes(text: str) -> Set[str]:
+    return {token[start:] for token in _TOKEN_RE.findall(text) for start in range(len(token))}
+
+
+__all__ = ["SearchIndex", "fold_text", "query_terms"]
@@ -0,0 +1,235 @@
+"""Bounded store for SerpAPI product data reused across gateway requests."""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Entry = Dict[str, Any]
+
+
+class SerpProductCache:
+    """LRU store of SERP product entries with entry, byte and age limits.
+
+    Entries are mutable dicts enriched in place by the gateway: writers get
+    the entry with :meth:`entry_for_update`, fill it, then call
+    :meth:`commit` so its size is re-measured and the budgets enforced. Only
+    the fields replaced since the previous commit are measured again, so a
+    field must be reassigned, not mutated in place, for its new size to
+    count. An entry expires ``ttl`` seconds after its last commit. When over
+    budget, expired entries go first, then the least recently used ones.
+    ``on_evict(key)`` is called for every entry removed.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 2000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 6 * 60 * 60,
+        on_evict: Optional[Callable[[str], Any]] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max(int(max_entries), 1)
+        self.max_bytes = max(int(max_bytes), 1)
+        self.ttl = float(ttl)
+        self.on_evict = on_evict
+        self._clock = clock
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        # key -> (size in bytes, committed at)
+        self._meta: Dict[str, Tuple[int, float]] = {}
+        # key -> field -> (value measured, its size)
+        self._field_sizes: Dict[str, Dict[str, Tuple[Any, int]]] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def get(self, key: Optional[str], default: Optional[Entry] = None) -> Optional[Entry]:
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            self._misses += 1
+            return default
+        if self._is_expired(key):
+            self._drop(key, expired=True)
+            self._misses += 1
+            return default
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            pass
+        self._hits += 1
+        return entry
+
+    def items(self) -> List[Tuple[str, Entry]]:
+        """Snapshot of the live entries, safe to iterate while writing."""
+
+        now = self._clock()
+        return [
+            (key, entry)
+            for key, entry in list(self._entries.items())
+            if not self._is_expired(key, now)
+        ]
+
+    def entry_for_update(self, key: str) -> Entry:
+        """The entry stored under ``key``, created empty if missing or expired."""
+
+        entry = self._entries.get(key)
+        if entry is not None and not self._is_expired(key):
+            return entry
+        if entry is not None:
+            self._drop(key, expired=True)
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            self._meta.setdefault(key, (0, self._clock()))
+        return entry
+
+    def commit(self, key: str) -> None:
+        """Re-measure ``key`` after an update, refresh its age, enforce budgets."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        evicted: List[str] = []
+        with self._lock:
+            size = self._measure_locked(key, entry)
+            previous = self._meta.get(key, (0, 0.0))[0]
+            self._meta[key] = (size, self._clock())
+            self._bytes += size - previous
+            self._entries.move_to_end(key)
+            evicted.extend(self._evict_locked(keep=key))
+        self._notify(evicted)
+
+    def pop(self, key: str) -> Optional[Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._drop(key)
+        return entry
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._drop(key)
+
+    def sweep_expired(self) -> int:
+        """Drop every expired entry; returns how many were removed."""
+
+        now = self._clock()
+        expired = [key for key in list(self._entries) if self._is_expired(key, now)]
+        for key in expired:
+            self._drop(key, expired=True)
+        return len(expired)
+
+    async def run_sweeper(self, interval: float) -> None:
+        """Periodically drop expired entries until the task is cancelled."""
+
+        delay = max(float(interval), 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            self.sweep_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "serpEntries": len(self._entries),
+            "serpBytes": self._bytes,
+            "serpMaxEntries": self.max_entries,
+            "serpMaxBytes": self.max_bytes,
+            "serpHits": self._hits,
+            "serpMisses": self._misses,
+            "serpEvictions": self._evictions,
+            "serpExpirations": self._expirations,
+        }
+
+    def _is_expired(self, key: str, now: Optional[float] = None) -> bool:
+        meta = self._meta.get(key)
+        if meta is None or self.ttl <= 0:
+            return False
+        return (now if now is not None else self._clock()) - meta[1] >= self.ttl
+
+    def _evict_locked(self, *, keep: str) -> List[str]:
+        evicted: List[str] = []
+        if len(self._entries) <= self.max_entries and self._bytes <= self.max_bytes:
+            return evicted
+        now = self._clock()
+        # Expired entries go first, whatever their recency...
+        for key in [key for key in self._entries if key != keep and self._is_expired(key, now)]:
+            self._remove_locked(key)
+            self._expirations += 1
+            evicted.append(key)
+        # ...then the least recently used ones.
+        while (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ) and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            self._remove_locked(key)
+            self._evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _drop(self, key: str, *, expired: bool = False) -> None:
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._remove_locked(key)
+            if expired:
+                self._expirations += 1
+        self._notify([key])
+
+    def _measure_locked(self, key: str, entry: Entry) -> int:
+        previous = self._field_sizes.get(key, {})
+        measured: Dict[str, Tuple[Any, int]] = {}
+        size = 2  # braces
+        for field, value in list(entry.items()):
+            known = previous.get(field)
+            if known is not None and known[0] is value:
+                field_size = known[1]
+            else:
+                field_size = _field_size(field, value)
+            measured[field] = (value, field_size)
+            size += field_size
+        self._field_sizes[key] = measured
+        return size
+
+    def _remove_locked(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._field_sizes.pop(key, None)
+        size, _ = self._meta.pop(key, (0, 0.0))
+        self._bytes -= size
+
+    def _notify(self, keys: List[str]) -> None:
+        if self.on_evict is None:
+            return
+        for key in keys:
+            try:
+                self.on_evict(key)
+            except Exception:
+                pass
+
+
+def _field_size(field: str, value: Any) -> int:
+    """Approximate JSON size of ``"field":value,``."""
+
+    try:
+        encoded = json.dumps(value, default=str, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError):
+        encoded = repr(value)
+    return len(field) + len(encoded.encode("utf-8")) + 4
+
+
+__all__ = ["SerpProductCache"]
@@ -0,0 +1,309 @@
+"""Central budget for SerpAPI calls: rate limit, quotas and spend ledger.
+
+Every SerpAPI call site asks :meth:`SerpApiBudget.acquire` first, hands the
+call back with :meth:`SerpApiBudget.refund` when it was short-circuited
+before reaching SerpAPI (open circuit) and records cache hits with
+:meth:`SerpApiBudget.record_cache_hit`.
+
+* A token bucket (``rate`` calls per second, ``burst`` tokens) smooths the
+  call rate across concurrent requests.
+* Daily and monthly quotas (UTC calendar, ``0`` = unlimited) cap the spend.
+  Once one is reached, :meth:`acquire` refuses every call and the gateway
+  serves cached answers only until the period rolls over.
+* Two priority classes: ``interactive`` calls (a user is waiting) may wait
+  up to ``max_wait`` seconds for a token; ``prefetch`` calls (background
+  catalogue enrichment) always leave one token in the bucket and stop at
+  ``1 - interactive_reserve`` of each quota, so they never starve users.
+  The class comes from :func:`prefetch_priority` (a context variable) unless
+  passed explicitly.
+* A per-endpoint ledger (calls, cache hits, refusals) is persisted as JSON.
+  :meth:`flush` merges this process' increments into the file, so several
+  workers sharing it account for each other's calls.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, Optional
+
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+LEDGER_PATH = BASE_DIR / "data" / "serpapi_ledger.json"
+
+_priority: ContextVar[str] = ContextVar("serpapi_priority", default=INTERACTIVE)
+
+_COUNTERS = ("calls", "cacheHits", "denied")
+
+
+@contextmanager
+def prefetch_priority() -> Iterator[None]:
+    """Run the SerpAPI calls made inside the block with ``prefetch`` priority.
+
+    Tasks created inside the block inherit the class.
+    """
+
+    token = _priority.set(PREFETCH)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class SerpApiBudget:
+    def __init__(
+        self,
+        *,
+        rate: float = 5.0,
+        burst: int = 10,
+        daily_quota: int = 0,
+        monthly_quota: int = 0,
+        interactive_reserve: float = 0.2,
+        max_wait: float = 2.0,
+        prefetch_max_wait: float = 30.0,
+        ledger_path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.rate = max(float(rate), 0.0)
+        self.burst = max(int(burst), 1)
+        self.daily_quota = max(int(daily_quota), 0)
+        self.monthly_quota = max(int(monthly_quota), 0)
+        self.interactive_reserve = min(max(float(interactive_reserve), 0.0), 1.0)
+        self.max_wait = max(float(max_wait), 0.0)
+        self.prefetch_max_wait = max(float(prefetch_max_wait), 0.0)
+        self.ledger_path = ledger_path
+        self._clock = clock
+        self._lock = Lock()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._ledger = _empty_ledger(self._now())
+        # Increments not yet merged into the ledger file.
+        self._pending = _empty_ledger(self._now())
+        self._load()
+
+    async def acquire(self, endpoint: str, *, priority: Optional[str] = None) -> bool:
+        """Reserve one call to ``endpoint``; ``False`` means answer from cache."""
+
+        priority = priority or _priority.get()
+        if not self._within_quota(priority):
+            self._count(endpoint, "denied")
+            return False
+
+        # Prefetch calls leave one token for interactive requests.
+        floor = 1.0 if priority == PREFETCH else 0.0
+        deadline = time.monotonic() + (
+            self.prefetch_max_wait if priority == PREFETCH else self.max_wait
+        )
+        while True:
+            wait = self._take_token(floor)
+            if wait == 0.0:
+                break
+            if self.rate <= 0 or time.monotonic() + wait > deadline:
+                self._count(endpoint, "denied")
+                return False
+            await asyncio.sleep(wait)
+
+        # Quotas may have been reached by the calls admitted while waiting.
+        if not self._within_quota(priority):
+            self._count(endpoint, "denied")
+            return False
+        self._count(endpoint, "calls")
+        return True
+
+    def refund(self, endpoint: str) -> None:
+        """Give back a call granted by :meth:`acquire` that never reached SerpAPI."""
+
+        with self._lock:
+            self._tokens = min(float(self.burst), self._tokens + 1.0)
+        self._count(endpoint, "calls", -1)
+
+    def record_cache_hit(self, endpoint: str) -> None:
+        """Count a call avoided thanks to a cached answer."""
+
+        self._count(endpoint, "cacheHits")
+
+    @property
+    def exhausted(self) -> bool:
+        """``True`` while a quota is reached (cache-only mode)."""
+
+        return not self._within_quota(INTERACTIVE)
+
+    def flush(self) -> None:
+        """Merge this process' increments into the ledger file."""
+
+        if self.ledger_path is None:
+            return
+        with self._lock:
+            now = self._now()
+            pending, self._pending = self._pending, _empty_ledger(now)
+            if not pending["endpoints"]:
+                return
+            stored = self._read_file()
+            if stored is None:
+                merged = _rolled(self._ledger, now)
+            else:
+                # The file holds what every worker flushed so far.
+                merged = _merge(_rolled(stored, now), pending)
+            self._ledger = merged
+            try:
+                self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+                temporary = self.ledger_path.with_suffix(".tmp")
+                temporary.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+                os.replace(temporary, self.ledger_path)
+            except OSError:
+                # The in-memory ledger stays authoritative for this process.
+                pass
+
+    async def run_flusher(self, interval: float) -> None:
+        """Flush the ledger periodically until the task is cancelled."""
+
+        delay = max(float(interval), 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ledger = _rolled(self._ledger, self._now())
+            self._ledger = ledger
+        return {
+            "mode": "cache-only" if self.exhausted else "normal",
+            "tokens": round(self._tokens, 2),
+            "rate": self.rate,
+            "burst": self.burst,
+            "day": ledger["day"],
+            "dayCalls": ledger["dayCalls"],
+            "dailyQuota": self.daily_quota or None,
+            "month": ledger["month"],
+            "monthCalls": ledger["monthCalls"],
+            "monthlyQuota": self.monthly_quota or None,
+            "endpoints": ledger["endpoints"],
+        }
+
+    def _within_quota(self, priority: str) -> bool:
+        with self._lock:
+            ledger = self._ledger = _rolled(self._ledger, self._now())
+            share = 1.0 - self.interactive_reserve if priority == PREFETCH else 1.0
+            for used, quota in (
+                (ledger["dayCalls"], self.daily_quota),
+                (ledger["monthCalls"], self.monthly_quota),
+            ):
+                if quota and used >= quota * share:
+                    return False
+        return True
+
+    def _take_token(self, floor: float) -> float:
+        """Take a token if one is available above ``floor``, else the wait time."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                float(self.burst), self._tokens + (now - self._refilled_at) * self.rate
+            )
+            self._refilled_at = now
+            if self._tokens - 1.0 >= floor:
+                self._tokens -= 1.0
+                return 0.0
+            missing = floor + 1.0 - self._tokens
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def _count(self, endpoint: str, counter: str, delta: int = 1) -> None:
+        with self._lock:
+            now = self._now()
+            self._ledger = _rolled(self._ledger, now)
+            self._pending = _rolled(self._pending, now)
+            for ledger in (self._ledger, self._pending):
+                counters = ledger["endpoints"].setdefault(endpoint, dict.fromkeys(_COUNTERS, 0))
+                counters[counter] = counters.get(counter, 0) + delta
+                if counter == "calls":
+                    ledger["dayCalls"] += delta
+                    ledger["monthCalls"] += delta
+
+    def _load(self) -> None:
+        stored = self._read_file()
+        if stored is not None:
+            self._ledger = _rolled(stored, self._now())
+
+    def _read_file(self) -> Optional[Dict[str, Any]]:
+        if self.ledger_path is None or not self.ledger_path.exists():
+            return None
+        try:
+            raw = json.loads(self.ledger_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(raw, dict) or not isinstance(raw.get("endpoints"), dict):
+            return None
+        return raw
+
+    def _now(self) -> datetime:
+        return datetime.fromtimestamp(self._clock(), tz=timezone.utc)
+
+
+def _empty_ledger(now: datetime) -> Dict[str, Any]:
+    return {
+        "day": now.strftime("%Y-%m-%d"),
+        "dayCalls": 0,
+        "month": now.strftime("%Y-%m"),
+        "monthCalls": 0,
+        "endpoints": {},
+    }
+
+
+def _rolled(ledger: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """``ledger`` with the period counters reset if the day/month changed.
+
+    Endpoint counters are lifetime totals and are kept.
+    """
+
+    day, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+    if ledger.get("day") == day and ledger.get("month") == month:
+        return ledger
+    rolled = dict(ledger)
+    if rolled.get("month") != month:
+        rolled["month"], rolled["monthCalls"] = month, 0
+    if rolled.get("day") != day:
+        rolled["day"], rolled["dayCalls"] = day, 0
+    return rolled
+
+
+def _merge(base: Dict[str, Any], increments: Dict[str, Any]) -> Dict[str, Any]:
+    merged = {
+        **base,
+        "endpoints": {name: dict(counters) for name, counters in base["endpoints"].items()},
+    }
+    if increments["day"] == merged["day"]:
+        merged["dayCalls"] += increments["dayCalls"]
+    if increments["month"] == merged["month"]:
+        merged["monthCalls"] += increments["monthCalls"]
+    for name, counters in increments["endpoints"].items():
+        target = merged["endpoints"].setdefault(name, dict.fromkeys(_COUNTERS, 0))
+        for counter, value in counters.items():
+            target[counter] = target.get(counter, 0) + value
+    return merged
+
+
+serpapi_budget = SerpApiBudget(
+    rate=float(os.getenv("SERPAPI_RATE_PER_SECOND", "5")),
+    burst=int(os.getenv("SERPAPI_BURST", "10")),
+    daily_quota=int(os.getenv("SERPAPI_DAILY_QUOTA", "0")),
+    monthly_quota=int(os.getenv("SERPAPI_MONTHLY_QUOTA", "0")),
+    interactive_reserve=float(os.getenv("SERPAPI_INTERACTIVE_RESERVE", "0.2")),
+    max_wait=float(os.getenv("SERPAPI_MAX_WAIT_SECONDS", "2")),
+    ledger_path=LEDGER_PATH,
+)
+
+__all__ = [
+    "INTERACTIVE",
+    "PREFETCH",
+    "SerpApiBudget",
+    "prefetch_priority",
+    "serpapi_budget",
+]
@@ -0,0 +1,145 @@
+"""Trim SerpAPI responses down to the fields the gateway reads.
+
+``google_shopping`` and ``google_product`` responses carry search metadata,
+filters, pagination, immersive-page tokens, reviews and specs that the
+gateway never looks at, yet they used to be cached and persisted whole. The
+projections below keep only what ``collect_serp_deals``,
+``build_serp_product_detail`` and the SERP product cache consume; extend the
+field lists when a new field starts being read.
+
+Error payloads (``{"error": ...}``) are returned unchanged. Projecting an
+already projected payload is a no-op.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List
+
+IMAGE_FIELDS = ("image", "link", "thumbnail", "source")
+
+SHOPPING_RESULT_FIELDS = (
+    "title",
+    "product_id",
+    "productId",
+    "product_link",
+    "link",
+    "source",
+    "merchant",
+    "price",
+    "rating",
+    "reviews",
+    "thumbnail",
+    "image",
+    "availability",
+    "shipping",
+)
+
+PRODUCT_RESULT_FIELDS = (
+    "title",
+    "name",
+    "brand",
+    "manufacturer",
+    "seller",
+    "category",
+    "type",
+    "thumbnail",
+    "image",
+    "product_id",
+    "link",
+    "product_link",
+)
+
+SELLER_FIELDS = (
+    "name",
+    "source",
+    "title",
+    "link",
+    "product_link",
+    "price",
+    "base_price",
+    "total_price",
+    "shipping",
+    "shipping_cost",
+    "availability",
+    "rating",
+    "reviews",
+    "thumbnail",
+    "image",
+    "image_link",
+)
+
+
+def project_shopping_payload(payload: Any) -> Any:
+    """Keep the ``shopping_results`` fields used to build deals."""
+
+    if not isinstance(payload, dict) or "error" in payload:
+        return payload
+
+    results = payload.get("shopping_results")
+    projected: Dict[str, Any] = {}
+    if isinstance(results, list):
+        items: List[Dict[str, Any]] = []
+        for item in results:
+            if not isinstance(item, dict):
+                continue
+            entry = _pick(item, SHOPPING_RESULT_FIELDS)
+            photos = _pick_images(item.get("product_photos"))
+            if photos:
+                entry["product_photos"] = photos
+            items.append(entry)
+        projected["shopping_results"] = items
+    return projected
+
+
+def project_product_payload(payload: Any) -> Any:
+    """Keep the ``product_results`` and ``online_sellers`` fields in use."""
+
+    if not isinstance(payload, dict) or "error" in payload:
+        return payload
+
+    projected: Dict[str, Any] = {}
+    product_results = payload.get("product_results")
+    if isinstance(product_results, dict):
+        product = _pick(product_results, PRODUCT_RESULT_FIELDS)
+        media = [
+            {"type": "image", **_pick(item, IMAGE_FIELDS)}
+            for item in product_results.get("media") or ()
+            if isinstance(item, dict) and item.get("type") == "image"
+        ]
+        if media:
+            product["media"] = media
+        for key in ("inline_images", "images"):
+            images = _pick_images(product_results.get(key))
+            if images:
+                product[key] = images
+        projected["product_results"] = product
+
+    # Always present, so a successful lookup never projects to a falsy {}.
+    sellers_results = payload.get("sellers_results")
+    online_sellers = (
+        sellers_results.get("online_sellers") if isinstance(sellers_results, dict) else None
+    )
+    projected["sellers_results"] = {
+        "online_sellers": [
+            _pick(seller, SELLER_FIELDS)
+            for seller in online_sellers or ()
+            if isinstance(seller, dict)
+        ]
+    }
+    return projected
+
+
+def _pick(source: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    return {field: source[field] for field in fields if source.get(field) is not None}
+
+
+def _pick_images(images: Any) -> List[Dict[str, Any]]:
+    if not isinstance(images, list):
+        return []
+    picked = [_pick(image, IMAGE_FIELDS) for image in images if isinstance(image, dict)]
+    return [image for image in picked if image]
+
+
+__all__ = [
+    "project_product_payload",
+    "project_shopping_payload",
+]
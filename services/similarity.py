@@ -0,0 +1,195 @@
+"""Product similarity: precomputed features and top-k neighbour lists.
+
+:func:`similarity_score` is the gateway's scoring rule: brand match or
+containment, same category, share of the base name's keywords found in the
+candidate, a shared flavour keyword, and protein per serving within 2 g. It
+works on :class:`ProductFeatures`, which are extracted once per product
+instead of re-tokenizing names and reparsing floats for every pair.
+
+:class:`SimilarityIndex` scores every pair of a catalogue once, off the
+request path, and keeps the best ``top_k`` neighbours of each product, so
+similar/related lookups no longer score anything.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+_KEYWORD_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
+
+def tokenize_keywords(value: Optional[str]) -> set[str]:
+    if not value:
+        return set()
+    tokens = _KEYWORD_SPLIT_RE.split(value.lower())
+    return {token for token in tokens if len(token) >= 3}
+
+
+@dataclass(frozen=True)
+class ProductFeatures:
+    brand: str
+    category: str
+    name_tokens: FrozenSet[str]
+    flavour_tokens: FrozenSet[str]
+    protein: Optional[float]
+
+
+def extract_features(product: Mapping[str, Any]) -> ProductFeatures:
+    return ProductFeatures(
+        brand=(product.get("brand") or "").strip().lower(),
+        category=(product.get("category") or "").strip().lower(),
+        name_tokens=frozenset(tokenize_keywords(product.get("name"))),
+        flavour_tokens=frozenset(tokenize_keywords(product.get("flavour"))),
+        protein=_parse_float(product.get("protein_per_serving_g")),
+    )
+
+
+def similarity_score(base: ProductFeatures, candidate: ProductFeatures) -> float:
+    head, flavour, protein = _shared_scores(base, candidate)
+    return head + _name_score(base, candidate) + flavour + protein
+
+
+class SimilarityIndex:
+    """Top-k most similar products of each product of a catalogue.
+
+    Neighbours are ordered by decreasing score, ties keeping catalogue
+    order, and only products scoring above zero are kept.
+    """
+
+    def __init__(
+        self,
+        products: Sequence[Mapping[str, Any]],
+        *,
+        top_k: int = 12,
+        version: Any = None,
+    ) -> None:
+        self.version = version
+        self.top_k = max(int(top_k), 1)
+        self.keys: List[str] = []
+        self.products: Dict[str, Mapping[str, Any]] = {}
+        self._positions: Dict[str, int] = {}
+        features: List[ProductFeatures] = []
+        for product in products:
+            identifier = product.get("id")
+            if identifier is None or str(identifier) in self.products:
+                continue
+            key = str(identifier)
+            self._positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.products[key] = product
+            features.append(extract_features(product))
+        self._neighbours = _top_neighbours(features, self.top_k)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return str(key) in self.products
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def neighbours(self, key: Hashable, limit: Optional[int] = None) -> List[Tuple[float, str]]:
+        """``(score, key)`` of the best neighbours of ``key`` (empty if unknown)."""
+
+        position = self._positions.get(str(key))
+        if position is None:
+            return []
+        ranked = [(score, self.keys[other]) for score, other in self._neighbours[position]]
+        return ranked[:limit] if limit is not None else ranked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "products": len(self.keys),
+            "topK": self.top_k,
+            "version": self.version,
+        }
+
+
+def _top_neighbours(features: Sequence[ProductFeatures], top_k: int) -> List[List[Tuple[float, int]]]:
+    count = len(features)
+    # Per product, a min-heap of (score, -position) keeping the best top_k.
+    heaps: List[List[Tuple[float, int]]] = [[] for _ in range(count)]
+    for i in range(count):
+        base = features[i]
+        for j in range(i + 1, count):
+            other = features[j]
+            head, flavour, protein = _shared_scores(base, other)
+            for source, target, score in (
+                (i, j, head + _name_score(base, other) + flavour + protein),
+                (j, i, head + _name_score(other, base) + flavour + protein),
+            ):
+                if score <= 0:
+                    continue
+                heap = heaps[source]
+                item = (score, -target)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+    return [
+        [(score, -negative) for score, negative in sorted(heap, reverse=True)]
+        for heap in heaps
+    ]
+
+
+def _shared_scores(base: ProductFeatures, candidate: ProductFeatures) -> Tuple[float, float, float]:
+    """Symmetric parts of the score: brand + category, flavour, protein.
+
+    Kept apart so the terms are summed in the historical order and scores
+    (and therefore ties) stay bit-for-bit identical.
+    """
+
+    head = 0.0
+    if base.brand and candidate.brand:
+        if base.brand == candidate.brand:
+            head += 3.0
+        elif base.brand in candidate.brand or candidate.brand in base.brand:
+            head += 1.5
+
+    if base.category and candidate.category and base.category == candidate.category:
+        head += 1.5
+
+    flavour = 0.0
+    if base.flavour_tokens and candidate.flavour_tokens:
+        if base.flavour_tokens & candidate.flavour_tokens:
+            flavour = 1.0
+
+    protein = 0.0
+    if (
+        base.protein is not None
+        and candidate.protein is not None
+        and abs(base.protein - candidate.protein) <= 2
+    ):
+        protein = 0.5
+    return head, flavour, protein
+
+
+def _name_score(base: ProductFeatures, candidate: ProductFeatures) -> float:
+    """Share of the base name's keywords found in the candidate name."""
+
+    if base.name_tokens and candidate.name_tokens:
+        overlap = base.name_tokens & candidate.name_tokens
+        if overlap:
+            return 2.0 * len(overlap) / max(len(base.name_tokens), 1)
+    return 0.0
+
+
+def _parse_float(value: Any) -> Optional[float]:
+    # Same rules as the gateway's parse_float (decimal comma accepted).
+    if value is None:
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return float(value)
+        return float(str(value).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+__all__ = [
+    "ProductFeatures",
+    "SimilarityIndex",
+    "extract_features",
+    "similarity_score",
+    "tokenize_keywords",
+]
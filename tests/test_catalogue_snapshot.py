@@ -0,0 +1,109 @@
+import asyncio
+
+from services.catalogue_snapshot import CatalogueSnapshotStore
+
+
+def product(product_id, price):
+    return {"id": product_id, "bestPrice": {"amount": price}}
+
+
+class Builder:
+    def __init__(self, *catalogues):
+        self.catalogues = list(catalogues)
+        self.calls = 0
+        self.gate = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.catalogues.pop(0)
+
+
+def build(builder, changes=None):
+    async def on_change(snapshot, previous):
+        changes.append((snapshot, previous))
+
+    return CatalogueSnapshotStore(
+        builder=builder,
+        sorter=lambda products, key: sorted(
+            products, key=lambda item: item["bestPrice"]["amount"], reverse=key == "price_desc"
+        ),
+        sort_keys=("price_asc", "price_desc"),
+        on_change=on_change if changes is not None else None,
+    )
+
+
+def test_a_new_version_is_published_only_when_the_content_changes():
+    changes = []
+    store = build(
+        Builder(
+            [product(1, 30.0), product(2, 20.0)],
+            [product(1, 30.0), product(2, 20.0)],
+            [product(1, 25.0), product(2, 20.0)],
+        ),
+        changes,
+    )
+
+    async def run():
+        return [await store.refresh() for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, False, True]
+    snapshot = store.current
+    assert snapshot.version == 2
+    assert [item["id"] for item in snapshot.ordered("price_desc", "price_asc")] == [1, 2]
+    assert [item["id"] for item in snapshot.ordered("unknown", "price_asc")] == [2, 1]
+    assert [previous.version if previous else None for _, previous in changes] == [None, 1]
+    assert snapshot.changes_since(changes[1][1]) == (False, [1])
+
+
+def test_an_empty_or_failed_build_keeps_the_previous_snapshot():
+    async def failing():
+        raise RuntimeError("scraper down")
+
+    builder = Builder([product(1, 30.0)], [])
+    store = build(builder)
+
+    async def run():
+        await store.refresh()
+        await store.refresh()
+        store.builder = failing
+        await store.refresh()
+
+    asyncio.run(run())
+
+    assert store.current.version == 1
+    assert store.current.products == (product(1, 30.0),)
+    assert store.stats()["catalogueRefreshFailures"] == 2
+
+
+def test_membership_changes_are_reported_as_such():
+    store = build(Builder([product(1, 30.0)], [product(1, 30.0), product(2, 20.0)]))
+
+    async def run():
+        await store.refresh()
+        first = store.current
+        await store.refresh()
+        return first
+
+    first = asyncio.run(run())
+    assert store.current.changes_since(first) == (True, [])
+
+
+def test_request_refresh_does_not_start_a_second_build():
+    builder = Builder([product(1, 30.0)], [product(1, 25.0)])
+    store = build(builder)
+
+    async def run():
+        builder.gate = asyncio.Event()
+        store.request_refresh()
+        await asyncio.sleep(0)
+        store.request_refresh()
+        waiting = asyncio.ensure_future(store.refresh())
+        await asyncio.sleep(0)
+        builder.gate.set()
+        return await waiting
+
+    assert asyncio.run(run()) is True
+    assert builder.calls == 1
+    assert store.current.version == 1
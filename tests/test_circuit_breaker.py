@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerTransport,
+    CircuitOpenError,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker("scraper", failure_threshold=3, clock=Clock())
+
+    breaker.record_failure("timeout")
+    breaker.record_failure("timeout")
+    breaker.record_success()
+    breaker.record_failure("timeout")
+    breaker.record_failure("timeout")
+    assert breaker.state == CLOSED
+
+    breaker.record_failure("timeout")
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_half_open_admits_one_trial():
+    clock = Clock()
+    breaker = CircuitBreaker("serpapi", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure("HTTP 503")
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    breaker.before_request()
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_failure("HTTP 503")
+    assert breaker.state == OPEN
+    clock.now = 20
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_transport_counts_server_errors_and_fails_fast_when_open():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    breaker = CircuitBreaker("scraper", failure_threshold=2, clock=Clock())
+    transport = CircuitBreakerTransport(httpx.MockTransport(handler), breaker)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url="http://scraper") as client:
+            statuses = [(await client.get("/products")).status_code for _ in range(2)]
+            with pytest.raises(httpx.HTTPError):
+                await client.get("/products")
+            return statuses
+
+    assert asyncio.run(run()) == [503, 503]
+    assert len(calls) == 2
+    assert breaker.stats()["rejected"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from services.deadlines import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    current_deadline,
+    no_deadline,
+    remaining_seconds,
+    request_deadline,
+    within_deadline,
+)
+
+
+def test_calls_get_the_remaining_budget_and_flag_the_request():
+    async def run():
+        with request_deadline(0.05) as deadline:
+            assert await within_deadline(asyncio.sleep(0, result="fast")) == "fast"
+            with pytest.raises(DeadlineExceeded):
+                await within_deadline(asyncio.sleep(1))
+            with pytest.raises(DeadlineExceeded):
+                await within_deadline(asyncio.sleep(0))
+            return deadline.partial
+
+    assert asyncio.run(run()) is True
+
+
+def test_nested_deadlines_never_extend_and_background_work_is_detached():
+    with request_deadline(1) as outer:
+        with request_deadline(10) as inner:
+            assert inner is outer
+        with no_deadline():
+            assert remaining_seconds() is None
+    assert current_deadline() is None
+
+
+def run_middleware(path, headers=()):
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["remaining"] = remaining_seconds()
+        if scope["path"] == "/slow":
+            try:
+                await within_deadline(asyncio.sleep(1))
+            except DeadlineExceeded:
+                pass
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"cache-control", b"max-age=60")]})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = DeadlineMiddleware(
+        app,
+        deadline_for=lambda route: 0.05 if route == "/slow" else None,
+        max_seconds=5,
+    )
+    scope = {"type": "http", "path": path, "headers": list(headers)}
+    asyncio.run(middleware(scope, None, send))
+    return seen["remaining"], dict(sent[0]["headers"])
+
+
+def test_partial_responses_are_flagged_and_not_cacheable():
+    remaining, headers = run_middleware("/slow")
+
+    assert 0 < remaining <= 0.05
+    assert headers[b"x-partial-response"] == b"deadline"
+    assert headers[b"cache-control"] == b"no-store"
+
+
+def test_header_overrides_the_route_deadline_up_to_the_maximum():
+    remaining, headers = run_middleware("/fast", [(b"x-request-timeout", b"30")])
+
+    assert 4.5 < remaining <= 5
+    assert b"x-partial-response" not in headers
+    assert run_middleware("/fast")[0] is None
@@ -0,0 +1,45 @@
+import asyncio
+
+from services.http_clients import UpstreamClients
+
+
+def build():
+    clients = UpstreamClients()
+    clients.register("scraper", base_url="http://scraper.test")
+    return clients
+
+
+def test_a_client_replaced_for_another_loop_is_closed():
+    clients = build()
+
+    async def open_client():
+        client = clients.get("scraper")
+        await asyncio.sleep(0.01)
+        return client
+
+    first = asyncio.run(open_client())
+    second = asyncio.run(open_client())
+
+    assert second is not first
+    assert first.is_closed and not second.is_closed
+    asyncio.run(clients.aclose())
+    assert second.is_closed
+
+
+def test_clients_replaced_outside_a_loop_are_closed_on_shutdown():
+    clients = build()
+    first = clients.get("scraper")
+
+    async def open_client():
+        client = clients.get("scraper")
+        await asyncio.sleep(0.01)
+        return client
+
+    second = asyncio.run(open_client())
+    third = clients.get("scraper")
+
+    assert first.is_closed
+    assert not second.is_closed
+    asyncio.run(clients.aclose())
+    assert second.is_closed and third.is_closed
+    assert clients.stats()["open"] == []
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from services.local_cache import LocalCache
+
+
+def test_entries_survive_a_restart_and_expire(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = LocalCache(path)
+    cache.set("fresh", {"price": 29.9})
+    cache.set("gone", "old", ttl=1)
+    cache.set("forever", [1, 2], ttl=0)
+
+    db = sqlite3.connect(str(path))
+    db.execute("UPDATE entries SET expires_at = 0 WHERE key = 'gone'")
+    db.commit()
+    db.close()
+
+    reopened = LocalCache(path)
+    assert reopened.get("fresh") == {"price": 29.9}
+    assert reopened.get("forever") == [1, 2]
+    assert reopened.get("gone") is None
+    assert reopened.get_or_set("gone", lambda: "new") == "new"
+
+
+def test_a_write_only_touches_its_own_row(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = LocalCache(path)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    db = sqlite3.connect(str(path))
+    db.execute("UPDATE entries SET value = '20' WHERE key = 'b'")
+    db.commit()
+    db.close()
+    cache.set("a", 10)
+
+    assert LocalCache(path).get("b") == 20
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy = tmp_path / "local_cache.json"
+    expires = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    past = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    legacy.write_text(json.dumps({
+        "kept": {"value": {"q": "whey"}, "expires_at": expires},
+        "stale": {"value": 1, "expires_at": past},
+    }))
+    path = tmp_path / "cache.sqlite3"
+
+    cache = LocalCache(path, legacy_path=legacy)
+    assert cache.get("kept") == {"q": "whey"}
+    assert cache.get("stale") is None
+
+    cache.set("kept", "updated")
+    assert LocalCache(path, legacy_path=legacy).get("kept") == "updated"
+
+
+class StubRedis:
+    """Async Redis stand-in whose calls hang, fail or return ``stored``."""
+
+    def __init__(self, mode, stored=None):
+        self.mode = mode
+        self.stored = stored
+        self.writes = []
+
+    def pipeline(self):
+        return self
+
+    def get(self, key):
+        return self
+
+    def pttl(self, key):
+        return self
+
+    async def reply(self, value):
+        if self.mode == "hang":
+            await asyncio.Event().wait()
+        if self.mode == "fail":
+            raise ConnectionError("redis down")
+        return value
+
+    async def execute(self):
+        return await self.reply([self.stored, 60_000])
+
+    async def set(self, key, value, px=None):
+        await self.reply(None)
+        self.writes.append((key, value, px))
+
+
+def test_async_tier_never_blocks_the_event_loop(tmp_path):
+    hanging = LocalCache(tmp_path / "a.sqlite3", async_redis_client=StubRedis("hang"),
+                         redis_timeout=0.05)
+    failing = LocalCache(tmp_path / "b.sqlite3", async_redis_client=StubRedis("fail"))
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = (
+            await hanging.aget("k"),
+            await failing.aget("k"),
+            await hanging.aset("k", [1]),
+            await failing.aset("k", [2]),
+        )
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(run())
+    assert results == (None, None, None, None)
+    assert ticks >= 5
+    assert hanging.get("k") == [1] and failing.get("k") == [2]
+
+
+def test_async_tier_shares_entries_between_workers(tmp_path):
+    redis = StubRedis("ok", stored=json.dumps({"offers": 3}))
+    cache = LocalCache(tmp_path / "cache.sqlite3", async_redis_client=redis)
+
+    async def run():
+        promoted = await cache.aget("serpapi:product:1")
+        await cache.aset("serpapi:product:2", {"offers": 1}, ttl=60)
+        return promoted
+
+    assert asyncio.run(run()) == {"offers": 3}
+    assert cache.get("serpapi:product:1") == {"offers": 3}
+    assert redis.writes == [("fitidion:local:serpapi:product:2", '{"offers": 1}', 60_000)]
+
+
+def test_only_recently_used_entries_stay_in_memory(tmp_path):
+    cache = LocalCache(tmp_path / "cache.sqlite3", memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    cache.get("b")
+    cache.set("d", "D")
+
+    assert list(cache._data) == ["b", "d"]
+    assert cache.get("a") == "A"
+    assert list(cache._data) == ["d", "a"]
+
+
+def test_async_accessors_keep_sqlite_off_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingCache(LocalCache):
+        def _read(self, key):
+            threads.append(threading.get_ident())
+            return super()._read(key)
+
+        def _write(self, key, value, expires_at):
+            threads.append(threading.get_ident())
+            super()._write(key, value, expires_at)
+
+    cache = RecordingCache(tmp_path / "cache.sqlite3")
+
+    async def run():
+        await cache.aset("k", {"offers": 2})
+        return threading.get_ident(), await cache.aget("k")
+
+    loop_thread, value = asyncio.run(run())
+    assert value == {"offers": 2}
+    assert threads and loop_thread not in threads
@@ -0,0 +1,76 @@
+import random
+
+from services.negative_cache import NegativeCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def build(clock, **options):
+    return NegativeCache(base=10, max_backoff=80, clock=clock, rng=random.Random(3), **options)
+
+
+def test_failure_is_served_until_the_backoff_window_closes():
+    clock = Clock()
+    cache = build(clock)
+
+    delay = cache.record_failure("serpapi:product:fr:fr:1", {"error": "Timeout"})
+
+    assert 5 <= delay <= 10
+    assert cache.get("serpapi:product:fr:fr:1") == {"error": "Timeout"}
+    assert cache.get("serpapi:product:fr:fr:2") is None
+    clock.now += delay
+    assert cache.get("serpapi:product:fr:fr:1") is None
+
+
+def test_backoff_doubles_up_to_the_maximum_and_resets_on_success():
+    clock = Clock()
+    cache = build(clock)
+
+    delays = []
+    for _ in range(6):
+        delays.append(cache.record_failure("key", {"error": "Timeout"}))
+        clock.now += delays[-1]
+    for failures, delay in enumerate(delays, start=1):
+        window = min(10 * 2 ** (failures - 1), 80)
+        assert window / 2 <= delay <= window
+
+    cache.record_success("key")
+    assert cache.get("key") is None
+    assert cache.record_failure("key", {"error": "Timeout"}) <= 10
+
+
+def test_old_failures_are_forgotten():
+    clock = Clock()
+    cache = build(clock)
+
+    cache.record_failure("key", {"error": "Timeout"})
+    cache.record_failure("key", {"error": "Timeout"})
+    clock.now += 2 * 80
+    assert cache.record_failure("key", {"error": "Timeout"}) <= 10
+
+
+def test_entries_are_bounded():
+    cache = build(Clock(), max_entries=2)
+
+    for key in ("a", "b", "c"):
+        cache.record_failure(key, {"error": "Timeout"})
+
+    assert len(cache) == 2
+    assert cache.get("a") is None
+
+
+def test_a_key_failing_forever_stays_at_the_maximum_backoff():
+    clock = Clock()
+    cache = build(clock)
+
+    for _ in range(2000):
+        delay = cache.record_failure("key", {"error": "Timeout"})
+        clock.now += delay
+
+    assert 40 <= delay <= 80
@@ -0,0 +1,27 @@
+import asyncio
+
+import main
+
+
+def test_serp_fallback_is_filtered_through_the_serp_index(monkeypatch):
+    async def no_products(limit=None):
+        return []
+
+    async def collect_serp_deals(query, *, marque=None, categorie=None, limit=10):
+        return [
+            main.convert_scraper_offer_to_deal(
+                {"id": f"serp-{index}", "name": name}, {"id": "serp", "price": 20.0 + index}
+            )
+            for index, name in enumerate(("Protéine Vanille", "Créatine", "Whey Protéine Choco"))
+        ]
+
+    monkeypatch.setattr(main, "fetch_scraper_products", no_products)
+    monkeypatch.setattr(main, "collect_serp_deals", collect_serp_deals)
+    index = main.PRODUCT_SEARCH_INDEXES["serp"]
+    queries = index.queries
+
+    results = asyncio.run(main.search_products("", name="proteine", limit=5))
+
+    assert [item["name"] for item in results] == ["Protéine Vanille", "Whey Protéine Choco"]
+    assert index.queries == queries + 1
+    assert all(main._serp_index_key(item) in index for item in results)
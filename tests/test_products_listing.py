@@ -0,0 +1,76 @@
+import asyncio
+
+import main
+
+PRODUCTS = [
+    {"id": 1, "name": "Whey A", "brand": "Alpha"},
+    {"id": 2, "name": "Whey B", "brand": "Beta"},
+    {"id": 3, "name": "Whey C", "brand": "Gamma"},
+]
+SCRAPER_PRICES = {1: 30.0, 2: 35.0, 3: 40.0}
+# Cheaper SerpAPI offers, only fetched for the returned page.
+SERP_PRICES = {"Whey B": 12.0, "Whey C": 25.0}
+
+
+def install_upstreams(monkeypatch):
+    serp_queries = []
+
+    async def fetch_products(limit=None):
+        return [dict(product) for product in PRODUCTS]
+
+    async def fetch_with_offers(product_ids):
+        return {
+            product_id: {
+                **PRODUCTS[product_id - 1],
+                "offers": [{"id": 1, "price": SCRAPER_PRICES[product_id], "in_stock": True}],
+            }
+            for product_id in product_ids
+        }
+
+    async def collect_serp_deals(query, *, marque=None, categorie=None, limit=10):
+        serp_queries.append(query)
+        if query not in SERP_PRICES:
+            return []
+        return [
+            main.convert_scraper_offer_to_deal(
+                {"id": f"serp-{query}", "name": query},
+                {"id": "serp", "price": SERP_PRICES[query], "in_stock": True},
+            )
+        ]
+
+    # No background snapshot: /products builds previews, then the page.
+    monkeypatch.setattr(main, "CATALOGUE_SNAPSHOT_REFRESH_SECONDS", 0)
+    monkeypatch.setattr(main, "fetch_scraper_products", fetch_products)
+    monkeypatch.setattr(main, "fetch_scraper_products_with_offers", fetch_with_offers)
+    monkeypatch.setattr(main, "collect_serp_deals", collect_serp_deals)
+    return serp_queries
+
+
+def list_products(**options):
+    params = dict(
+        search=None, page=1, per_page=24, min_price=None, max_price=None, brands=None,
+        min_rating=None, in_stock=None, category=None, sort="price_asc", response=None,
+    )
+    params.update(options)
+    return asyncio.run(main.list_products(**params))
+
+
+def test_only_the_returned_page_is_enriched(monkeypatch):
+    serp_queries = install_upstreams(monkeypatch)
+
+    payload = list_products(per_page=2)
+
+    assert sorted(serp_queries) == ["Whey A", "Whey B"]
+    assert payload["pagination"]["total"] == 3
+    assert [item["id"] for item in payload["products"]] == [2, 1]
+    assert payload["products"][0]["bestPrice"]["amount"] == 12.0
+
+
+def test_enriched_pages_still_honour_the_price_filters(monkeypatch):
+    install_upstreams(monkeypatch)
+
+    payload = list_products(min_price=28, sort="price_desc")
+
+    # Whey B and Whey C passed on their scraper preview, not with SerpAPI prices.
+    assert [item["id"] for item in payload["products"]] == [1]
+    assert all(item["bestPrice"]["amount"] >= 28 for item in payload["products"])
@@ -0,0 +1,492 @@
+import asyncio
+import gzip
+import time
+
+import pytest
+
+from services.response_cache import (
+    CacheEntry,
+    CachePolicy,
+    ResponseCache,
+    ResponseCacheMiddleware,
+    SharedResponseStore,
+    SingleFlight,
+    build_etag,
+    mark_degraded,
+    select_encoding,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubApp:
+    """ASGI app answering with the queued ``(status, body, degraded)`` responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        status, body, degraded = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+        if degraded:
+            mark_degraded("scraper")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def build(app, policy=CachePolicy(soft=60, hard=600), **options):
+    clock = Clock()
+    middleware = ResponseCacheMiddleware(
+        app,
+        cache=ResponseCache(clock=clock),
+        flights=SingleFlight(),
+        policy_for=lambda path: policy,
+        clock=clock,
+        **options,
+    )
+    return middleware, clock
+
+
+def entry(body=b"{}", *, now=1000.0, tags=()):
+    return CacheEntry(
+        body=body,
+        etag=build_etag(body),
+        headers=(),
+        status_code=200,
+        stored_at=now,
+        fresh_until=now + 60,
+        stale_until=now + 600,
+        expires_at=now + 3600,
+        tags=frozenset(tags),
+    )
+
+
+async def get(middleware, path="/products", query=b"", headers=(), method="GET"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path,
+             "query_string": query, "headers": list(headers)}
+    await middleware(scope, receive, send)
+    await asyncio.gather(*middleware._revalidations)
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return sent[0]["status"], dict(sent[0]["headers"]), body
+
+
+def test_degraded_refresh_keeps_the_stale_entry():
+    app = StubApp((200, b"[1,2,3]", False), (200, b"[]", True))
+    middleware, clock = build(app)
+
+    async def run():
+        assert (await get(middleware))[2] == b"[1,2,3]"
+        clock.now += 120
+        stale = await get(middleware)
+        again = await get(middleware)
+        return stale, again
+
+    stale, again = asyncio.run(run())
+    assert stale[1][b"x-cache"] == b"STALE"
+    # Each stale hit retries the refresh; none replaced the good body.
+    assert app.calls == 3
+    assert again[1][b"x-cache"] == b"STALE" and again[2] == b"[1,2,3]"
+
+
+def test_degraded_response_is_served_stale_or_never_stored():
+    app = StubApp((200, b"[]", True), (200, b"[4]", False), (200, b"[]", True))
+    middleware, clock = build(app, CachePolicy(soft=60, hard=60))
+
+    async def run():
+        first = await get(middleware)
+        fresh = await get(middleware)
+        clock.now += 120
+        fallback = await get(middleware)
+        return first, fresh, fallback
+
+    first, fresh, fallback = asyncio.run(run())
+    assert first[2] == b"[]"
+    assert first[1][b"cache-control"] == b"no-store"
+    assert first[1][b"x-partial-response"] == b"upstream"
+    assert fresh[2] == b"[4]" and fresh[1][b"x-cache"] == b"MISS"
+    assert fallback[2] == b"[4]" and fallback[1][b"x-cache"] == b"STALE"
+
+
+def test_lru_is_bounded_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, clock=Clock())
+    for key in ("a", "b"):
+        cache.set(key, entry())
+    cache.get("a")
+    cache.set("c", entry())
+    assert "a" in cache and "b" not in cache and "c" in cache
+
+    size = entry(b"x" * 100).size
+    cache = ResponseCache(max_entries=10, max_bytes=2 * size, clock=Clock())
+    for key in ("a", "b", "c"):
+        cache.set(key, entry(b"x" * 100))
+    assert len(cache) == 2 and "a" not in cache
+    assert not cache.set("huge", entry(b"x" * 3 * size))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["rejections"] == 1
+
+
+def test_purge_drops_tagged_entries_and_refuses_bodies_computed_before_it():
+    clock = Clock()
+    cache = ResponseCache(clock=clock)
+    cache.set("/products/1/offers", entry(tags=("product:1", "catalogue")))
+    cache.set("/products/2/offers", entry(tags=("product:2",)))
+
+    started = clock.now
+    clock.now += 1
+    assert cache.purge_tags(["product:1"]) == 1
+    assert "/products/1/offers" not in cache and "/products/2/offers" in cache
+
+    # A request that started before the purge must not bring the old data back.
+    assert not cache.set("/products/1/offers", entry(tags=("product:1",)), computed_since=started)
+    clock.now += 1
+    assert cache.set("/products/1/offers", entry(tags=("product:1",)), computed_since=clock.now)
+
+
+def test_cache_key_canonicalisation():
+    policy = CachePolicy(
+        soft=60,
+        hard=600,
+        vary=frozenset({"search", "brands", "page", "category"}),
+        fold={"search": str.strip, "category": str.lower},
+        multi=frozenset({"brands"}),
+        defaults={"page": "1"},
+    )
+
+    key = policy.cache_key("/products", b"search=Whey&brands=b&brands=a&category=Isolate")
+    assert key == policy.cache_key(
+        "/products", b"brands=a&utm_source=x&search=%20Whey%20&brands=b&page=1&category=ISOLATE"
+    )
+    assert key != policy.cache_key("/products", b"search=Whey&brands=b&brands=a&page=2&category=isolate")
+    assert policy.cache_key("/products/AbC/offers", b"") == "/products/AbC/offers"
+
+
+def test_keys_only_merge_values_the_handler_treats_alike():
+    policy = CachePolicy(
+        soft=60,
+        hard=600,
+        fold={"category": str.lower},
+        tag_params={"category": "category"},
+    )
+
+    def key(query):
+        return policy.cache_key("/products", query.encode())
+
+    # Matched as raw ``.lower()`` substrings by the handler.
+    assert key("category=Stra%C3%9Fe") != key("category=strasse")
+    assert key("category=whey%20%20iso") != key("category=whey%20iso")
+    assert key("category=%20iso") != key("category=iso")
+    assert key("brand=Optimum") != key("brand=optimum")
+    assert policy.tags_for("/products", b"category=Whey%20%20Iso") == {"category:whey iso"}
+
+
+def test_concurrent_misses_are_coalesced():
+    class SlowApp(StubApp):
+        async def __call__(self, scope, receive, send):
+            await self.gate.wait()
+            await super().__call__(scope, receive, send)
+
+    app = SlowApp((200, b"[1]", False))
+    middleware, _ = build(app)
+
+    async def run():
+        app.gate = asyncio.Event()
+        requests = [asyncio.create_task(get(middleware)) for _ in range(3)]
+        await asyncio.sleep(0)
+        app.gate.set()
+        return await asyncio.gather(*requests)
+
+    responses = asyncio.run(run())
+    assert app.calls == 1
+    assert sorted(headers[b"x-cache"] for _, headers, _ in responses) == [
+        b"COALESCED", b"COALESCED", b"MISS",
+    ]
+    assert all(body == b"[1]" for _, _, body in responses)
+
+
+def test_a_failing_leader_lets_followers_compute_their_own_response():
+    class FailingOnceApp(StubApp):
+        async def __call__(self, scope, receive, send):
+            await asyncio.sleep(0.01)
+            if self.calls == 0:
+                self.calls += 1
+                raise RuntimeError("upstream exploded")
+            await super().__call__(scope, receive, send)
+
+    app = FailingOnceApp((200, b"[2]", False))
+    middleware, _ = build(app)
+
+    async def run():
+        return await asyncio.gather(get(middleware), get(middleware), return_exceptions=True)
+
+    leader, follower = asyncio.run(run())
+    assert isinstance(leader, RuntimeError)
+    assert follower[2] == b"[2]" and follower[1][b"x-cache"] == b"MISS"
+    assert app.calls == 2
+
+
+def test_stale_if_error_serves_the_expired_entry_when_recomputing_fails():
+    class BrokenApp(StubApp):
+        async def __call__(self, scope, receive, send):
+            if self.calls == 1:
+                self.calls += 1
+                raise RuntimeError("down")
+            await super().__call__(scope, receive, send)
+
+    app = BrokenApp((200, b"[3]", False), (500, b"boom", False), (500, b"boom", False))
+    middleware, clock = build(app, CachePolicy(soft=60, hard=60), stale_if_error=600)
+
+    async def run():
+        await get(middleware)
+        clock.now += 120
+        raised = await get(middleware)
+        errored = await get(middleware)
+        clock.now += 600
+        expired = await get(middleware)
+        return raised, errored, expired
+
+    raised, errored, expired = asyncio.run(run())
+    assert raised[1][b"x-cache"] == b"STALE" and raised[2] == b"[3]"
+    assert errored[1][b"x-cache"] == b"STALE" and errored[2] == b"[3]"
+    assert expired[0] == 500
+
+
+def test_stale_entries_are_served_while_refreshed_in_the_background():
+    app = StubApp((200, b"[1]", False), (200, b"[2]", False))
+    middleware, clock = build(app)
+
+    async def run():
+        await get(middleware)
+        clock.now += 120
+        stale = await get(middleware)
+        refreshed = await get(middleware)
+        return stale, refreshed
+
+    stale, refreshed = asyncio.run(run())
+    assert stale[1][b"x-cache"] == b"STALE" and stale[2] == b"[1]"
+    assert refreshed[1][b"x-cache"] == b"HIT" and refreshed[2] == b"[2]"
+
+
+def test_uncacheable_responses_pass_through():
+    class HeaderApp(StubApp):
+        async def __call__(self, scope, receive, send):
+            status, body, _ = self.responses[min(self.calls, len(self.responses) - 1)]
+            self.calls += 1
+            headers = [(b"cache-control", b"no-store")] if body == b"secret" else []
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+    app = HeaderApp((404, b"missing", False), (404, b"missing", False),
+                    (200, b"secret", False), (200, b"secret", False))
+    middleware, _ = build(app)
+
+    async def run():
+        return [
+            await get(middleware),
+            await get(middleware),
+            await get(middleware, query=b"a=1"),
+            await get(middleware, query=b"a=1"),
+            await get(middleware, query=b"b=1", headers=[(b"cache-control", b"no-store")]),
+        ]
+
+    responses = asyncio.run(run())
+    assert [status for status, _, _ in responses[:2]] == [404, 404]
+    assert all(headers[b"x-cache"] == b"MISS" for _, headers, _ in responses[:4])
+    assert b"x-cache" not in responses[4][1]
+    assert app.calls == 5
+
+
+def test_streamed_bodies_are_forwarded_chunk_by_chunk_and_cached():
+    chunks_seen = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain")]})
+        for chunk in (b"a", b"b", b"c"):
+            await send({"type": "http.response.body", "body": chunk, "more_body": chunk != b"c"})
+
+    middleware, _ = build(app)
+
+    async def run():
+        async def send(message):
+            chunks_seen.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/stream",
+                 "query_string": b"", "headers": []}
+        await middleware(scope, None, send)
+        return await get(middleware, path="/stream")
+
+    status, headers, body = asyncio.run(run())
+    assert [message.get("body") for message in chunks_seen[1:]] == [b"a", b"b", b"c"]
+    assert dict(chunks_seen[0]["headers"])[b"x-cache"] == b"MISS"
+    assert headers[b"x-cache"] == b"HIT" and body == b"abc"
+
+
+def test_conditional_requests_and_encoding_negotiation():
+    body = b"[" + b",".join(b'{"name": "whey"}' for _ in range(100)) + b"]"
+    middleware, _ = build(StubApp((200, body, False)))
+
+    async def run():
+        _, headers, _ = await get(middleware)
+        etag = headers[b"etag"]
+        return (
+            await get(middleware, headers=[(b"if-none-match", etag)]),
+            await get(middleware, headers=[(b"accept-encoding", b"gzip, deflate")]),
+            await get(middleware, headers=[(b"accept-encoding", b"gzip;q=0")]),
+            await get(middleware, method="HEAD"),
+        )
+
+    not_modified, gzipped, identity, head = asyncio.run(run())
+    assert not_modified[0] == 304 and not_modified[2] == b""
+    assert gzipped[1][b"content-encoding"] == b"gzip"
+    assert gzipped[1][b"vary"] == b"Accept-Encoding"
+    assert gzip.decompress(gzipped[2]) == body
+    assert b"content-encoding" not in identity[1] and identity[2] == body
+    assert head[2] == b"" and head[1][b"content-length"] == str(len(body)).encode()
+
+
+def test_every_cached_variant_varies_on_accept_encoding():
+    body = b"[" + b",".join(b'{"name": "whey"}' for _ in range(100)) + b"]"
+
+    async def app_with_vary(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"vary", b"Origin")]})
+        await send({"type": "http.response.body", "body": body})
+
+    plain, _ = build(StubApp((200, b"{}", False)))
+    varied, _ = build(app_with_vary)
+
+    async def run():
+        miss = await get(plain)
+        hit = await get(plain)
+        not_modified = await get(plain, headers=[(b"if-none-match", hit[1][b"etag"])])
+        await get(varied)
+        return (
+            miss,
+            hit,
+            not_modified,
+            await get(varied, headers=[(b"accept-encoding", b"gzip")]),
+            await get(varied, headers=[(b"accept-encoding", b"identity")]),
+        )
+
+    miss, hit, not_modified, gzipped, identity = asyncio.run(run())
+    assert b"content-encoding" not in hit[1] and hit[1][b"x-cache"] == b"HIT"
+    assert miss[1][b"vary"] == hit[1][b"vary"] == b"Accept-Encoding"
+    assert not_modified[0] == 304 and not_modified[1][b"vary"] == b"Accept-Encoding"
+    assert gzipped[1][b"content-encoding"] == b"gzip"
+    assert gzipped[1][b"vary"] == identity[1][b"vary"] == b"Origin, Accept-Encoding"
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("br;q=0.5, gzip", "gzip"),
+        ("br, gzip", "br"),
+        ("*", "br"),
+        ("identity", None),
+        ("gzip;q=0, br;q=0", None),
+    ],
+)
+def test_select_encoding(header, expected):
+    assert select_encoding(header, {"br": b"", "gzip": b""}) == expected
+
+
+class RecordingPipeline:
+    def __init__(self, commands):
+        self.commands = commands
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return command
+
+    async def execute(self):
+        return []
+
+
+class RecordingRedis:
+    def __init__(self):
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return RecordingPipeline(self.commands)
+
+
+def test_shared_writes_avoid_commands_newer_than_redis_2_6():
+    client = RecordingRedis()
+    store = SharedResponseStore(client)
+    now = time.time()
+
+    asyncio.run(store.set("/products", entry(now=now, tags=("catalogue", "query:whey"))))
+
+    (name, args, kwargs), (script_call, script_args, _) = client.commands
+    assert name == "set" and "pxat" not in kwargs
+    assert 3590_000 < kwargs["px"] <= 3600_000
+    assert script_call == "eval"
+    assert script_args[1:5] == (2, "fitidion:response:tag:catalogue",
+                                "fitidion:response:tag:query:whey", "/products")
+    assert script_args[5] == int((now + 3600) * 1000)
+    assert "PEXPIREAT" in script_args[0] and "NX" not in script_args[0]
+    assert store.stats()["sharedWrites"] == 1
+
+
+class PurgeRedis:
+    def __init__(self):
+        self.published = []
+
+    async def smembers(self, key):
+        return {b"/products"}
+
+    async def delete(self, *keys):
+        return len(keys)
+
+    async def publish(self, channel, message):
+        self.published.append(message)
+
+    def pubsub(self):
+        return StubPubSub(self.published + [b'["catalogue"]'])
+
+
+class StubPubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def subscribe(self, channel):
+        pass
+
+    async def listen(self):
+        for data in self.messages:
+            yield {"type": "message", "data": data}
+        raise asyncio.CancelledError
+
+    async def aclose(self):
+        pass
+
+
+def test_purges_reach_the_other_workers_with_their_origin():
+    client = PurgeRedis()
+    store = SharedResponseStore(client)
+    received = []
+
+    async def run():
+        assert await store.purge_tags(["product:1"], origin="catalogue-snapshot") == 1
+        with pytest.raises(asyncio.CancelledError):
+            await store.listen_for_purges(lambda tags, origin: received.append((tags, origin)))
+
+    asyncio.run(run())
+
+    assert received == [(["product:1"], "catalogue-snapshot"), (["catalogue"], "")]
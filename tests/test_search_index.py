@@ -0,0 +1,109 @@
+import random
+
+from services.search_index import SearchIndex, fold_text
+
+PRODUCTS = {
+    "1": {"name": "Impact Whey Protein", "brand": "Myprotein"},
+    "2": {"name": "Impact Whey Isolate", "brand": "Myprotein"},
+    "3": {"name": "Gold Standard 100% Whey", "brand": "Optimum Nutrition"},
+    "4": {"name": "Protéine Végétale Bio", "brand": "Nutrimuscle"},
+    "5": {"name": "Créatine Monohydrate", "brand": "Prozis"},
+    "6": {"name": "Clear Whey-Isolate", "brand": None},
+}
+
+
+def reference_match(values, query, fields=("name", "brand")):
+    """The historical matches_query rule, applied to name OR brand."""
+
+    terms = [term for term in fold_text(query).split() if term]
+    return any(
+        all(term in fold_text(values.get(field)) for term in terms) for field in fields
+    )
+
+
+def build_index():
+    index = SearchIndex()
+    index.sync(PRODUCTS)
+    return index
+
+
+def test_every_term_must_match_the_same_field():
+    index = build_index()
+
+    assert index.search("impact whey") == {"1", "2"}
+    assert index.search("impact isolate") == {"2"}
+    # "whey" is in the name and "myprotein" in the brand: no single field has both.
+    assert index.search("whey myprotein") == set()
+    assert index.count("whey") == 4
+
+
+def test_terms_match_substrings_inside_tokens():
+    index = build_index()
+
+    assert index.search("tand") == {"3"}
+    assert index.search("rot") == {"1", "2", "4"}
+    assert index.search("ey-iso") == {"6"}
+    assert index.search("100%") == {"3"}
+    assert index.search("myprot") == {"1", "2"}
+
+
+def test_search_is_case_and_accent_insensitive():
+    index = build_index()
+
+    assert index.search("PROTEINE vegetale") == {"4"}
+    assert index.search("créatine") == index.search("creatine") == {"5"}
+
+
+def test_fields_restrict_the_match():
+    index = build_index()
+
+    assert index.search("nutri") == {"3", "4"}
+    assert index.search("nutri", fields=("name",)) == set()
+
+
+def test_empty_query_matches_everything():
+    index = build_index()
+
+    assert index.search("") == set(PRODUCTS)
+    assert index.search("   ") == set(PRODUCTS)
+
+
+def test_sync_only_touches_changed_documents():
+    index = build_index()
+
+    changed = dict(PRODUCTS)
+    changed["1"] = {"name": "Impact Diet Whey", "brand": "Myprotein"}
+    del changed["5"]
+    changed["7"] = {"name": "Casein Night", "brand": "Prozis"}
+
+    assert index.sync(changed) == 3
+    assert index.search("impact whey") == {"1", "2"}
+    assert index.search("diet") == {"1"}
+    assert index.search("creatine") == set()
+    assert index.search("prozis") == {"7"}
+    assert index.sync(changed) == 0
+
+
+def test_matches_the_linear_scan_on_random_queries():
+    index = build_index()
+    vocabulary = sorted(
+        {
+            fragment
+            for values in PRODUCTS.values()
+            for field in ("name", "brand")
+            for word in fold_text(values.get(field)).split()
+            for fragment in (word, word[:3], word[1:4])
+        }
+        | {"zzz", "e", "-", "whey%"}
+    )
+    rng = random.Random(7)
+
+    for _ in range(500):
+        query = " ".join(rng.sample(vocabulary, rng.randint(1, 3)))
+        for fields in (("name", "brand"), ("name",)):
+            expected = {
+                key
+                for key, values in PRODUCTS.items()
+                if reference_match(values, query, fields)
+            }
+            assert index.search(query, fields=fields) == expected, (query, fields)
@@ -0,0 +1,38 @@
+import main
+
+
+def summary(product_id, link):
+    return {"id": product_id, "product_id": product_id, "name": "Whey", "link": link}
+
+
+def test_entries_are_found_by_every_alias_oldest_owner_first():
+    main._update_serp_cache_entry("alias-a", deal={
+        "id": "deal-a", "productId": "alias-a", "link": "https://shop.test/whey",
+    })
+    main._update_serp_cache_entry("alias-b", summary=summary("alias-b", "https://shop.test/whey"))
+    try:
+        assert main.find_product_by_id("deal-a")[0] == "alias-a"
+        assert main.find_product_by_id(" https://shop.test/whey ")[0] == "alias-a"
+        assert main.find_product_by_id("alias-b")[0] == "alias-b"
+        assert main.SERP_CACHE_ALIASES["https://shop.test/whey"] == ["alias-a", "alias-b"]
+
+        main.SERP_PRODUCT_CACHE.pop("alias-a")
+        assert main.find_product_by_id("deal-a") is None
+        assert main.find_product_by_id("https://shop.test/whey")[0] == "alias-b"
+    finally:
+        main.SERP_PRODUCT_CACHE.pop("alias-a")
+        main.SERP_PRODUCT_CACHE.pop("alias-b")
+
+    assert "https://shop.test/whey" not in main.SERP_CACHE_ALIASES
+    assert "alias-b" not in main._SERP_CACHE_KEY_ALIASES
+
+
+def test_aliases_follow_updates_of_the_entry():
+    main._update_serp_cache_entry("alias-c", summary=summary("alias-c", "https://shop.test/old"))
+    try:
+        main._update_serp_cache_entry("alias-c", summary=summary("alias-c", "https://shop.test/new"))
+
+        assert main.find_product_by_id("https://shop.test/old") is None
+        assert main.find_product_by_id("https://shop.test/new")[0] == "alias-c"
+    finally:
+        main.SERP_PRODUCT_CACHE.pop("alias-c")
@@ -0,0 +1,65 @@
+from services.serp_product_cache import SerpProductCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def store(cache, key, **fields):
+    entry = cache.entry_for_update(key)
+    entry.update(fields)
+    cache.commit(key)
+    return entry
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    evicted = []
+    cache = SerpProductCache(max_entries=2, on_evict=evicted.append, clock=Clock())
+    store(cache, "a", query="whey")
+    store(cache, "b", query="whey")
+    assert cache.get("a") is not None
+    store(cache, "c", query="whey")
+
+    assert evicted == ["b"]
+    assert list(cache) == ["a", "c"]
+    assert cache.stats()["serpEvictions"] == 1
+
+
+def test_byte_budget_counts_replaced_fields_only():
+    cache = SerpProductCache(max_bytes=400, clock=Clock())
+    entry = store(cache, "a", summary={"name": "x" * 100})
+    first = cache.stats()["serpBytes"]
+    assert 100 < first < 200
+
+    entry["summary"]["name"] = "y" * 1000  # mutated in place: not re-measured
+    cache.commit("a")
+    assert cache.stats()["serpBytes"] == first
+    entry["summary"] = {"name": "z" * 150}
+    cache.commit("a")
+    assert cache.stats()["serpBytes"] == first + 50
+
+    store(cache, "b", summary={"name": "w" * 250})
+    assert list(cache) == ["b"]
+    assert cache.stats()["serpBytes"] <= 400
+
+
+def test_entries_expire_after_their_last_commit():
+    clock = Clock()
+    evicted = []
+    cache = SerpProductCache(ttl=60, on_evict=evicted.append, clock=clock)
+    store(cache, "a", query="whey")
+    store(cache, "b", query="whey")
+    clock.now += 40
+    store(cache, "b", query="whey isolate")
+    clock.now += 30
+
+    assert cache.get("a") is None
+    assert cache.get("b")["query"] == "whey isolate"
+    clock.now += 30
+    assert cache.sweep_expired() == 1
+    assert evicted == ["a", "b"]
+    assert len(cache) == 0 and cache.stats()["serpBytes"] == 0
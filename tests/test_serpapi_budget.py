@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from services.serpapi_budget import SerpApiBudget, prefetch_priority
+
+
+def acquire_many(budget, count, endpoint="google_product"):
+    async def run():
+        return [await budget.acquire(endpoint) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_quota_switches_to_cache_only():
+    budget = SerpApiBudget(rate=100, burst=10, daily_quota=3)
+
+    assert acquire_many(budget, 5) == [True, True, True, False, False]
+    assert budget.exhausted
+    assert budget.stats()["endpoints"]["google_product"] == {
+        "calls": 3,
+        "cacheHits": 0,
+        "denied": 2,
+    }
+
+
+def test_prefetch_leaves_the_reserve_to_interactive_calls():
+    budget = SerpApiBudget(rate=100, burst=10, daily_quota=10, interactive_reserve=0.5)
+
+    with prefetch_priority():
+        assert acquire_many(budget, 6).count(True) == 5
+    assert acquire_many(budget, 6).count(True) == 5
+
+
+def test_empty_bucket_refuses_instead_of_waiting_past_max_wait():
+    budget = SerpApiBudget(rate=0.1, burst=2, max_wait=0.05)
+
+    assert acquire_many(budget, 3) == [True, True, False]
+
+
+def test_ledger_merges_increments_of_every_worker(tmp_path):
+    path = tmp_path / "ledger.json"
+    first = SerpApiBudget(ledger_path=path)
+    second = SerpApiBudget(ledger_path=path)
+
+    acquire_many(first, 2)
+    first.record_cache_hit("google_product")
+    acquire_many(second, 1, endpoint="google_shopping")
+    first.flush()
+    second.flush()
+
+    stored = json.loads(path.read_text(encoding="utf-8"))
+    assert stored["dayCalls"] == 3
+    assert stored["endpoints"]["google_product"]["cacheHits"] == 1
+    assert stored["endpoints"]["google_shopping"]["calls"] == 1
+    assert SerpApiBudget(ledger_path=path).stats()["monthCalls"] == 3
+
+
+def test_refunded_calls_give_back_the_token_and_the_quota():
+    budget = SerpApiBudget(rate=0.1, burst=1, daily_quota=1, max_wait=0)
+
+    assert acquire_many(budget, 1) == [True]
+    budget.refund("google_product")
+
+    assert not budget.exhausted
+    assert acquire_many(budget, 2) == [True, False]
+    assert budget.stats()["endpoints"]["google_product"]["calls"] == 1
@@ -0,0 +1,26 @@
+import asyncio
+
+import main
+from services.local_cache import LocalCache
+from services.response_cache import track_degradation
+from services.serpapi_budget import SerpApiBudget
+
+
+def test_budget_refusals_degrade_the_response(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "local_cache", LocalCache(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(main, "serpapi_budget", SerpApiBudget(daily_quota=1, max_wait=0))
+    asyncio.run(main.serpapi_budget.acquire("google_product"))
+
+    async def run():
+        with track_degradation() as degraded:
+            shopping = await main.serpapi_shopping("whey budget")
+            product = await main.serpapi_product_offers("42")
+        return shopping, product, degraded
+
+    shopping, product, degraded = asyncio.run(run())
+
+    assert shopping == {"error": "Budget SerpAPI atteint (google_shopping)"}
+    assert product == {"error": "Budget SerpAPI atteint (google_product)"}
+    assert degraded == ["serpapi-budget", "serpapi-budget"]
+    # A refusal is not an upstream failure: nothing to back off.
+    assert main.SERPAPI_FAILURES.get("serpapi:shopping:fr:fr:whey budget") is None
@@ -0,0 +1,111 @@
+import asyncio
+
+import main
+from services.serpapi_projection import project_product_payload, project_shopping_payload
+
+SHOPPING = {
+    "search_metadata": {"id": "abc", "status": "Success"},
+    "filters": [{"type": "Price", "options": []}],
+    "shopping_results": [
+        {
+            "position": 1,
+            "title": "Impact Whey Protein 1kg",
+            "product_id": "111",
+            "product_link": "https://www.google.com/shopping/product/111",
+            "source": "Myprotein",
+            "price": "24,99 €",
+            "extracted_price": 24.99,
+            "rating": 4.6,
+            "reviews": 1200,
+            "thumbnail": "https://img.test/111.jpg",
+            "product_photos": [{"image": "https://img.test/111-1.jpg", "size": "large"}],
+            "delivery": "Livraison gratuite",
+            "serpapi_product_api": "https://serpapi.com/search.json?product_id=111",
+        },
+        {
+            "title": "Gold Standard Whey 2,27kg",
+            "link": "https://shop.test/gold",
+            "merchant": "Shop",
+            "price": "69,90 €",
+            "availability": "En stock",
+            "shipping": "4,90 €",
+            "image": "https://img.test/gold.jpg",
+        },
+    ],
+}
+
+PRODUCT = {
+    "search_metadata": {"id": "def"},
+    "product_results": {
+        "title": "Impact Whey Protein",
+        "brand": "Myprotein",
+        "product_id": "111",
+        "reviews": 1200,
+        "specs": {"weight": "1kg"},
+        "media": [
+            {"type": "image", "link": "https://img.test/111-media.jpg"},
+            {"type": "video", "link": "https://video.test/111"},
+        ],
+        "inline_images": [{"image": "https://img.test/111-inline.jpg", "title": "x"}],
+    },
+    "sellers_results": {
+        "online_sellers": [
+            {
+                "name": "Amazon",
+                "link": "https://www.google.com/url?q=https://amazon.test/whey",
+                "base_price": "22,50 €",
+                "total_price": "22,50 €",
+                "shipping": "Gratuite",
+                "rating": 4.4,
+                "reviews": 80,
+                "details_and_offers": [{"text": "Retours gratuits"}],
+            },
+            {"name": "Myprotein", "link": "https://myprotein.test", "base_price": "24,99 €"},
+        ],
+        "reviews_results": {"ratings": [5, 4]},
+    },
+}
+
+
+def deals_for(monkeypatch, shopping, product):
+    async def serpapi_shopping(q, hl="fr", gl="fr"):
+        return shopping
+
+    async def offers_bulk(product_ids, **kwargs):
+        return {"111": product}
+
+    monkeypatch.setattr(main, "serpapi_shopping", serpapi_shopping)
+    monkeypatch.setattr(main, "fetch_serpapi_product_offers_bulk", offers_bulk)
+    return asyncio.run(main.collect_serp_deals("whey projection", limit=10))
+
+
+def test_projected_payloads_build_the_same_deals(monkeypatch):
+    raw = deals_for(monkeypatch, SHOPPING, PRODUCT)
+    projected = deals_for(
+        monkeypatch, project_shopping_payload(SHOPPING), project_product_payload(PRODUCT)
+    )
+
+    assert len(raw) == 2
+    assert projected == raw
+    assert raw[0]["link"] == "https://amazon.test/whey"
+
+
+def test_projection_drops_unread_fields_and_is_idempotent():
+    shopping = project_shopping_payload(SHOPPING)
+    product = project_product_payload(PRODUCT)
+
+    assert list(shopping) == ["shopping_results"]
+    assert "delivery" not in shopping["shopping_results"][0]
+    assert "specs" not in product["product_results"]
+    assert [item["type"] for item in product["product_results"]["media"]] == ["image"]
+    assert "details_and_offers" not in product["sellers_results"]["online_sellers"][0]
+    assert project_shopping_payload(shopping) == shopping
+    assert project_product_payload(product) == product
+
+
+def test_errors_and_empty_lookups_are_kept_distinguishable():
+    error = {"error": "Quota atteint", "search_metadata": {}}
+
+    assert project_shopping_payload(error) is error
+    assert project_product_payload(error) is error
+    assert project_product_payload({}) == {"sellers_results": {"online_sellers": []}}
@@ -0,0 +1,61 @@
+import asyncio
+
+import main
+from services.catalogue_snapshot import CatalogueSnapshot
+from services.similarity import SimilarityIndex
+
+PRODUCTS = [
+    {"id": 1, "name": "Impact Whey Vanilla", "brand": "MyProtein", "category": "whey"},
+    {"id": 2, "name": "Impact Whey Chocolate", "brand": "MyProtein", "category": "whey"},
+    {"id": 3, "name": "Gold Standard Whey", "brand": "Optimum", "category": "whey"},
+    {"id": 4, "name": "Creatine Monohydrate", "brand": "Optimum", "category": "creatine"},
+]
+
+
+def install_upstreams(monkeypatch):
+    async def fetch_products(limit=None):
+        return [dict(product) for product in PRODUCTS]
+
+    async def fetch_with_offers(product_ids):
+        return {
+            product_id: {
+                **PRODUCTS[product_id - 1],
+                "offers": [
+                    {"id": offer, "price": 20.0 + product_id + offer, "in_stock": True}
+                    for offer in range(8)
+                ],
+            }
+            for product_id in product_ids
+        }
+
+    async def collect_serp_deals(query, *, marque=None, categorie=None, limit=10):
+        return []
+
+    monkeypatch.setattr(main, "fetch_scraper_products", fetch_products)
+    monkeypatch.setattr(main, "fetch_scraper_products_with_offers", fetch_with_offers)
+    monkeypatch.setattr(main, "collect_serp_deals", collect_serp_deals)
+
+
+def install_snapshot(monkeypatch):
+    # Snapshot summaries carry the full offer list (10 offers per product).
+    summaries = asyncio.run(main._build_catalogue_snapshot())
+    snapshot = CatalogueSnapshot(
+        version=1, fingerprint="test", built_at=0.0, products=tuple(summaries)
+    )
+    monkeypatch.setattr(main._catalogue_snapshot, "_current", snapshot)
+    monkeypatch.setattr(
+        main, "_catalogue_similarity", SimilarityIndex(summaries, top_k=12, version=1)
+    )
+
+
+def test_precomputed_and_on_demand_neighbours_return_the_same_payloads(monkeypatch):
+    install_upstreams(monkeypatch)
+    on_demand = asyncio.run(main._resolve_similar_products(1, 3))
+
+    install_snapshot(monkeypatch)
+    assert asyncio.run(main._catalogue_similar_products(1, 3, PRODUCTS)) is not None
+    precomputed = asyncio.run(main._resolve_similar_products(1, 3))
+
+    assert [item["id"] for item in on_demand] == [2, 3]
+    assert precomputed == on_demand
+    assert {item["offersCount"] for item in precomputed} == {main.RELATED_PRODUCT_OFFER_LIMIT}
@@ -0,0 +1,69 @@
+import random
+
+from services.similarity import SimilarityIndex, extract_features, similarity_score
+
+PRODUCTS = [
+    {"id": 1, "name": "Impact Whey Protein", "brand": "Myprotein", "category": "whey",
+     "flavour": "Chocolate", "protein_per_serving_g": 21},
+    {"id": 2, "name": "Impact Whey Isolate", "brand": "Myprotein", "category": "whey",
+     "flavour": "Vanilla", "protein_per_serving_g": "22,5"},
+    {"id": 3, "name": "Gold Standard 100% Whey", "brand": "Optimum Nutrition",
+     "category": "whey", "flavour": "Double Chocolate", "protein_per_serving_g": 24},
+    {"id": 4, "name": "Créatine Monohydrate", "brand": "Prozis", "category": "creatine"},
+    {"id": 5, "name": "Bandes élastiques", "brand": None, "category": None},
+]
+
+
+def score(base, candidate):
+    return similarity_score(extract_features(base), extract_features(candidate))
+
+
+def test_score_rules():
+    # Same brand (3) + category (1.5) + 2 of 3 name keywords (4/3) + protein (0.5).
+    assert score(PRODUCTS[0], PRODUCTS[1]) == 3.0 + 1.5 + 2.0 * 2 / 3 + 0.5
+    # Category (1.5) + "whey" (2/3) + shared flavour keyword (1.0).
+    assert score(PRODUCTS[0], PRODUCTS[2]) == 1.5 + 2.0 / 3 + 1.0
+    assert score(PRODUCTS[0], PRODUCTS[4]) == 0.0
+
+
+def test_name_overlap_is_relative_to_the_base_product():
+    assert score(PRODUCTS[2], PRODUCTS[0]) != score(PRODUCTS[0], PRODUCTS[2])
+
+
+def test_neighbours_are_ranked_and_exclude_unrelated_products():
+    index = SimilarityIndex(PRODUCTS)
+
+    assert [key for _, key in index.neighbours(1)] == ["2", "3"]
+    assert index.neighbours(5) == []
+    assert index.neighbours(42) == []
+    assert "4" in index and 42 not in index
+
+
+def test_index_matches_pairwise_ranking():
+    rng = random.Random(7)
+    words = "whey isolate impact gold clear vegan chocolate vanilla protein".split()
+    products = [
+        {
+            "id": identifier,
+            "name": " ".join(rng.sample(words, rng.randint(1, 4))),
+            "brand": rng.choice(["Myprotein", "Bulk", "Optimum", None]),
+            "category": rng.choice(["whey", "isolate", None]),
+            "flavour": rng.choice(["Chocolate", "Vanilla", None]),
+            "protein_per_serving_g": rng.choice([20, 22, 25, None]),
+        }
+        for identifier in range(60)
+    ]
+    index = SimilarityIndex(products, top_k=5)
+
+    for base in products:
+        ranked = sorted(
+            (
+                (score(base, other), other["id"])
+                for other in products
+                if other is not base and score(base, other) > 0
+            ),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        expected = [str(identifier) for _, identifier in ranked[:5]]
+        assert [key for _, key in index.neighbours(base["id"])] == expected